@@ -2,17 +2,29 @@
 # Moviefy_app.py
 
 import os
+import time
 import streamlit as st
 from dotenv import load_dotenv
-from summarise_chapters.chapter_summary import ChaptersSummaryAI
-from generate_video.generate_video_from_text import generate_and_download_video
-from merge_videos.merge_vid import merge_videos
+from job_queue.job_queue import JobQueue, DONE, FAILED
+from job_queue.worker import start_workers
+from pipeline import OUTPUT_ROOT
+from pipeline_state import upload_digest
+
+JOB_DB_PATH = os.path.join(OUTPUT_ROOT, "jobs.sqlite3")
+
+
+@st.cache_resource
+def background_workers():
+    """Starts the render worker processes once per Streamlit server, shared by every session."""
+    os.makedirs(OUTPUT_ROOT, exist_ok=True)
+    return start_workers(JOB_DB_PATH, processes=int(os.getenv("MOVIEFY_WORKERS", "2")))
+
 
 def main():
-    # Load API keys from environment variables
+    # Load API keys from environment variables (the workers read them from the same .env)
     load_dotenv()
-    openai_key = os.getenv("OPENAI_API_KEY")
-    stability_key = os.getenv("STABILITY_API_KEY")
+    background_workers()
+    queue = JobQueue(JOB_DB_PATH)
 
     # Streamlit App Interface
     st.title("Moviefy: Turn Your Book into a Visual Story")
@@ -22,72 +34,89 @@ def main():
 
     if uploaded_file is not None:
 
+        # Uploads are identified by their content hash, computed once per upload (see pipeline_state.upload_digest)
+        book_digest = upload_digest(uploaded_file)
+
+        # Video parameters are read up front; changing them submits a new render job
+        cfg_scale = st.slider("CFG Scale (1 to 10)", 1, 10, 5)
+        motion_bucket_id = st.slider("Motion Bucket ID (1 to 255)", 1, 255, 50)
+        max_in_flight = st.slider("Chapters rendered in parallel", 1, 8, 4)
+        draft = st.checkbox("Draft trailer (chapters summarized locally, without OpenAI)")
+        # Without a profile the chapter clips are joined as they are; a profile re-encodes the trailer, always after
+        # a quick low-resolution preview of it
+        trailer_profile = st.selectbox("Trailer encoding", [None, "standard", "high"],
+                                       format_func=lambda name: name or "As rendered (fastest)",
+                                       help="A standard or high encode takes a while: a quick low-resolution "
+                                            "preview of the whole trailer is shown first.")
+
         # Step 0: Prepare the directories
         INPUT_BOOK_FOLDER = "input_book"
         os.makedirs(INPUT_BOOK_FOLDER, exist_ok=True)
 
-        book_name = uploaded_file.name
-        book_path = os.path.join(INPUT_BOOK_FOLDER, book_name)
+        # Uploads are stored under their content hash: two books with the same file name never overwrite each
+        # other, and the same book uploaded under another name maps to the same file, job and artifacts
+        book_path = os.path.join(INPUT_BOOK_FOLDER, f"{book_digest}.epub")
 
-        # Save the uploaded file to the "input_book" folder
-        with open(book_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        # Save the uploaded file to the "input_book" folder, unless this content is already there
+        if not os.path.exists(book_path):
+            tmp_path = f"{book_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(uploaded_file.getbuffer())
+            os.replace(tmp_path, book_path)
         st.success("EPUB file uploaded and saved successfully!")
 
-        # Images and Videos saved in the directory of a particular book
-        OUTPUT_IMAGES_FOLDER = f"output_image_video/{book_name}/Images/"
-        OUTPUT_VIDEOS_FOLDER = f"output_image_video/{book_name}/Videos/"
-        OUTPUT_MERGED_VIDEO_FOLDER = f"output_image_video/{book_name}/Merged_videos/"
-
-        os.makedirs(OUTPUT_IMAGES_FOLDER, exist_ok=True)
-        os.makedirs(OUTPUT_VIDEOS_FOLDER, exist_ok=True)
-        os.makedirs(OUTPUT_MERGED_VIDEO_FOLDER, exist_ok=True)
-
-        # Step 1: Extract chapters and summarize
-        st.write("**Extracting and summarizing chapters...**")
-        summarizer = ChaptersSummaryAI(book_file_path=book_path, open_ai_key=openai_key)
-        chapter_summaries = summarizer.summarize_chapters()
-        st.write("Summaries generated for each chapter!")
-
-        # Step 2: Generate images and videos from summaries
-        st.write("**Generating images and videos from summaries...**")
-        cfg_scale = st.slider("CFG Scale (1 to 10)", 1, 10, 5)
-        motion_bucket_id = st.slider("Motion Bucket ID (1 to 255)", 1, 255, 50)
-        book_name = os.path.splitext(uploaded_file.name)[0]
-
-        for index, summary in enumerate(chapter_summaries):
-            chapter_name = f"{book_name}_chapter_{index + 1}"
-            try:
-                # Generate and download video for each summary
-                generate_and_download_video(
-                    stability_api_key=stability_key,
-                    text_prompts=summary,
-                    book_name=chapter_name,
-                    output_path_images=OUTPUT_IMAGES_FOLDER,
-                    output_path_video=OUTPUT_VIDEOS_FOLDER,
-                    cfg_scale=cfg_scale,
-                    motion_bucket_id=motion_bucket_id
-                )
-                st.write(f"Generated video for {chapter_name}")
-            except Exception as e:
-                st.error(f"Error generating video for {chapter_name}: {e}")
-
-        # Step 3: Merge videos into a single video
-        st.write("**Merging all chapter videos into a final video...**")
-        output_merged_video_path = os.path.join(OUTPUT_MERGED_VIDEO_FOLDER, f"{book_name}_final_video.mp4")
-
-        merge_videos(
-            input_dir=OUTPUT_VIDEOS_FOLDER,
-            book_name=book_name,
-            output_path=output_merged_video_path
-        )
-
-        # Display the final video if merging was successful
-        if os.path.exists(output_merged_video_path):
-            st.write("**Final video created!**")
-            st.video(output_merged_video_path)
+        # Steps 1-3 (summarize, render, merge) run in a background worker; this session only polls the job.
+        # Identical jobs are deduplicated by the queue, so a rerun with the same settings attaches to the same job,
+        # even once it has failed; rendering it again takes the Retry button.
+        params = {
+            "book_path": book_path,
+            "book_digest": book_digest,
+            "cfg_scale": cfg_scale,
+            "motion_bucket_id": motion_bucket_id,
+            "max_in_flight": max_in_flight,
+            "summarizer": "extractive" if draft else "openai",
+        }
+        if trailer_profile:
+            params["trailer_profile"] = trailer_profile
+        job_id = queue.submit(params)
+        job = queue.get(job_id)
+
+        st.write(f"**Job {job_id}: {job['status']}**")
+        st.progress(job["progress"])
+        if job["message"]:
+            st.write(job["message"])
+
+        if job["status"] == FAILED:
+            st.error(f"Failed to create the final video: {job['error']}")
+        elif job["status"] == DONE:
+            result = job["result"]
+            if result.get("skipped_items"):
+                with st.expander(f"{len(result['skipped_items'])} spine items skipped (not story chapters)"):
+                    for item in result["skipped_items"]:
+                        st.write(f"{item['path']} ({item['heading'] or 'untitled'}): {item['reason']}")
+            if result["failed_chapters"]:
+                st.warning(f"No video for: {', '.join(result['failed_chapters'])}")
+            # Display the final video if merging was successful
+            if result["final_video"] and os.path.exists(result["final_video"]):
+                st.write("**Final video created!**")
+                st.video(result["final_video"])
+            else:
+                st.error("Failed to create the final video.")
         else:
-            st.error("Failed to create the final video.")
+            # Chapters already rendered can be watched while the rest of the book renders
+            preview = job["preview"]
+            if preview and os.path.exists(preview["video"]):
+                st.write(f"**Preview: first {preview['chapters']} chapters** (replaced by the final trailer when it is "
+                         f"done)")
+                st.video(preview["video"])
+            time.sleep(2)
+            st.rerun()
+
+        # A finished job is never rendered again on its own, so that a book failing for good does not keep
+        # spending API credits on every rerun
+        if queue.needs_retry(job) and st.button("Retry"):
+            queue.submit(params, force=True)
+            st.rerun()
 
 # Run the app
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+"""
+Compares the original BeautifulSoup/html.parser chapter extraction with the streaming lxml extractor.
+
+Run from Program/code_base:
+
+    python -m benchmarks.bench_epub_extraction --chapters 300 --paragraphs 200
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from summarise_chapters.chapter_summary import iter_story_content
+from benchmarks.synthetic_epub import write_synthetic_epub
+
+
+def _measure(label: str, consume):
+    tracemalloc.start()
+    start = time.perf_counter()
+    texts = consume()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<34} {elapsed:8.2f} s   peak {peak / 1024 ** 2:8.1f} MiB")
+    return texts, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=300)
+    parser.add_argument("--paragraphs", type=int, default=200, help="Paragraphs per chapter")
+    parser.add_argument("--words", type=int, default=60, help="Words per paragraph")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        epub_path = write_synthetic_epub(os.path.join(tmp, "synthetic.epub"), chapters=args.chapters,
+                                         paragraphs_per_chapter=args.paragraphs, words_per_paragraph=args.words)
+        print(f"Synthetic EPUB: {args.chapters} chapters, {os.path.getsize(epub_path) / 1024 ** 2:.1f} MiB compressed")
+
+        # The original implementation: every chapter parsed with html.parser and collected in a list
+        baseline, baseline_time = _measure(
+            "html.parser, list (original)", lambda: list(iter_story_content(epub_path, parser="html.parser")))
+
+        # Streaming consumer: only the chapter being processed is alive at any time
+        def stream():
+            lengths = []
+            for text in iter_story_content(epub_path, parser="lxml"):
+                lengths.append(len(text))
+            return lengths
+
+        _, stream_time = _measure("lxml, generator", stream)
+        fast, _ = _measure("lxml, list", lambda: list(iter_story_content(epub_path, parser="lxml")))
+
+        mismatches = sum(a != b for a, b in zip(baseline, fast)) + abs(len(baseline) - len(fast))
+        print(f"Speed-up (streaming): {baseline_time / stream_time:.1f}x, "
+              f"text mismatches: {mismatches} of {len(baseline)} chapters")
+
+
+if __name__ == "__main__":
+    main()
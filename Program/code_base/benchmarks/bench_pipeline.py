@@ -0,0 +1,67 @@
+"""
+End-to-end throughput benchmark: runs a synthetic EPUB through the Moviefy pipeline (the one the app's workers
+run) against the local mock API server, without spending credits or depending on the network.
+
+Run from Program/code_base:
+
+    python -m benchmarks.bench_pipeline --chapters 20 --latency 0.3 --video-seconds 5 --max-in-flight 8
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.mock_api_server import MockAPIServer
+from benchmarks.synthetic_epub import write_synthetic_epub
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chapters", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=60, help="Paragraphs per chapter")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mock response latency in seconds")
+    parser.add_argument("--video-seconds", type=float, default=5.0, help="Mock image-to-video processing time")
+    parser.add_argument("--error-429-rate", type=float, default=0.0)
+    parser.add_argument("--error-5xx-rate", type=float, default=0.0)
+    parser.add_argument("--max-in-flight", type=int, default=8, help="Chapters rendered concurrently")
+    parser.add_argument("--summarizer", choices=("openai", "extractive"), default="openai",
+                        help="extractive summarizes locally, without chat completion requests")
+    parser.add_argument("--metrics-dir", help="Keep the run's traces.jsonl and Prometheus file in this folder")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, MockAPIServer(
+            latency=args.latency, video_seconds=args.video_seconds,
+            error_429_rate=args.error_429_rate, error_5xx_rate=args.error_5xx_rate) as server:
+        # Both clients pick their endpoint up from the environment
+        os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+        os.environ["STABILITY_API_URL"] = server.url
+        from pipeline import run_book_pipeline
+
+        book_path = write_synthetic_epub(os.path.join(tmp, "synthetic_book.epub"), chapters=args.chapters,
+                                         paragraphs_per_chapter=args.paragraphs)
+
+        start = time.perf_counter()
+        result = run_book_pipeline(book_path, openai_key="mock", stability_key="mock", cfg_scale=5,
+                                   motion_bucket_id=50, max_in_flight=args.max_in_flight,
+                                   output_root=os.path.join(tmp, "output"), summarizer=args.summarizer)
+        wall_time = time.perf_counter() - start
+
+        total_requests = server.total_requests()
+        print(f"\nChapters:        {args.chapters} ({len(result['failed_chapters'])} failed)")
+        print(f"Wall time:       {wall_time:.2f} s")
+        for stage, seconds in result["timings"].items():
+            print(f"  {stage:<14} {seconds:.2f} s")
+        print(f"Requests:        {total_requests} ({total_requests / wall_time:.1f} req/s)")
+        for (endpoint, status), count in sorted(server.requests.items()):
+            print(f"  {endpoint:<22} {status}  {count}")
+        print(f"Final video:     {'ok' if result['final_video'] else 'missing'}")
+
+        metrics_folder = os.path.join(tmp, "output", "metrics")
+        if args.metrics_dir:
+            shutil.copytree(metrics_folder, args.metrics_dir, dirs_exist_ok=True)
+            print(f"Metrics:         {args.metrics_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+Local stand-in for the OpenAI and Stability AI endpoints used by Moviefy.
+
+Implements POST /v1/chat/completions, POST /v2beta/stable-image/generate/core, POST /v2beta/image-to-video and
+GET /v2beta/image-to-video/result/{id} with configurable latency, image-to-video processing time (answered with
+202 until done) and injected 429/5xx errors. Images and videos are generated dummy PNG/MP4 payloads; batched
+chapter summary requests (response_format json_object) are answered with one JSON summary per chapter.
+
+Run on its own from Program/code_base, then point the app at it:
+
+    python -m benchmarks.mock_api_server --port 8765 --latency 0.2 --video-seconds 10
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 STABILITY_API_URL=http://127.0.0.1:8765 streamlit run Moviefy_app.py
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def dummy_png(width: int, height: int, seed: str) -> bytes:
+    """
+    A solid-colour PNG whose colour is derived from `seed`, built without any imaging library.
+    """
+    red, green, blue = hashlib.sha256(seed.encode()).digest()[:3]
+    row = b"\x00" + bytes((red, green, blue)) * width
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height, 9))
+            + chunk(b"IEND", b""))
+
+
+def dummy_mp4(width: int = 768, height: int = 768, seconds: float = 1.0, fps: int = 24) -> bytes:
+    """
+    A short H.264 test clip encoded with the ffmpeg binary bundled with moviepy. Falls back to opaque bytes (enough
+    for throughput measurements, not for merging) when ffmpeg is unavailable.
+    """
+    try:
+        from moviepy.config import get_setting
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as output:
+            subprocess.run(
+                [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "lavfi",
+                 "-i", f"testsrc=size={width}x{height}:rate={fps}", "-t", str(seconds),
+                 "-c:v", "libx264", "-pix_fmt", "yuv420p", "-f", "mp4", output.name],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            with open(output.name, "rb") as file:
+                return file.read()
+    except Exception:
+        return b"\x00\x00\x00\x18ftypmp42" + bytes(1024)
+
+
+class MockAPIServer:
+    """
+    Threaded HTTP server answering like the OpenAI and Stability AI APIs.
+
+    Attributes:
+        latency (float): Seconds added to every response.
+        video_seconds (float): Seconds an image-to-video generation stays "in progress" (202).
+        error_429_rate (float): Fraction of requests answered with 429 and a Retry-After header.
+        error_5xx_rate (float): Fraction of requests answered with 503.
+        image_size (int): Width and height of the generated PNGs.
+        requests (Counter): Requests served, by endpoint and status code.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, video_seconds: float = 2.0,
+                 error_429_rate: float = 0.0, error_5xx_rate: float = 0.0, image_size: int = 1024, seed: int = 0):
+        self.latency = latency
+        self.video_seconds = video_seconds
+        self.error_429_rate = error_429_rate
+        self.error_5xx_rate = error_5xx_rate
+        self.image_size = image_size
+        self.requests = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._videos = {}  # generation ID -> time it becomes ready
+        self._mp4 = dummy_mp4()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockAPIServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="MockAPIServer", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def _injected_error(self):
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.error_429_rate:
+            return 429
+        if draw < self.error_429_rate + self.error_5xx_rate:
+            return 503
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, endpoint: str, status: int, body: bytes = b"", content_type: str = "application/json",
+                      headers: dict = None):
+                with server._lock:
+                    server.requests[(endpoint, status)] += 1
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _json(self, endpoint: str, status: int, payload: dict, headers: dict = None):
+                self._send(endpoint, status, json.dumps(payload).encode(), headers=headers)
+
+            def _begin(self, endpoint: str) -> bool:
+                """Applies latency and error injection; returns False if an error was sent."""
+                time.sleep(server.latency)
+                error = server._injected_error()
+                if error == 429:
+                    self._json(endpoint, 429, {"error": {"message": "Rate limit reached (mock)"}},
+                               headers={"Retry-After": "1"})
+                    return False
+                if error == 503:
+                    self._json(endpoint, 503, {"error": {"message": "Service unavailable (mock)"}})
+                    return False
+                return True
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = self.path.split("?")[0]
+
+                if path.endswith("/chat/completions"):
+                    if not self._begin("chat.completions"):
+                        return
+                    request = json.loads(body)
+                    prompt = request["messages"][-1]["content"]
+                    if request.get("response_format", {}).get("type") == "json_object":
+                        # Batched request: one summary per "### Chapter n" section
+                        sections = re.split(r"^### Chapter (\d+)$", prompt, flags=re.MULTILINE)[1:]
+                        content = json.dumps({"summaries": [
+                            {"chapter": int(number), "summary": "A moonlit barn where " + " ".join(
+                                re.findall(r"[A-Za-z]+", text)[:20]).lower()}
+                            for number, text in zip(sections[::2], sections[1::2])
+                        ]})
+                    else:
+                        words = re.findall(r"[A-Za-z]+", prompt)
+                        content = "A moonlit barn where " + " ".join(words[-30:-10]).lower()
+                    prompt_tokens = len(prompt) // 4
+                    self._json("chat.completions", 200, {
+                        "id": f"chatcmpl-{uuid.uuid4().hex}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "mock"),
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                                  "total_tokens": prompt_tokens + len(content) // 4},
+                    })
+
+                elif path == "/v2beta/stable-image/generate/core":
+                    if not self._begin("generate.core"):
+                        return
+                    png = dummy_png(server.image_size, server.image_size, body.decode(errors="replace"))
+                    self._send("generate.core", 200, png, content_type="image/png")
+
+                elif path == "/v2beta/image-to-video":
+                    if not self._begin("image-to-video"):
+                        return
+                    generation_id = uuid.uuid4().hex
+                    with server._lock:
+                        server._videos[generation_id] = time.monotonic() + server.video_seconds
+                    self._json("image-to-video", 200, {"id": generation_id})
+
+                else:
+                    self._json("unknown", 404, {"errors": [f"No mock for POST {path}"]})
+
+            def do_GET(self):
+                match = re.fullmatch(r"/v2beta/image-to-video/result/(\w+)", self.path.split("?")[0])
+                if match is None:
+                    self._json("unknown", 404, {"errors": [f"No mock for GET {self.path}"]})
+                    return
+                if not self._begin("image-to-video.result"):
+                    return
+                with server._lock:
+                    ready_at = server._videos.get(match.group(1))
+                if ready_at is None:
+                    self._json("image-to-video.result", 404, {"errors": ["generation not found"]})
+                elif time.monotonic() < ready_at:
+                    self._json("image-to-video.result", 202, {"id": match.group(1), "status": "in-progress"})
+                else:
+                    self._send("image-to-video.result", 200, server._mp4, content_type="video/mp4")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--video-seconds", type=float, default=2.0, help="Seconds of 202 before a video is ready")
+    parser.add_argument("--error-429-rate", type=float, default=0.0)
+    parser.add_argument("--error-5xx-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockAPIServer(args.host, args.port, latency=args.latency, video_seconds=args.video_seconds,
+                           error_429_rate=args.error_429_rate, error_5xx_rate=args.error_5xx_rate).start()
+    print(f"Mock API listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
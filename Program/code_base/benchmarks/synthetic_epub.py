@@ -0,0 +1,92 @@
+import random
+import zipfile
+
+_WORDS = (
+    "the farm animals gathered in the great barn under a pale moon while old major spoke of rebellion and the "
+    "windmill rose slowly above the fields snowball napoleon boxer clover squealer worked through the harsh winter"
+).split()
+
+_CONTAINER = """<?xml version="1.0" encoding="UTF-8"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>"""
+
+_CHAPTER = """<?xml version="1.0" encoding="utf-8"?>
+<!DOCTYPE html>
+<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">
+<head><title>{title}</title><link rel="stylesheet" type="text/css" href="style.css"/></head>
+<body epub:type="bodymatter">
+<section epub:type="chapter">
+<h1>{title}</h1>
+{paragraphs}
+</section>
+</body>
+</html>"""
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    text = " ".join(rng.choice(_WORDS) for _ in range(words))
+    return f"<p class=\"text\">{text.capitalize()}. <em>{rng.choice(_WORDS)}</em> &#8220;{rng.choice(_WORDS)}&#8221;</p>"
+
+
+def write_synthetic_epub(path: str, chapters: int = 30, paragraphs_per_chapter: int = 200, words_per_paragraph: int = 60,
+                         seed: int = 0, front_matter: bool = False) -> str:
+    """
+    Writes a minimal but valid EPUB 3 with generated chapter text.
+
+    :param path: Output .epub path
+    :param chapters: Number of story chapters
+    :param paragraphs_per_chapter: Paragraphs per chapter; 200 x 60 words is roughly a 60 KB chapter
+    :param words_per_paragraph: Words per paragraph
+    :param seed: Seed of the text generator, so that runs are reproducible
+    :param front_matter: Also add a cover, copyright page and table of contents before the first chapter
+    :return: `path`
+    """
+    rng = random.Random(seed)
+    documents = []
+    if front_matter:
+        documents.append(("cover", "Cover", "<p><img src=\"cover.jpg\" alt=\"cover\"/></p>"))
+        documents.append(("copyright", "Copyright", "<p>Copyright &#169; 2021. All rights reserved.</p>"
+                                                    "<p>ISBN 978-0-00-000000-0</p>"))
+        documents.append(("toc", "Contents", "".join(f"<p>Chapter {n + 1}</p>" for n in range(chapters))))
+    for n in range(chapters):
+        paragraphs = "\n".join(_paragraph(rng, words_per_paragraph) for _ in range(paragraphs_per_chapter))
+        documents.append((f"chapter_{n + 1}", f"Chapter {n + 1}", paragraphs))
+
+    manifest = "\n".join(
+        f'    <item id="{item_id}" href="{item_id}.xhtml" media-type="application/xhtml+xml"/>'
+        for item_id, _, _ in documents
+    )
+    spine = "\n".join(f'    <itemref idref="{item_id}"/>' for item_id, _, _ in documents)
+    guide = ""
+    if front_matter:
+        guide = ('  <guide>\n'
+                 '    <reference type="cover" title="Cover" href="cover.xhtml"/>\n'
+                 '    <reference type="copyright-page" title="Copyright" href="copyright.xhtml"/>\n'
+                 '    <reference type="toc" title="Contents" href="toc.xhtml"/>\n'
+                 '  </guide>\n')
+    opf = f"""<?xml version="1.0" encoding="utf-8"?>
+<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">
+  <metadata xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:identifier id="id">synthetic-{seed}</dc:identifier>
+    <dc:title>Synthetic Book</dc:title>
+    <dc:language>en</dc:language>
+  </metadata>
+  <manifest>
+{manifest}
+  </manifest>
+  <spine>
+{spine}
+  </spine>
+{guide}</package>"""
+
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        zf.writestr("META-INF/container.xml", _CONTAINER, compress_type=zipfile.ZIP_DEFLATED)
+        zf.writestr("OEBPS/content.opf", opf, compress_type=zipfile.ZIP_DEFLATED)
+        for item_id, title, body in documents:
+            zf.writestr(f"OEBPS/{item_id}.xhtml", _CHAPTER.format(title=title, paragraphs=body),
+                        compress_type=zipfile.ZIP_DEFLATED)
+    return path
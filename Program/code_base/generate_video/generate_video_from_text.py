@@ -1,35 +1,68 @@
-import requests
 from PIL import Image
-import time
+import io
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
+from instrumentation import metrics
+from .generation_cache import GenerationCache
+from .stability_client import StabilityClient
+from .video_poller import VideoPoller
 
 #%%
-def generate_image_from_text(api_key, text_prompts, output_path_images, image_name):
-    url = f"https://api.stability.ai/v2beta/stable-image/generate/core"
+GENERATE_CORE_PATH = "/v2beta/stable-image/generate/core"
+
+# Sizes accepted by image-to-video, by the matching aspect ratio of the text-to-image endpoint
+VIDEO_SIZES = {"1:1": (768, 768), "16:9": (1024, 576), "9:16": (576, 1024)}
+
+
+def generate_image_bytes(api_key, text_prompts, cache: GenerationCache = None, client: StabilityClient = None,
+                         aspect_ratio="1:1") -> bytes:
+    """
+    Generate a PNG image from text and return it in memory.
+
+    :param aspect_ratio: Requested aspect ratio. Asking for the ratio of the video size means the image only needs
+    a proportional downscale, or none at all when it already comes back at that size.
+    :return: PNG bytes
+    """
+    client = client or StabilityClient.for_key(api_key)
 
     headers = {
-        "authorization": f"Bearer {api_key}",
         "accept": "image/*"  # "application/json"
     }
 
     body = {
         "prompt": text_prompts,
         "style_preset": "cinematic",
+        "aspect_ratio": aspect_ratio,
         "output_format": "png",
     }
 
-    response = requests.post(url, headers=headers, files={"none": ''}, data=body, )
+    cache_key = GenerationCache.make_key(client.url(GENERATE_CORE_PATH), body)
+    if cache is not None:
+        cached = cache.read(cache_key, "png")
+        if cached is not None:
+            return cached
+
+    response = client.post(GENERATE_CORE_PATH, headers=headers, files={"none": ''}, data=body, )
 
+    if response.status_code != 200:
+        raise Exception(str(response.json()))
+
+    if cache is not None:
+        cache.write(cache_key, "png", response.content)
+
+    return response.content
+
+
+def generate_image_from_text(api_key, text_prompts, output_path_images, image_name, cache: GenerationCache = None,
+                             client: StabilityClient = None):
     # image_path = os.path.join(output_directory, f'{book_name}.png')
 
     file_name_path = f"{output_path_images}{image_name}.png"
 
-    if response.status_code == 200:
-        with open(file_name_path, 'wb') as file:
-            file.write(response.content)
-    else:
-        raise Exception(str(response.json()))
+    image_bytes = generate_image_bytes(api_key, text_prompts, cache=cache, client=client)
+    with open(file_name_path, 'wb') as file:
+        file.write(image_bytes)
 
     return file_name_path
 
@@ -46,74 +79,108 @@ def resize_image(input_path, width=768, height=768):
     img_resized.save(input_path)
 
 
-#%%
-def get_generation_id(api_key, image_path, cfg_scale, motion_bucket_id):
+def resize_image_bytes(image_bytes: bytes, width=768, height=768) -> bytes:
     """
-    cfg_scale [1, 10]: How strongly the video sticks to the original image. Use lower values to allow the model more freedom to make changes and higher values to correct motion distortions.
+    Resize an in-memory image to PNG bytes. Returns the input unchanged when it already has the target size.
+    """
+    img = Image.open(io.BytesIO(image_bytes))  # Only reads the header until the pixels are needed
+    if img.size == (width, height) and img.format == "PNG":
+        return image_bytes
 
-    motion_bucket_id [1, 255]: Lower values generally result in less motion in the output video, while higher values generally result in more motion.
+    buffer = io.BytesIO()
+    img.resize((width, height)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# Image files are written in the background; the render does not wait for the disk
+_image_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-writer")
+
+
+def save_image_async(image_bytes: bytes, path: str) -> Future:
     """
+    Write image bytes to `path` on a background thread.
 
-    url = f"https://api.stability.ai/v2beta/image-to-video"
+    :return: Future resolved with `path` once the file is written
+    """
+    def write():
+        with open(path, "wb") as file:
+            file.write(image_bytes)
+        return path
+
+    return _image_writer.submit(write)
 
-    headers = {"authorization": f"Bearer {api_key}"}
 
-    file = {"image": open(image_path, "rb")}
+#%%
+IMAGE_TO_VIDEO_PATH = "/v2beta/image-to-video"
+
 
-    data = {
+def image_to_video_params(cfg_scale, motion_bucket_id):
+    return {
         "seed": 0,
         "cfg_scale": cfg_scale,
         "motion_bucket_id": motion_bucket_id
     }
 
-    response = requests.post(url, headers=headers, files=file, data=data, )
+
+def submit_image_to_video(api_key, image_bytes: bytes, cfg_scale, motion_bucket_id, client: StabilityClient = None):
+    """
+    Upload an in-memory image to image-to-video.
+
+    :return: Generation ID to poll
+    """
+    client = client or StabilityClient.for_key(api_key)
+
+    data = image_to_video_params(cfg_scale, motion_bucket_id)
+
+    response = client.post(IMAGE_TO_VIDEO_PATH, files={"image": ("image.png", image_bytes, "image/png")}, data=data, )
+
+    if response.status_code != 200:
+        raise Exception(str(response.json()))
 
     return response.json().get('id')
 
 
+def get_generation_id(api_key, image_path, cfg_scale, motion_bucket_id, client: StabilityClient = None):
+    """
+    cfg_scale [1, 10]: How strongly the video sticks to the original image. Use lower values to allow the model more freedom to make changes and higher values to correct motion distortions.
+
+    motion_bucket_id [1, 255]: Lower values generally result in less motion in the output video, while higher values generally result in more motion.
+    """
+
+    with open(image_path, "rb") as image_file:
+        return submit_image_to_video(api_key, image_file.read(), cfg_scale, motion_bucket_id, client=client)
+
+
 #%%
 
-def download_generated_video(api_key, generation_id, output_path_video, video_name, retries=6, wait_time=10):
+def download_generated_video(api_key, generation_id, output_path_video, video_name, poller: VideoPoller = None,
+                             timeout=600, client: StabilityClient = None):
 
     """
+    Wait for an image-to-video generation and stream the finished MP4 to "{output_path_video}{video_name}.mp4".
+
     :param api_key:
     :param generation_id:
     :param output_path_video:
     :param video_name:
-    :param retries:
-    :param wait_time: Should be around 30 seconds
-    :return:
+    :param poller: Shared poller tracking many generations from one thread. Without one, a poller is started
+    for this generation only.
+    :param timeout: Seconds to wait for the generation before giving up
+    :param client: HTTP client used by the private poller
+    :return: Path of the downloaded video
     """
-    url = f"https://api.stability.ai/v2beta/image-to-video/result/{generation_id}"
-
-    headers = {
-        'accept': "video/*",  # Use 'application/json' to receive base64 encoded JSON
-        'authorization': f"Bearer {api_key}"
-    }
-
     file_name_path = f"{output_path_video}{video_name}.mp4"
 
-    for attempt in range(retries):
-        response = requests.request("GET", url, headers=headers)  # , timeout=(5, 14)
+    if poller is not None:
+        return poller.submit(generation_id, file_name_path, timeout=timeout).result()
 
-        if response.status_code == 200:
-            print("Generation complete!")
-            with open(file_name_path, 'wb') as file:
-                file.write(response.content)
-            return  # Success, exit the loop
-
-        elif response.status_code == 202:
-            print(f"Generation in-progress, retrying attempt {attempt + 1} of {retries} in {wait_time} seconds.")
-            time.sleep(wait_time)
-        else:
-            raise Exception(str(response.json()))
-
-    raise Exception("Failed to download video after all retries.")
+    with VideoPoller(api_key, client=client) as own_poller:
+        return own_poller.submit(generation_id, file_name_path, timeout=timeout).result()
 
 
 #%%
 
-def generate_and_download_video(stability_api_key: str, text_prompts: str, book_name: str, output_path_images: str, output_path_video:str, cfg_scale: float, motion_bucket_id: float) -> None:
+def generate_and_download_video(stability_api_key: str, text_prompts: str, book_name: str, output_path_images: str, output_path_video:str, cfg_scale: float, motion_bucket_id: float, cache: GenerationCache = None, poller: VideoPoller = None, client: StabilityClient = None, save_image: bool = True) -> None:
     """
     Generate an image and animate it via Stability AI API.
     Creates folder "book_name" with "book_name/Images" and "book_name/Videos".
@@ -133,6 +200,15 @@ def generate_and_download_video(stability_api_key: str, text_prompts: str, book_
     :param motion_bucket_id: [1, 255] Lower values generally result in less motion in the output video, while higher
     values generally result in more motion.
 
+    :param cache: Optional generation cache. Requests whose parameters (and uploaded image) match an earlier run
+    are served from it without calling the API.
+
+    :param poller: Optional poller shared between chapters, so that one thread polls every pending generation.
+
+    :param client: HTTP client for every request; defaults to the shared pooled client of `stability_api_key`.
+
+    :param save_image: Also write the generated image to `output_path_images`, in the background.
+
     Note: ----- - Make sure to create .env file in the main directory where you create a string variable "API_KEY"
     with your actual Stability AI API key.
     """
@@ -141,12 +217,34 @@ def generate_and_download_video(stability_api_key: str, text_prompts: str, book_
     #
     # os.makedirs(output_path_video, exist_ok=True)
 
-    image_name = generate_image_from_text(stability_api_key, text_prompts, output_path_images, book_name)
+    client = client or StabilityClient.for_key(stability_api_key)
+    width, height = VIDEO_SIZES["1:1"]
+
+    # The image stays in memory from generation to upload; saving it to disk is optional and asynchronous
+    with metrics.stage("image_generation", chapter=book_name):
+        image_bytes = generate_image_bytes(stability_api_key, text_prompts, cache=cache, client=client,
+                                           aspect_ratio="1:1")
+        image_bytes = resize_image_bytes(image_bytes, width=width, height=height)
+    saved_image = save_image_async(image_bytes, f"{output_path_images}{book_name}.png") if save_image else None
+
+    video_path = f"{output_path_video}{book_name}.mp4"
+    video_key = GenerationCache.make_key(client.url(IMAGE_TO_VIDEO_PATH), image_to_video_params(cfg_scale, motion_bucket_id),
+                                         payload=image_bytes)
+
+    if cache is None or not cache.fetch(video_key, "mp4", video_path):
+        with metrics.stage("video_submission", chapter=book_name):
+            video_id = submit_image_to_video(stability_api_key, image_bytes, cfg_scale, motion_bucket_id,
+                                             client=client)
+
+        with metrics.stage("polling", chapter=book_name):
+            download_generated_video(stability_api_key, video_id, output_path_video, book_name, poller=poller,
+                                     client=client)
 
-    resize_image(image_name, width=768, height=768)
+        if cache is not None:
+            cache.put(video_key, "mp4", video_path)
 
-    video_id = get_generation_id(stability_api_key, image_name, cfg_scale, motion_bucket_id)
+    if saved_image is not None:
+        saved_image.result()  # Surface write errors
 
-    download_generated_video(stability_api_key, video_id, output_path_video, book_name)
 
 #%%
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from typing import Optional
+
+from instrumentation import metrics
+
+
+class GenerationCache:
+    """
+    Content-addressed on-disk cache for Stability AI outputs (PNG images and MP4 clips).
+
+    Entries are keyed by a hash of the full request parameters, so an identical request is answered from disk
+    without any network call. The total size is capped; when it is exceeded the least recently used entries are
+    evicted. Recency is tracked through each file's modification time, which is refreshed on every hit.
+
+    Attributes:
+        cache_dir (str): Folder holding the cached files.
+        max_bytes (int): Size cap of the cache folder in bytes.
+    """
+
+    def __init__(self, cache_dir: str = "generation_cache", max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(endpoint: str, params: dict, payload: Optional[bytes] = None) -> str:
+        """
+        Hash an API request into a cache key.
+
+        :param endpoint: Full URL the request is sent to, API root included, so that responses of a stand-in
+        server (e.g. the benchmark's mock API) never answer requests to the real API.
+        :param params: Request parameters (prompt, style_preset, cfg_scale, seed, ...).
+        :param payload: Uploaded file content, if the request carries one.
+        :return: Hex digest identifying the request.
+        """
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"endpoint": endpoint, "params": params}, sort_keys=True, default=str).encode())
+        if payload is not None:
+            digest.update(hashlib.sha256(payload).digest())
+        return digest.hexdigest()
+
+    def _path(self, key: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{extension}")
+
+    def get(self, key: str, extension: str) -> Optional[str]:
+        """
+        Look up a cached file and mark it as recently used.
+
+        :return: Path of the cached file, or None on a miss.
+        """
+        path = self._path(key, extension)
+        try:
+            os.utime(path, (time.time(), time.time()))
+        except FileNotFoundError:
+            metrics.cache_lookup("generation." + extension, hit=False)
+            return None
+        metrics.cache_lookup("generation." + extension, hit=True)
+        return path
+
+    def fetch(self, key: str, extension: str, destination: str) -> bool:
+        """
+        Copy a cached file to `destination`.
+
+        :return: True on a hit, False on a miss.
+        """
+        path = self.get(key, extension)
+        if path is None:
+            return False
+        try:
+            shutil.copyfile(path, destination)
+        except FileNotFoundError:
+            # Evicted by another thread between the lookup and the copy
+            return False
+        return True
+
+    def read(self, key: str, extension: str) -> Optional[bytes]:
+        """
+        Read a cached file into memory.
+
+        :return: The file content, or None on a miss.
+        """
+        path = self.get(key, extension)
+        if path is None:
+            return None
+        try:
+            with open(path, "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, key: str, extension: str, data: bytes) -> str:
+        """
+        Store `data` under `key`, then evict old entries if the cache is over its size cap.
+
+        :return: Path of the cached file.
+        """
+        path = self._path(key, extension)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def put(self, key: str, extension: str, source_path: str) -> str:
+        """
+        Store a copy of `source_path` under `key`, then evict old entries if the cache is over its size cap.
+
+        :return: Path of the cached file.
+        """
+        path = self._path(key, extension)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass
+                total -= size
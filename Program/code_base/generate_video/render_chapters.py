@@ -0,0 +1,134 @@
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, List, Optional
+
+from instrumentation import metrics
+
+from .generate_video_from_text import generate_and_download_video
+from .generation_cache import GenerationCache
+from .stability_client import StabilityClient
+from .video_poller import VideoPoller
+
+
+@dataclass
+class ChapterRenderResult:
+    """
+    Outcome of rendering a single chapter.
+
+    Attributes:
+        index (int): 1-based chapter number, as used in the "{book_name}_chapter_{n}" file names.
+        chapter_name (str): Base name of the chapter's image and video files.
+        video_path (str): Path the chapter video is written to.
+        error (Exception | None): The exception raised while rendering, or None on success.
+    """
+    index: int
+    chapter_name: str
+    video_path: str
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def render_chapters(stability_api_key: str, chapter_summaries: Iterable[str], book_name: str, output_path_images: str,
+                    output_path_video: str, cfg_scale: float, motion_bucket_id: float, max_in_flight: int = 4,
+                    on_progress: Optional[Callable[[ChapterRenderResult, int, int], None]] = None,
+                    cache: Optional[GenerationCache] = None,
+                    client: Optional[StabilityClient] = None, save_images: bool = True,
+                    total: Optional[int] = None) -> List[ChapterRenderResult]:
+    """
+    Render one video per chapter summary, keeping at most `max_in_flight` chapters in progress at once.
+
+    Summaries may come from a generator (e.g. ChaptersSummary.iter_summaries): each one is rendered as soon as it is
+    produced, so rendering overlaps summarization. A feeder thread moves them into a queue of `max_in_flight`
+    slots that the render workers take from; when it is full the generator is not advanced, so summarization never
+    runs further ahead of rendering than that.
+
+    Each chapter is written to "{book_name}_chapter_{n}" exactly as the serial loop did, so the output files do not
+    depend on the order in which chapters finish. A failing chapter is recorded in its result and does not stop
+    the others.
+
+    :param stability_api_key: Stability AI API key
+    :param chapter_summaries: Text prompts, one per chapter, in reading order; a list or any iterable
+    :param book_name: Book name used as the prefix of every chapter file
+    :param output_path_images: Folder the chapter images are written to
+    :param output_path_video: Folder the chapter videos are written to
+    :param cfg_scale: [1, 10] How strongly the video sticks to the original image.
+    :param motion_bucket_id: [1, 255] Amount of motion in the output video.
+    :param max_in_flight: Maximum number of chapters rendered concurrently.
+    :param on_progress: Called in the caller's thread as `on_progress(result, completed, total)` whenever a
+    chapter finishes, successfully or not.
+    :param cache: Optional generation cache shared by all chapters.
+    :param client: HTTP client shared by all chapters; defaults to the pooled client of `stability_api_key`.
+    :param save_images: Also write each chapter image to `output_path_images`.
+    :param total: Number of chapters, reported to `on_progress`; required when `chapter_summaries` has no len().
+    :return: One result per chapter, in chapter order.
+    """
+    if total is None:
+        total = len(chapter_summaries)
+    workers = max(1, max_in_flight)
+    summaries = queue.Queue(maxsize=workers)
+    finished = queue.Queue()
+    feed_errors = []
+    results = []
+
+    def render(index: int, summary: str) -> ChapterRenderResult:
+        chapter_name = f"{book_name}_chapter_{index}"
+        result = ChapterRenderResult(index, chapter_name, f"{output_path_video}{chapter_name}.mp4")
+        try:
+            with metrics.stage("render", book=book_name, chapter=index):
+                generate_and_download_video(
+                    stability_api_key=stability_api_key,
+                    text_prompts=summary,
+                    book_name=chapter_name,
+                    output_path_images=output_path_images,
+                    output_path_video=output_path_video,
+                    cfg_scale=cfg_scale,
+                    motion_bucket_id=motion_bucket_id,
+                    cache=cache,
+                    poller=poller,
+                    client=client,
+                    save_image=save_images
+                )
+        except Exception as e:
+            result.error = e
+        return result
+
+    def feed():
+        try:
+            for index, summary in enumerate(chapter_summaries):
+                summaries.put((index + 1, summary))  # Blocks while every slot is taken
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            for _ in range(workers):
+                summaries.put(None)
+
+    def work():
+        while True:
+            item = summaries.get()
+            if item is None:
+                finished.put(None)
+                return
+            finished.put(render(*item))
+
+    # One thread polls the image-to-video results of every chapter
+    with VideoPoller(stability_api_key, client=client) as poller, ThreadPoolExecutor(max_workers=workers + 1) as executor:
+        executor.submit(feed)
+        for _ in range(workers):
+            executor.submit(work)
+        running = workers
+        while running:
+            result = finished.get()
+            if result is None:
+                running -= 1
+                continue
+            results.append(result)
+            if on_progress is not None:
+                on_progress(result, len(results), total)
+
+    if feed_errors:
+        raise feed_errors[0]
+    return sorted(results, key=lambda r: r.index)
@@ -0,0 +1,129 @@
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import metrics
+
+STABILITY_API_URL = "https://api.stability.ai"
+
+
+def _endpoint(path: str) -> str:
+    """Metric label of a request path, with generation IDs collapsed so label cardinality stays bounded."""
+    return re.sub(r"/result/[^/?]+", "/result/{id}", path.split("?")[0])
+
+
+class _GenerationRetry(Retry):
+    """
+    Retry policy that never repeats a POST the server may have accepted. A POST starts a paid generation, so it is
+    only retried when it never reached the server (connection errors) or was explicitly rejected (429); read errors,
+    5xx and other failures of a POST are handed to the caller. GET polling keeps the full policy.
+    """
+
+    def is_retry(self, method: str, status_code: int, has_retry_after: bool = False) -> bool:
+        if method == "POST" and status_code != 429:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def increment(self, method=None, url=None, *args, **kwargs):
+        if method == "POST" and (self.read is not False or self.other != 0):
+            return self.new(read=False, other=0).increment(method, url, *args, **kwargs)
+        return super().increment(method, url, *args, **kwargs)
+
+
+class StabilityClient:
+    """
+    HTTP transport shared by every Stability AI call.
+
+    Owns a requests.Session whose keep-alive connection pool is reused across calls and threads, so a render only
+    pays for the TLS handshake once per pooled connection. Transient failures are retried with exponential backoff,
+    honouring Retry-After: GET polling on connection and read errors, 429 and 5xx; POSTs, which start paid
+    generations, only on connection errors and 429.
+
+    Attributes:
+        api_key (str): Stability AI API key, sent as a bearer token on every request.
+        base_url (str): API root; point it at a local stand-in server for testing.
+        pool_size (int): Maximum number of pooled connections; requests beyond it wait for a free connection.
+        timeout (tuple): (connect, read) timeout in seconds applied to requests that do not set their own.
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, api_key: str, base_url: str = STABILITY_API_URL, pool_size: int = 16,
+                 timeout: tuple = (10, 120), max_retries: int = 3, backoff_factor: float = 1.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        retry = _GenerationRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # Hand the last error response to the caller, which reports its JSON body
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry, pool_block=True)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["authorization"] = f"Bearer {api_key}"
+
+    @classmethod
+    def for_key(cls, api_key: str) -> "StabilityClient":
+        """
+        Returns the process-wide default client of an API key, creating it on first use. The STABILITY_API_URL
+        environment variable overrides the API root, e.g. to run against a local stand-in server.
+        """
+        with cls._shared_lock:
+            if api_key not in cls._shared:
+                cls._shared[api_key] = cls(api_key, base_url=os.getenv("STABILITY_API_URL", STABILITY_API_URL))
+            return cls._shared[api_key]
+
+    def url(self, path: str) -> str:
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url(path), **kwargs)
+        except requests.RequestException as e:
+            metrics.observe_request("stability", _endpoint(path), time.perf_counter() - start, type(e).__name__)
+            raise
+        self._record(path, response, time.perf_counter() - start, kwargs.get("stream", False))
+        return response
+
+    @staticmethod
+    def _record(path: str, response: requests.Response, seconds: float, stream: bool):
+        """Reports latency, bytes and transport retries of a response to the pipeline metrics."""
+        body = response.request.body if response.request is not None else None
+        bytes_sent = len(body) if isinstance(body, (bytes, str)) else 0
+        # Streamed bodies are counted by whoever consumes them
+        bytes_received = 0 if stream else len(response.content)
+        retry_state = getattr(response.raw, "retries", None)
+        retries = len(retry_state.history) if retry_state is not None else 0
+        metrics.observe_request("stability", _endpoint(path), seconds, response.status_code, bytes_sent=bytes_sent,
+                                bytes_received=bytes_received, retries=retries)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,51 @@
+import os
+
+from .generation_cache import GenerationCache
+
+
+def test_make_key_depends_on_every_part_of_the_request():
+    params = {"prompt": "A ship in a storm", "cfg_scale": 5}
+    key = GenerationCache.make_key("https://api.stability.ai/v2beta/image-to-video", params, payload=b"png")
+    assert key == GenerationCache.make_key("https://api.stability.ai/v2beta/image-to-video", dict(params),
+                                           payload=b"png")
+    assert key != GenerationCache.make_key("http://127.0.0.1:8765/v2beta/image-to-video", params, payload=b"png")
+    assert key != GenerationCache.make_key("https://api.stability.ai/v2beta/image-to-video",
+                                           {**params, "cfg_scale": 6}, payload=b"png")
+    assert key != GenerationCache.make_key("https://api.stability.ai/v2beta/image-to-video", params, payload=b"jpg")
+    assert key != GenerationCache.make_key("https://api.stability.ai/v2beta/image-to-video", params)
+
+
+def test_write_read_and_fetch(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache"))
+    assert cache.read("key", "png") is None
+    cache.write("key", "png", b"image")
+    assert cache.read("key", "png") == b"image"
+
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(b"video")
+    cache.put("clip", "mp4", str(source))
+    destination = tmp_path / "copy.mp4"
+    assert cache.fetch("clip", "mp4", str(destination))
+    assert destination.read_bytes() == b"video"
+    assert not cache.fetch("other", "mp4", str(tmp_path / "missing.mp4"))
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache"), max_bytes=30)
+    for age, key in enumerate(("old", "used", "new")):
+        path = cache.write(key, "png", b"x" * 10)
+        os.utime(path, (1000 + age, 1000 + age))
+    # A hit makes "old" the most recently used entry
+    assert cache.read("old", "png") is not None
+
+    cache.write("newest", "png", b"x" * 10)
+    assert cache.read("used", "png") is None
+    assert cache.read("old", "png") is not None
+    assert cache.read("new", "png") is not None
+    assert cache.read("newest", "png") is not None
+
+
+def test_entries_larger_than_the_cap_are_not_kept(tmp_path):
+    cache = GenerationCache(str(tmp_path / "cache"), max_bytes=5)
+    cache.write("big", "png", b"x" * 10)
+    assert cache.read("big", "png") is None
@@ -0,0 +1,125 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from .stability_client import StabilityClient
+from .video_poller import VideoPoller
+
+
+class _ResultServer:
+    """
+    Local stand-in for the image-to-video result endpoint. `script[generation_id]` lists the answers of the
+    successive polls as (status, headers, body, seconds spent sending the body); the last one repeats.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.polls = {}  # generation ID -> monotonic times of its polls
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                generation_id = self.path.rsplit("/", 1)[-1]
+                times = server.polls.setdefault(generation_id, [])
+                times.append(time.monotonic())
+                answers = server.script[generation_id]
+                status, headers, body, seconds = answers[min(len(times), len(answers)) - 1]
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                half = len(body) // 2
+                self.wfile.write(body[:half])
+                self.wfile.flush()
+                time.sleep(seconds)
+                self.wfile.write(body[half:])
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        self.client = StabilityClient("key", base_url=f"http://127.0.0.1:{self._httpd.server_port}", max_retries=0)
+
+    def close(self):
+        self.client.close()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+@pytest.fixture
+def serve():
+    servers = []
+
+    def start(script):
+        servers.append(_ResultServer(script))
+        return servers[-1]
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+IN_PROGRESS = (202, {"Content-Type": "application/json"}, b'{"status": "in-progress"}', 0)
+
+
+def _video(body=b"mp4 data", seconds=0):
+    return 200, {"Content-Type": "video/mp4"}, body, seconds
+
+
+def test_downloads_the_finished_video(tmp_path, serve):
+    server = serve({"a": [IN_PROGRESS, _video()]})
+    with VideoPoller("key", initial_interval=0.01, client=server.client) as poller:
+        path = poller.submit("a", str(tmp_path / "a.mp4")).result(timeout=5)
+    assert open(path, "rb").read() == b"mp4 data"
+    assert len(server.polls["a"]) == 2
+
+
+def test_interval_backs_off_up_to_the_maximum(tmp_path, serve):
+    server = serve({"a": [IN_PROGRESS] * 5 + [_video()]})
+    with VideoPoller("key", initial_interval=0.05, backoff=2, max_interval=0.2, client=server.client) as poller:
+        poller.submit("a", str(tmp_path / "a.mp4")).result(timeout=5)
+    times = server.polls["a"]
+    gaps = [later - earlier for earlier, later in zip(times, times[1:])]
+    # 0.1, 0.2, then capped at 0.2
+    assert gaps[0] == pytest.approx(0.1, abs=0.05)
+    assert all(gap == pytest.approx(0.2, abs=0.07) for gap in gaps[1:])
+
+
+def test_retry_after_overrides_the_backoff(tmp_path, serve):
+    hinted = (202, {"Retry-After": "0"}, b"{}", 0)
+    server = serve({"a": [hinted, hinted, _video()]})
+    with VideoPoller("key", initial_interval=0.01, backoff=1000, max_interval=60, client=server.client) as poller:
+        poller.submit("a", str(tmp_path / "a.mp4")).result(timeout=2)
+    assert len(server.polls["a"]) == 3
+
+
+def test_job_fails_at_its_deadline(tmp_path, serve):
+    server = serve({"a": [IN_PROGRESS]})
+    with VideoPoller("key", initial_interval=0.05, backoff=1, client=server.client) as poller:
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            poller.submit("a", str(tmp_path / "a.mp4"), timeout=0.3).result(timeout=5)
+    assert time.monotonic() - start < 1
+
+
+def test_client_errors_fail_the_job(tmp_path, serve):
+    server = serve({"a": [(404, {"Content-Type": "application/json"}, b'{"name": "not_found"}', 0)]})
+    with VideoPoller("key", initial_interval=0.01, client=server.client) as poller:
+        with pytest.raises(Exception, match="not_found"):
+            poller.submit("a", str(tmp_path / "a.mp4")).result(timeout=5)
+    assert len(server.polls["a"]) == 1
+
+
+def test_slow_download_does_not_delay_other_polls(tmp_path, serve):
+    server = serve({"slow": [_video(b"x" * 1000, seconds=1.0)], "fast": [IN_PROGRESS, IN_PROGRESS, _video()]})
+    with VideoPoller("key", initial_interval=0.05, backoff=1, client=server.client) as poller:
+        slow = poller.submit("slow", str(tmp_path / "slow.mp4"))
+        time.sleep(0.02)
+        fast = poller.submit("fast", str(tmp_path / "fast.mp4"))
+        fast.result(timeout=5)
+        assert not slow.done()
+        assert slow.result(timeout=5) == str(tmp_path / "slow.mp4")
@@ -0,0 +1,196 @@
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import requests
+
+from instrumentation import metrics
+
+from .stability_client import StabilityClient
+
+RESULT_PATH = "/v2beta/image-to-video/result/{generation_id}"
+
+
+class _Job:
+    def __init__(self, generation_id: str, output_path: str, deadline: float, interval: float):
+        self.generation_id = generation_id
+        self.output_path = output_path
+        self.deadline = deadline
+        self.interval = interval
+        self.attempts = 0
+        self.future = Future()
+
+
+def _retry_after(response) -> Optional[float]:
+    """Seconds to wait according to a Retry-After header (delta-seconds or HTTP date), if the server sent one."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class VideoPoller:
+    """
+    Polls many image-to-video generation jobs from a single background thread.
+
+    Each submitted generation ID is polled with an interval that grows by `backoff` after every "in progress" (202)
+    answer, up to `max_interval`, unless the server sends a Retry-After hint, which is used instead. Finished videos
+    are streamed to disk in chunks by a small pool of download threads, so that a multi-megabyte download never
+    delays the polls of the other jobs. A job that is not finished before its deadline fails with TimeoutError.
+
+    Use as a context manager, or call close() when done.
+
+    Attributes:
+        api_key (str): Stability AI API key.
+        initial_interval (float): Seconds before the first poll of a job.
+        max_interval (float): Upper bound of the polling interval.
+        backoff (float): Factor applied to the interval after each 202.
+        timeout (float): Default seconds a job may take from submission to download.
+        chunk_size (int): Bytes written per chunk when streaming a video to disk.
+        download_workers (int): Videos downloaded at the same time.
+        client (StabilityClient): HTTP client used for polling; defaults to the shared client of `api_key`.
+    """
+
+    def __init__(self, api_key: str, initial_interval: float = 5.0, max_interval: float = 30.0, backoff: float = 1.5,
+                 timeout: float = 600.0, chunk_size: int = 1024 * 1024, client: Optional[StabilityClient] = None,
+                 download_workers: int = 4):
+        self.api_key = api_key
+        self.client = client or StabilityClient.for_key(api_key)
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.timeout = timeout
+        self.chunk_size = chunk_size
+        self.download_workers = download_workers
+        self._downloads = ThreadPoolExecutor(max_workers=download_workers, thread_name_prefix="VideoDownload")
+        self._queue = []  # (next poll time, sequence, job)
+        self._sequence = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="VideoPoller", daemon=True)
+        self._thread.start()
+
+    def submit(self, generation_id: str, output_path: str, timeout: Optional[float] = None) -> Future:
+        """
+        Starts tracking a generation job.
+
+        :param generation_id: ID returned by the image-to-video endpoint
+        :param output_path: Path the finished MP4 is written to
+        :param timeout: Seconds until the job fails with TimeoutError; defaults to `self.timeout`
+        :return: Future resolved with `output_path` once the video is on disk
+        """
+        if not generation_id:
+            raise ValueError("No generation ID to poll.")
+        now = time.monotonic()
+        job = _Job(generation_id, output_path, now + (self.timeout if timeout is None else timeout),
+                   self.initial_interval)
+        self._schedule(job, now + job.interval)
+        return job.future
+
+    def _schedule(self, job: _Job, when: float):
+        with self._condition:
+            if self._closed:
+                job.future.set_exception(RuntimeError("VideoPoller is closed."))
+                return
+            heapq.heappush(self._queue, (when, self._sequence, job))
+            self._sequence += 1
+            self._condition.notify()
+
+    def close(self):
+        """Stops the polling thread and waits for running downloads. Jobs still pending fail with RuntimeError."""
+        with self._condition:
+            self._closed = True
+            pending = [job for _, _, job in self._queue]
+            self._queue.clear()
+            self._condition.notify()
+        for job in pending:
+            job.future.set_exception(RuntimeError("VideoPoller closed before the video was ready."))
+        self._thread.join()
+        self._downloads.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and (not self._queue or self._queue[0][0] > time.monotonic()):
+                    self._condition.wait(self._queue[0][0] - time.monotonic() if self._queue else None)
+                if self._closed:
+                    return
+                _, _, job = heapq.heappop(self._queue)
+            self._poll(job)
+
+    def _poll(self, job: _Job):
+        job.attempts += 1
+        path = RESULT_PATH.format(generation_id=job.generation_id)
+        headers = {
+            'accept': "video/*",  # Use 'application/json' to receive base64 encoded JSON
+        }
+
+        response = None
+        try:
+            response = self.client.get(path, headers=headers, stream=True)
+            metrics.inc("moviefy_poll_attempts_total", status=response.status_code)
+            if response.status_code == 200:
+                # The download thread owns the response from here on
+                self._downloads.submit(self._download, job, response)
+                response = None
+                return
+            if response.status_code not in (202, 429) and response.status_code < 500:
+                job.future.set_exception(Exception(str(response.json())))
+                return
+            hint = _retry_after(response)
+        except requests.RequestException as e:
+            # Connection problems are treated like "not ready yet"
+            print(f"Polling {job.generation_id} failed ({e}), retrying.")
+            hint = None
+        except Exception as e:
+            job.future.set_exception(e)
+            return
+        finally:
+            if response is not None:
+                response.close()
+
+        job.interval = hint if hint is not None else min(self.max_interval, job.interval * self.backoff)
+        now = time.monotonic()
+        if now >= job.deadline:
+            job.future.set_exception(
+                TimeoutError(f"Video {job.generation_id} not ready after {job.attempts} attempts."))
+            return
+        print(f"Generation in-progress ({job.generation_id}), attempt {job.attempts}, "
+              f"retrying in {job.interval:.0f} seconds.")
+        # The last poll happens at the deadline at the latest
+        self._schedule(job, min(now + job.interval, job.deadline))
+
+    def _download(self, job: _Job, response):
+        try:
+            with response:
+                self._save(response, job.output_path)
+        except Exception as e:
+            job.future.set_exception(e)
+            return
+        print(f"Generation complete! ({job.generation_id})")
+        job.future.set_result(job.output_path)
+
+    def _save(self, response, output_path: str):
+        tmp_path = f"{output_path}.part"
+        with open(tmp_path, 'wb') as file:
+            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                file.write(chunk)
+                metrics.inc("moviefy_bytes_total", len(chunk), api="stability", direction="received")
+        os.replace(tmp_path, output_path)
@@ -0,0 +1,190 @@
+import glob
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def process_alive(pid: Optional[int]) -> bool:
+    """
+    Whether process `pid` is running. Signal 0 only probes the process on POSIX (on Windows os.kill would end it):
+    elsewhere every process is reported dead.
+    """
+    if not pid or os.name != "posix":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Alive, owned by another user
+    except OSError:
+        return False
+    return True
+
+
+def _labels_key(labels: dict) -> tuple:
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+class PipelineMetrics:
+    """
+    Process-wide instrumentation of the book-to-trailer pipeline.
+
+    Records a trace span for every timed stage (extraction, summarization, image generation, video submission,
+    polling, merging), per book and chapter, plus counters (requests, retries, bytes, cache hits) and latency
+    histograms. Spans are exported as JSON lines; counters and histograms as a Prometheus text file, e.g. for the
+    node_exporter textfile collector.
+
+    Thread-safe; use the module-level `metrics` instance.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = []
+        self._counters = {}
+        self._histograms = {}
+
+    def reset(self):
+        with self._lock:
+            self._spans.clear()
+            self._counters.clear()
+            self._histograms.clear()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        """Adds `amount` to the counter `name` with the given labels."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        """Records one observation in the latency histogram `name`."""
+        key = (name, _labels_key(labels))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0,
+                                                         "count": 0})
+            for position, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][position] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    @contextmanager
+    def stage(self, stage: str, book: Optional[str] = None, chapter=None, **attributes):
+        """
+        Times a pipeline stage and records it as a span and in the moviefy_stage_seconds histogram.
+
+        :param stage: Stage name, e.g. "summarize" or "polling"
+        :param book: Book the stage works on
+        :param chapter: Chapter number or chapter file name, for per-chapter stages
+        :param attributes: Extra span attributes
+        """
+        started = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            span = {"stage": stage, "book": book, "chapter": chapter, "start": started, "duration": duration,
+                    "ok": error is None, "pid": os.getpid(), **attributes}
+            if error is not None:
+                span["error"] = error
+            with self._lock:
+                self._spans.append(span)
+            self.observe("moviefy_stage_seconds", duration, stage=stage)
+            if error is not None:
+                self.inc("moviefy_stage_errors_total", stage=stage)
+
+    def observe_request(self, api: str, endpoint: str, seconds: float, status, bytes_sent: int = 0,
+                        bytes_received: int = 0, retries: int = 0):
+        """Records one API call: latency, status, transferred bytes and transport-level retries."""
+        self.observe("moviefy_api_latency_seconds", seconds, api=api, endpoint=endpoint)
+        self.inc("moviefy_api_requests_total", api=api, endpoint=endpoint, status=status)
+        if bytes_sent:
+            self.inc("moviefy_bytes_total", bytes_sent, api=api, direction="sent")
+        if bytes_received:
+            self.inc("moviefy_bytes_total", bytes_received, api=api, direction="received")
+        if retries:
+            self.inc("moviefy_api_retries_total", retries, api=api, endpoint=endpoint)
+
+    def cache_lookup(self, cache: str, hit: bool):
+        self.inc("moviefy_cache_lookups_total", cache=cache, result="hit" if hit else "miss")
+
+    def write_jsonl(self, path: str):
+        """
+        Appends the spans recorded since the last call to a JSON-lines trace file.
+        """
+        with self._lock:
+            spans, self._spans = self._spans, []
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as file:
+            for span in spans:
+                file.write(json.dumps(span, default=str) + "\n")
+
+    def write_prometheus(self, path: str, **const_labels):
+        """
+        Writes every counter and histogram in the Prometheus text exposition format (atomically replaced).
+
+        :param path: Output file
+        :param const_labels: Labels added to every series, e.g. worker="1234"
+        """
+        const_labels = _labels_key(const_labels)
+
+        def render_labels(labels: tuple, extra: tuple = ()) -> str:
+            pairs = [f'{name}="{str(value).replace(chr(34), chr(39))}"' for name, value in const_labels + labels + extra]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (counter_name, labels), value in sorted(self._counters.items()):
+                    if counter_name == name:
+                        lines.append(f"{name}{render_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, labels), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    for bound, count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+                        lines.append(f"{name}_bucket{render_labels(labels, (('le', bound),))} {count}")
+                    lines.append(f"{name}_bucket{render_labels(labels, (('le', '+Inf'),))} {histogram['count']}")
+                    lines.append(f"{name}_sum{render_labels(labels)} {histogram['sum']}")
+                    lines.append(f"{name}_count{render_labels(labels)} {histogram['count']}")
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+    def export(self, folder: str):
+        """
+        Writes traces.jsonl and a per-process moviefy_<pid>.prom file into `folder`, and removes the .prom files of
+        processes that have exited.
+
+        Every series of a .prom file carries a worker="<pid>" label: the textfile collector merges all the files of
+        its folder and rejects series that appear in more than one.
+        """
+        self.write_jsonl(os.path.join(folder, "traces.jsonl"))
+        self.write_prometheus(os.path.join(folder, f"moviefy_{os.getpid()}.prom"), worker=os.getpid())
+        for path in glob.glob(os.path.join(folder, "moviefy_*.prom")):
+            match = re.fullmatch(r"moviefy_(\d+)\.prom", os.path.basename(path))
+            if match and not process_alive(int(match.group(1))):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # Removed by another worker
+
+
+metrics = PipelineMetrics()
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from instrumentation import process_alive
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of book-to-trailer jobs, shared by the Streamlit app and the worker processes.
+
+    Jobs are deduplicated by a key derived from their parameters: submitting a job identical to an earlier one returns
+    that job, whatever its outcome, instead of starting another render. Failed and incomplete jobs are only rendered
+    again when asked for explicitly (submit(..., force=True)).
+
+    Attributes:
+        db_path (str): Path to the SQLite database file.
+    """
+
+    def __init__(self, db_path: str = "jobs.sqlite3"):
+        self.db_path = db_path
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " job_key TEXT NOT NULL,"
+                " params TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " progress REAL NOT NULL DEFAULT 0,"
+                " message TEXT NOT NULL DEFAULT '',"
+                " result TEXT,"
+                " error TEXT,"
+                " preview TEXT,"
+                " worker_pid INTEGER,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+            if "preview" not in columns:
+                # Databases created before progressive previews
+                connection.execute("ALTER TABLE jobs ADD COLUMN preview TEXT")
+            if "worker_pid" not in columns:
+                # Databases created before running jobs recorded their worker
+                connection.execute("ALTER TABLE jobs ADD COLUMN worker_pid INTEGER")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_by_key ON jobs (job_key)")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, id)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One short-lived connection per call: the queue is used from several processes and threads
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def job_key(params: dict) -> str:
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+    def submit(self, params: dict, force: bool = False) -> int:
+        """
+        Queues a job, or returns the ID of the latest identical job, failed and incomplete ones included, so that a
+        job failing for good (malformed book, rejected prompt, missing key) is not rendered again on every call.
+
+        :param params: JSON-serializable job parameters (no API keys: workers read those from their environment)
+        :param force: Queue a new job unless an identical one is queued or running, e.g. to retry a failed render
+        :return: Job ID
+        """
+        key = self.job_key(params)
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT id, status FROM jobs WHERE job_key = ? ORDER BY id DESC LIMIT 1", (key,)
+            ).fetchone()
+            if row is not None and (not force or row["status"] in (QUEUED, RUNNING)):
+                connection.execute("COMMIT")
+                return row["id"]
+            cursor = connection.execute(
+                "INSERT INTO jobs (job_key, params, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(params), QUEUED, now, now)
+            )
+            connection.execute("COMMIT")
+            return cursor.lastrowid
+
+    @staticmethod
+    def is_complete(result: Optional[dict]) -> bool:
+        """
+        :return: Whether the result of a done job is a full trailer: its final video exists and no chapter failed
+        """
+        if not result or result.get("failed_chapters"):
+            return False
+        final_video = result.get("final_video")
+        return bool(final_video) and os.path.exists(final_video)
+
+    @classmethod
+    def needs_retry(cls, job: dict) -> bool:
+        """
+        :return: Whether a job ended without a complete trailer (failed, or done with failed chapters or without its
+        final video), i.e. whether submitting it again with force=True would render anything
+        """
+        return job["status"] == FAILED or (job["status"] == DONE and not cls.is_complete(job["result"]))
+
+    def claim(self) -> Optional[dict]:
+        """
+        Atomically takes the oldest queued job and marks it running by the calling process.
+
+        :return: The job, or None if the queue is empty
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                connection.execute("COMMIT")
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker_pid = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, os.getpid(), time.time(), row["id"])
+            )
+            connection.execute("COMMIT")
+        job = self._to_dict(row)
+        job["status"] = RUNNING
+        job["worker_pid"] = os.getpid()
+        return job
+
+    def update(self, job_id: int, progress: float, message: str):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET progress = ?, message = ?, updated_at = ? WHERE id = ?",
+                (progress, message, time.time(), job_id)
+            )
+
+    def set_preview(self, job_id: int, preview: dict):
+        """
+        Publishes the partial trailer of a running job, e.g. {"video": path, "playlist": path, "chapters": n}.
+        """
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET preview = ?, updated_at = ? WHERE id = ?", (json.dumps(preview), time.time(), job_id)
+            )
+
+    def finish(self, job_id: int, result: dict):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, progress = 1, result = ?, updated_at = ? WHERE id = ?",
+                (DONE, json.dumps(result), time.time(), job_id)
+            )
+
+    def fail(self, job_id: int, error: str):
+        with self._connect() as connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?",
+                (FAILED, error, time.time(), job_id)
+            )
+
+    def requeue_running(self) -> int:
+        """
+        Puts jobs left "running" by workers that died back in the queue. Jobs whose worker process is still alive,
+        e.g. one started by another app or batch run on the same database, are left alone. Call before starting
+        workers.
+
+        :return: Number of requeued jobs
+        """
+        with self._connect() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            orphaned = [row["id"] for row in connection.execute(
+                "SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,)
+            ) if not process_alive(row["worker_pid"])]
+            connection.executemany(
+                "UPDATE jobs SET status = ?, worker_pid = NULL, updated_at = ? WHERE id = ?",
+                [(QUEUED, time.time(), job_id) for job_id in orphaned]
+            )
+            connection.execute("COMMIT")
+            return len(orphaned)
+
+    def get(self, job_id: int) -> Optional[dict]:
+        """
+        :return: The job's status, progress, message, parameters, preview and result, or None if there is no such
+        job
+        """
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["preview"] = json.loads(job["preview"]) if job["preview"] else None
+        return job
@@ -0,0 +1,132 @@
+import os
+import sqlite3
+
+import pytest
+
+from .job_queue import DONE, FAILED, QUEUED, RUNNING, JobQueue
+
+PARAMS = {"book_path": "input_book/abc.epub", "book_digest": "abc", "cfg_scale": 5, "motion_bucket_id": 50}
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+@pytest.fixture
+def trailer(tmp_path):
+    path = tmp_path / "trailer.mp4"
+    path.write_bytes(b"mp4")
+    return str(path)
+
+
+def _run(queue, result=None, error=None):
+    job = queue.claim()
+    if error is not None:
+        queue.fail(job["id"], error)
+    else:
+        queue.finish(job["id"], result)
+    return job["id"]
+
+
+def test_identical_jobs_are_deduplicated(queue):
+    job_id = queue.submit(PARAMS)
+    assert queue.submit(dict(PARAMS)) == job_id
+    assert queue.submit({**PARAMS, "cfg_scale": 6}) != job_id
+    queue.claim()
+    assert queue.submit(PARAMS) == job_id
+
+
+def test_complete_job_is_reused(queue, trailer):
+    job_id = queue.submit(PARAMS)
+    _run(queue, {"final_video": trailer, "failed_chapters": []})
+    assert queue.submit(PARAMS) == job_id
+    assert not queue.needs_retry(queue.get(job_id))
+
+
+@pytest.mark.parametrize("outcome", ["failed", "no final video", "final video deleted", "failed chapters"])
+def test_failed_and_incomplete_jobs_are_not_resubmitted_without_force(queue, trailer, outcome):
+    outcome = {
+        "failed": {"error": "ValueError: not an EPUB"},
+        "no final video": {"result": {"final_video": None, "failed_chapters": []}},
+        "final video deleted": {"result": {"final_video": trailer + ".deleted", "failed_chapters": []}},
+        "failed chapters": {"result": {"final_video": trailer, "failed_chapters": ["Chapter 3"]}},
+    }[outcome]
+    job_id = queue.submit(PARAMS)
+    _run(queue, **outcome)
+    assert queue.submit(PARAMS) == job_id
+    assert queue.needs_retry(queue.get(job_id))
+
+    retry_id = queue.submit(PARAMS, force=True)
+    assert retry_id != job_id
+    assert queue.get(retry_id)["status"] == QUEUED
+    # The retry is the job identical submissions now attach to
+    assert queue.submit(PARAMS) == retry_id
+
+
+def test_force_does_not_duplicate_pending_jobs(queue):
+    job_id = queue.submit(PARAMS)
+    assert queue.submit(PARAMS, force=True) == job_id
+    queue.claim()
+    assert queue.submit(PARAMS, force=True) == job_id
+
+
+def test_claim_takes_the_oldest_queued_job(queue):
+    first = queue.submit(PARAMS)
+    second = queue.submit({**PARAMS, "cfg_scale": 6})
+    job = queue.claim()
+    assert (job["id"], job["status"], job["worker_pid"]) == (first, RUNNING, os.getpid())
+    assert job["params"] == PARAMS
+    assert queue.claim()["id"] == second
+    assert queue.claim() is None
+
+
+def test_progress_preview_and_result(queue, trailer):
+    job_id = queue.submit(PARAMS)
+    queue.claim()
+    queue.update(job_id, 0.5, "Rendering chapter 2")
+    queue.set_preview(job_id, {"video": "preview.mp4", "chapters": 1})
+    job = queue.get(job_id)
+    assert (job["progress"], job["message"], job["preview"]) == (0.5, "Rendering chapter 2",
+                                                                 {"video": "preview.mp4", "chapters": 1})
+    queue.finish(job_id, {"final_video": trailer, "failed_chapters": []})
+    job = queue.get(job_id)
+    assert (job["status"], job["progress"], job["result"]["final_video"]) == (DONE, 1, trailer)
+    assert queue.get(job_id + 1) is None
+
+
+def test_failed_job_keeps_its_error(queue):
+    job_id = queue.submit(PARAMS)
+    _run(queue, error="RuntimeError: boom")
+    job = queue.get(job_id)
+    assert (job["status"], job["error"]) == (FAILED, "RuntimeError: boom")
+
+
+def test_requeue_running_only_requeues_jobs_of_dead_workers(queue):
+    alive = queue.submit(PARAMS)
+    dead = queue.submit({**PARAMS, "cfg_scale": 6})
+    legacy = queue.submit({**PARAMS, "cfg_scale": 7})
+    for _ in range(3):
+        queue.claim()
+    with sqlite3.connect(queue.db_path) as connection:
+        # No process has this pid; jobs claimed before workers were recorded have none
+        connection.execute("UPDATE jobs SET worker_pid = ? WHERE id = ?", (2 ** 22 + 1, dead))
+        connection.execute("UPDATE jobs SET worker_pid = NULL WHERE id = ?", (legacy,))
+
+    assert queue.requeue_running() == 2
+    assert [queue.get(job_id)["status"] for job_id in (alive, dead, legacy)] == [RUNNING, QUEUED, QUEUED]
+
+
+def test_databases_without_newer_columns_are_migrated(tmp_path):
+    db_path = str(tmp_path / "old.sqlite3")
+    with sqlite3.connect(db_path) as connection:
+        connection.execute(
+            "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, job_key TEXT NOT NULL, params TEXT NOT NULL,"
+            " status TEXT NOT NULL, progress REAL NOT NULL DEFAULT 0, message TEXT NOT NULL DEFAULT '',"
+            " result TEXT, error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+    queue = JobQueue(db_path)
+    job_id = queue.submit(PARAMS)
+    queue.claim()
+    queue.set_preview(job_id, {"chapters": 1})
+    assert queue.get(job_id)["preview"] == {"chapters": 1}
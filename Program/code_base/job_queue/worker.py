@@ -0,0 +1,92 @@
+"""
+Worker processes running queued book-to-trailer jobs.
+
+The Streamlit app starts them itself; they can also run on their own, from Program/code_base:
+
+    python -m job_queue.worker --db output_image_video/jobs.sqlite3 --processes 2
+"""
+import argparse
+import multiprocessing
+import os
+import time
+import traceback
+
+from dotenv import load_dotenv
+
+from job_queue.job_queue import JobQueue
+
+
+def run_job(queue: JobQueue, job: dict):
+    # Imported here so that a worker only loads the pipeline once it has something to do
+    from pipeline import run_book_pipeline
+
+    params = job["params"]
+    try:
+        result = run_book_pipeline(
+            book_path=params["book_path"],
+            openai_key=os.getenv("OPENAI_API_KEY"),
+            stability_key=os.getenv("STABILITY_API_KEY"),
+            cfg_scale=params["cfg_scale"],
+            motion_bucket_id=params["motion_bucket_id"],
+            max_in_flight=params.get("max_in_flight", 4),
+            progress=lambda fraction, message: queue.update(job["id"], fraction, message),
+            on_preview=lambda preview: queue.set_preview(job["id"], preview),
+            book_id=params.get("book_digest"),
+            summarizer=params.get("summarizer", "openai"),
+            trailer_profile=params.get("trailer_profile")
+        )
+    except Exception as e:
+        traceback.print_exc()
+        queue.fail(job["id"], f"{type(e).__name__}: {e}")
+    else:
+        queue.finish(job["id"], result)
+
+
+def run_worker(db_path: str, poll_interval: float = 1.0):
+    """
+    Takes jobs from the queue one at a time, forever.
+
+    :param db_path: Path to the job queue database
+    :param poll_interval: Seconds to wait before checking an empty queue again
+    """
+    load_dotenv()
+    queue = JobQueue(db_path)
+    while True:
+        job = queue.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+        print(f"Worker {os.getpid()} running job {job['id']}")
+        run_job(queue, job)
+
+
+def start_workers(db_path: str, processes: int = 2) -> list:
+    """
+    Requeues jobs interrupted by a previous shutdown and starts `processes` daemon worker processes.
+
+    :return: The started multiprocessing.Process objects
+    """
+    JobQueue(db_path).requeue_running()
+    # "spawn" rather than fork: the parent (e.g. the Streamlit server) runs many threads
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for _ in range(processes):
+        worker = context.Process(target=run_worker, args=(db_path,), daemon=True)
+        worker.start()
+        workers.append(worker)
+    return workers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=os.path.join("output_image_video", "jobs.sqlite3"))
+    parser.add_argument("--processes", type=int, default=2)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(args.db) or ".", exist_ok=True)
+    for worker in start_workers(args.db, args.processes):
+        worker.join()
+
+
+if __name__ == "__main__":
+    main()
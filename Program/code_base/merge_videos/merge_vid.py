@@ -1,19 +1,124 @@
 from moviepy.editor import VideoFileClip, concatenate_videoclips
+from moviepy.config import get_setting
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, Union
+import numpy as np
 import os
+import re
+import subprocess
+import tempfile
 
-def merge_videos(input_dir: str, book_name: str, output_path: str):
-    # List and sort video files based on the expected naming convention
-    video_files = sorted(
-        [
-            f for f in os.listdir(input_dir)
-            if f.startswith(f"{book_name}") and f.endswith(".mp4")
-        ],
-        key=lambda x: int(x.split('_')[-1].split('.')[0])
+
+@dataclass
+class EncodeProfile:
+    """
+    libx264 settings used when the trailer is re-encoded.
+
+    Attributes:
+        name (str): Profile name.
+        preset (str): x264 speed against compression trade-off, "ultrafast" to "veryslow".
+        crf (int): Constant rate factor, 0 (lossless) to 51; lower is better quality and larger files.
+        height (int | None): Output height in pixels, the width following the aspect ratio; None keeps the source
+            size. Clips are never upscaled.
+        threads (int | None): Encoder threads; None lets ffmpeg decide.
+    """
+    name: str
+    preset: str
+    crf: int
+    height: Optional[int] = None
+    threads: Optional[int] = None
+
+    def ffmpeg_params(self) -> list:
+        params = ["-crf", str(self.crf), "-movflags", "+faststart"]
+        if self.height:
+            params += ["-vf", f"scale=-2:'min(ih,{self.height})'"]
+        return params
+
+
+ENCODE_PROFILES = {
+    # Quick low-resolution encode to watch the trailer as early as possible
+    "preview": EncodeProfile("preview", "ultrafast", 30, height=360),
+    # libx264 defaults, as write_videofile encodes
+    "standard": EncodeProfile("standard", "medium", 23),
+    "high": EncodeProfile("high", "slow", 18),
+}
+
+
+def get_encode_profile(profile: Union[str, EncodeProfile]) -> EncodeProfile:
+    """
+    :param profile: Name of a profile in ENCODE_PROFILES, or an EncodeProfile
+    """
+    if isinstance(profile, EncodeProfile):
+        return profile
+    if profile not in ENCODE_PROFILES:
+        raise ValueError(f"Unknown encode profile {profile!r}; choose one of {', '.join(ENCODE_PROFILES)}.")
+    return ENCODE_PROFILES[profile]
+
+
+def _first_group(pattern: str, text: str):
+    match = re.search(pattern, text)
+    return match.group(1) if match else None
+
+
+def _probe_video(video_path: str):
+    """
+    Read the duration and the video stream parameters of a file from `ffmpeg -i`.
+
+    :return: (duration in seconds, stream signature) or None if the file has no readable video stream. Two files
+    with equal signatures (codec, profile, pixel format, size, frame rate, time base) can be concatenated by
+    stream copy.
+    """
+    result = subprocess.run([get_setting("FFMPEG_BINARY"), "-hide_banner", "-i", video_path],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace")
+    duration = re.search(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)", result.stderr)
+    video = re.search(r"Stream #\S+.*?: Video: (.*)", result.stderr)
+    if duration is None or video is None:
+        return None
+
+    hours, minutes, seconds = duration.groups()
+    stream = video.group(1)
+    signature = (
+        _first_group(r"^(\S+(?: \([^)]*\))?)", stream),  # codec and profile, e.g. "h264 (High)"
+        _first_group(r", (\w+)[(,]", stream),             # pixel format, e.g. "yuv420p"
+        _first_group(r", (\d+x\d+)", stream),
+        _first_group(r"([\d.]+k?) fps", stream),
+        _first_group(r"([\d.]+k?) tbn", stream),
     )
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds), signature
+
+
+def _merge_stream_copy(video_paths: list, output_path: str) -> bool:
+    """
+    Concatenate videos with the ffmpeg concat demuxer without re-encoding.
+
+    :return: True if ffmpeg succeeded.
+    """
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as list_file:
+        for video_path in video_paths:
+            escaped = os.path.abspath(video_path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+
+    try:
+        result = subprocess.run(
+            [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0",
+             "-i", list_file.name, "-map", "0:v", "-c", "copy", "-movflags", "+faststart", output_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace"
+        )
+    finally:
+        os.remove(list_file.name)
+
+    if result.returncode != 0:
+        print(f"Stream copy failed, falling back to re-encoding: {result.stderr.strip()}")
+        return False
+    return True
 
+
+def _merge_reencode(video_paths: list, output_path: str, profile: EncodeProfile = ENCODE_PROFILES["standard"]):
     video_clips = []
-    for video_file in video_files:
-        video_path = os.path.join(input_dir, video_file)
+    for video_path in video_paths:
+        video_file = os.path.basename(video_path)
         try:
             # Load video clip and validate duration
             clip = VideoFileClip(video_path)
@@ -33,7 +138,8 @@ def merge_videos(input_dir: str, book_name: str, output_path: str):
     try:
         # Concatenate and save the final video
         final_clip = concatenate_videoclips(video_clips, method="compose")
-        final_clip.write_videofile(output_path, codec="libx264", audio=False) # audio_codec="aac"
+        final_clip.write_videofile(output_path, codec="libx264", audio=False, preset=profile.preset,
+                                   threads=profile.threads, ffmpeg_params=profile.ffmpeg_params()) # audio_codec="aac"
         print(f"Successfully created merged video: {output_path}")
     except Exception as e:
         print(f"Error during concatenation or saving: {e}")
@@ -43,4 +149,138 @@ def merge_videos(input_dir: str, book_name: str, output_path: str):
             clip.close()
 
 
+def _parse_rate(rate: str):
+    """Frame rate as printed by ffmpeg ("24", "23.98", "1k"), or None."""
+    if not rate:
+        return None
+    return float(rate[:-1]) * 1000 if rate.endswith("k") else float(rate)
+
+
+def _fit_frame(frame: np.ndarray, width: int, height: int) -> np.ndarray:
+    """Centres a frame on a black canvas of the output size, like concatenate_videoclips(method="compose")."""
+    frame_height, frame_width = frame.shape[:2]
+    if (frame_width, frame_height) == (width, height):
+        return frame
+    canvas = np.zeros((height, width, 3), dtype=np.uint8)
+    top, left = (height - frame_height) // 2, (width - frame_width) // 2
+    canvas[top:top + frame_height, left:left + frame_width] = frame[:, :, :3]
+    return canvas
+
+
+def _merge_streaming(video_paths: list, output_path: str, max_open_clips: int = 2,
+                     profile: EncodeProfile = ENCODE_PROFILES["standard"]):
+    """
+    Re-encode the clips one after another, writing every frame straight to the encoder.
+
+    Output size and frame rate are taken from ffmpeg probes up front (largest size, highest frame rate, as the
+    "compose" concatenation does), so no clip has to be opened early. At most `max_open_clips` clips (the one
+    being encoded and the next ones, opened ahead) hold a reader process at any time, and only one frame is in
+    memory, so memory and file descriptors stay flat however many chapters the book has.
+    """
+    clips_info = []
+    for video_path in video_paths:
+        probe = _probe_video(video_path)
+        if probe is None or probe[0] <= 0:
+            print(f"Skipping {os.path.basename(video_path)}: no readable video stream.")
+            continue
+        clips_info.append((video_path, probe[1]))
+
+    if not clips_info:
+        print("No valid video clips were loaded.")
+        return
+
+    sizes = [tuple(int(side) for side in signature[2].split("x")) for _, signature in clips_info if signature[2]]
+    rates = [rate for rate in (_parse_rate(signature[3]) for _, signature in clips_info) if rate]
+    pending = deque(video_path for video_path, _ in clips_info)
+    open_clips = deque()
+
+    def open_ahead():
+        while pending and len(open_clips) < max(1, max_open_clips):
+            video_path = pending.popleft()
+            try:
+                open_clips.append((video_path, VideoFileClip(video_path, audio=False)))
+            except Exception as e:
+                print(f"Error loading video {os.path.basename(video_path)}: {e}. Skipping this file.")
+
+    open_ahead()
+    if not open_clips:
+        print("No valid video clips were loaded.")
+        return
+    width = max([size[0] for size in sizes] or [open_clips[0][1].w])
+    height = max([size[1] for size in sizes] or [open_clips[0][1].h])
+    fps = max(rates or [open_clips[0][1].fps])
+
+    try:
+        with FFMPEG_VideoWriter(output_path, (width, height), fps, codec="libx264", preset=profile.preset,
+                                threads=profile.threads, ffmpeg_params=profile.ffmpeg_params()) as writer:
+            while open_clips:
+                video_path, clip = open_clips.popleft()
+                try:
+                    for frame in clip.iter_frames(fps=fps, dtype="uint8"):
+                        writer.write_frame(_fit_frame(frame, width, height))
+                    print(f"Encoded video: {os.path.basename(video_path)} with duration: {clip.duration} seconds")
+                finally:
+                    clip.close()
+                open_ahead()
+        print(f"Successfully created merged video: {output_path}")
+    except Exception as e:
+        print(f"Error during concatenation or saving: {e}")
+    finally:
+        for _, clip in open_clips:
+            clip.close()
+
+
+def merge_videos(input_dir: str, book_name: str, output_path: str, stream_copy: bool = True, streaming: bool = True,
+                 max_open_clips: int = 2, profile: Union[str, EncodeProfile] = "standard"):
+    """
+    Merge the chapter videos "{book_name}_chapter_{n}.mp4" of `input_dir` into one video, in chapter order.
+
+    When every clip shares codec, pixel format, resolution, frame rate and time base (as the Stability clips do),
+    they are joined by stream copy, which only reads and writes the files. Otherwise, or if the stream copy fails,
+    the clips are decoded, composed and re-encoded with libx264 using the settings of `profile`.
+
+    :param input_dir: Folder holding the chapter videos
+    :param book_name: Prefix of the chapter video files
+    :param output_path: Path of the merged video
+    :param stream_copy: Allow the stream copy fast path
+    :param streaming: Re-encode clip by clip with bounded memory instead of opening every clip at once
+    :param max_open_clips: Clips open at the same time when re-encoding in streaming mode
+    :param profile: Encode profile (name in ENCODE_PROFILES or EncodeProfile) used when the clips are re-encoded;
+    pass stream_copy=False to always re-encode with it, e.g. to a smaller "preview" or a "high" quality trailer
+    """
+    profile = get_encode_profile(profile)
+    # List and sort video files based on the expected naming convention
+    video_files = sorted(
+        [
+            f for f in os.listdir(input_dir)
+            if f.startswith(f"{book_name}") and f.endswith(".mp4")
+        ],
+        key=lambda x: int(x.split('_')[-1].split('.')[0])
+    )
+    video_paths = [os.path.join(input_dir, video_file) for video_file in video_files]
+
+    if stream_copy:
+        probes = {video_path: _probe_video(video_path) for video_path in video_paths}
+        valid_paths = []
+        for video_path, probe in probes.items():
+            if probe is None or probe[0] <= 0:
+                print(f"Skipping {os.path.basename(video_path)}: no readable video stream.")
+            else:
+                valid_paths.append(video_path)
+
+        signatures = {probes[video_path][1] for video_path in valid_paths}
+        if len(signatures) == 1:
+            if _merge_stream_copy(valid_paths, output_path):
+                print(f"Successfully created merged video (stream copy): {output_path}")
+                return
+        elif len(signatures) > 1:
+            print("Clips differ in codec, resolution or frame rate; re-encoding.")
+        video_paths = valid_paths
+
+    if streaming:
+        _merge_streaming(video_paths, output_path, max_open_clips=max_open_clips, profile=profile)
+    else:
+        _merge_reencode(video_paths, output_path, profile=profile)
+
+
 #%%
@@ -0,0 +1,154 @@
+import math
+import os
+import subprocess
+import threading
+from typing import Callable, Dict, Optional
+
+from moviepy.config import get_setting
+
+from .merge_vid import _merge_stream_copy, _probe_video
+
+
+class ProgressiveTrailer:
+    """
+    Assembles the trailer while chapters are still rendering.
+
+    Chapters may finish in any order; as soon as a chapter and every chapter before it are done, its clip is
+    appended to the output, so the first chapter can be watched while the rest of the book renders. Two outputs
+    grow side by side, both by stream copy (no re-encoding):
+
+    - an HLS event playlist ("{book_name}_trailer.m3u8") with one MPEG-TS segment per chapter, for HLS players.
+      It is the live preview: it grows with every chapter, and only the new segment and the playlist are written.
+    - a preview MP4 ("{book_name}_preview.mp4"), for players that only take a file (such as st.video). Rewriting it
+      copies the whole preview, so it is only rewritten once the chapters ready reach `growth` times those it
+      holds (1, 2, 4, 8, ... chapters), and at finish(): the bytes written stay below `growth / (growth - 1)`
+      times the final preview instead of growing quadratically with the number of chapters. It is replaced
+      atomically, by concatenating the previous preview with the clips added since.
+
+    Failed chapters are skipped. Call finish() once every chapter has been added, to close the playlist and bring
+    the preview MP4 up to date.
+
+    Attributes:
+        book_name (str): Prefix of the output files.
+        output_dir (str): Folder the playlist, segments and preview are written to.
+        total (int): Number of chapters in the book.
+        on_update (Callable | None): Called as on_update(preview_path, preview_chapters) every time the preview
+            MP4 is rewritten.
+        growth (float): Factor by which the chapters ready must exceed those in the preview MP4 before it is
+            rewritten; 1 rewrites it after every append.
+    """
+
+    def __init__(self, book_name: str, output_dir: str, total: int,
+                 on_update: Optional[Callable[[str, int], None]] = None, growth: float = 2):
+        self.book_name = book_name
+        self.output_dir = output_dir
+        self.total = total
+        self.on_update = on_update
+        self.growth = growth
+        self.playlist_path = os.path.join(output_dir, f"{book_name}_trailer.m3u8")
+        self.preview_path = os.path.join(output_dir, f"{book_name}_preview.mp4")
+        self._ready: Dict[int, Optional[str]] = {}  # chapter index -> clip path, None if the chapter failed
+        self._next = 1
+        self._clips = []
+        self._pending = []  # Clips appended since the preview MP4 was last written
+        self.preview_chapters = 0  # Chapters in the preview MP4, behind chapters_ready if a stream copy failed
+        self._segments = []  # (file name, duration)
+        self._offset = 0.0
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        for path in (self.playlist_path, self.preview_path):
+            if os.path.exists(path):
+                os.remove(path)  # Never show the trailer of an earlier run
+
+    @property
+    def chapters_ready(self) -> int:
+        return len(self._clips)
+
+    def add(self, index: int, clip_path: Optional[str]):
+        """
+        Records a finished chapter and appends every chapter that is now next in line.
+
+        :param index: 1-based chapter number
+        :param clip_path: Path of the chapter video, or None if the chapter failed
+        """
+        with self._lock:
+            self._ready[index] = clip_path
+            appended = updated = False
+            while self._next in self._ready:
+                path = self._ready.pop(self._next)
+                if path is not None and self._append_segment(self._next, path):
+                    self._clips.append(path)
+                    self._pending.append(path)
+                    appended = True
+                self._next += 1
+
+            if appended:
+                self._write_playlist(ended=False)
+                if self.chapters_ready >= self.growth * self.preview_chapters:
+                    updated = self._write_preview()
+
+        if updated and self.on_update is not None:
+            self.on_update(self.preview_path, self.preview_chapters)
+
+    def finish(self):
+        """Closes the playlist, so players stop waiting for more segments, and writes the last preview MP4."""
+        with self._lock:
+            self._write_playlist(ended=True)
+            updated = bool(self._pending) and self._write_preview()
+
+        if updated and self.on_update is not None:
+            self.on_update(self.preview_path, self.preview_chapters)
+
+    def _append_segment(self, index: int, clip_path: str) -> bool:
+        probe = _probe_video(clip_path)
+        if probe is None or probe[0] <= 0:
+            print(f"Not adding chapter {index} to the preview: no readable video stream.")
+            return False
+
+        segment_name = f"{self.book_name}_segment_{index:04d}.ts"
+        # Offset the timestamps so that they keep increasing across segments
+        result = subprocess.run(
+            [get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-i", clip_path, "-map", "0:v", "-c", "copy",
+             "-output_ts_offset", f"{self._offset:.3f}", "-f", "mpegts", os.path.join(self.output_dir, segment_name)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, errors="replace"
+        )
+        if result.returncode != 0:
+            print(f"Not adding chapter {index} to the preview: {result.stderr.strip()}")
+            return False
+
+        self._segments.append((segment_name, probe[0]))
+        self._offset += probe[0]
+        return True
+
+    def _write_playlist(self, ended: bool):
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{max([math.ceil(duration) for _, duration in self._segments] or [1])}",
+            "#EXT-X-MEDIA-SEQUENCE:0",
+        ]
+        for position, (segment_name, duration) in enumerate(self._segments):
+            if position:
+                lines.append("#EXT-X-DISCONTINUITY")  # Every chapter is a separate encode
+            lines.append(f"#EXTINF:{duration:.3f},")
+            lines.append(segment_name)
+        if ended:
+            lines.append("#EXT-X-ENDLIST")
+
+        tmp_path = f"{self.playlist_path}.tmp"
+        with open(tmp_path, "w") as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.playlist_path)
+
+    def _write_preview(self) -> bool:
+        tmp_path = f"{self.preview_path}.tmp.mp4"
+        inputs = ([self.preview_path] if self.preview_chapters else []) + self._pending
+        if _merge_stream_copy(inputs, tmp_path):
+            os.replace(tmp_path, self.preview_path)
+            self.preview_chapters = len(self._clips)
+            self._pending = []
+            return True
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
@@ -0,0 +1,105 @@
+import subprocess
+
+import pytest
+from moviepy.config import get_setting
+
+from . import merge_vid
+from .merge_vid import _probe_video, merge_videos
+
+
+def _clip(path, size="128x72", rate=24, seconds=1):
+    subprocess.run([get_setting("FFMPEG_BINARY"), "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", f"testsrc=size={size}:rate={rate}:duration={seconds}", "-pix_fmt", "yuv420p",
+                    "-c:v", "libx264", str(path)], check=True)
+    return str(path)
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Records which merge path ran, still running it."""
+    calls = []
+    for name in ("_merge_stream_copy", "_merge_streaming", "_merge_reencode"):
+        original = getattr(merge_vid, name)
+
+        def spy(*args, _name=name, _original=original, **kwargs):
+            calls.append(_name)
+            return _original(*args, **kwargs)
+
+        monkeypatch.setattr(merge_vid, name, spy)
+    return calls
+
+
+def test_probe_video(tmp_path):
+    duration, signature = _probe_video(_clip(tmp_path / "a.mp4", seconds=2))
+    assert duration == pytest.approx(2, abs=0.1)
+    assert signature[1:4] == ("yuv420p", "128x72", "24")
+    (tmp_path / "broken.mp4").write_bytes(b"not a video")
+    assert _probe_video(str(tmp_path / "broken.mp4")) is None
+
+
+def test_compatible_clips_are_joined_by_stream_copy(tmp_path, calls):
+    for number in (1, 2, 10):
+        _clip(tmp_path / f"book_chapter_{number}.mp4")
+    output = str(tmp_path / "merged.mp4")
+    merge_videos(str(tmp_path), "book", output)
+    assert calls == ["_merge_stream_copy"]
+    assert _probe_video(output)[0] == pytest.approx(3, abs=0.1)
+
+
+def test_unreadable_clips_are_skipped(tmp_path, calls):
+    _clip(tmp_path / "book_chapter_1.mp4")
+    (tmp_path / "book_chapter_2.mp4").write_bytes(b"not a video")
+    _clip(tmp_path / "book_chapter_3.mp4")
+    output = str(tmp_path / "merged.mp4")
+    merge_videos(str(tmp_path), "book", output)
+    assert calls == ["_merge_stream_copy"]
+    assert _probe_video(output)[0] == pytest.approx(2, abs=0.1)
+
+
+def test_mismatched_clips_are_re_encoded(tmp_path, calls):
+    _clip(tmp_path / "book_chapter_1.mp4")
+    _clip(tmp_path / "book_chapter_2.mp4", size="160x90")
+    merge_videos(str(tmp_path), "book", str(tmp_path / "merged.mp4"))
+    assert calls == ["_merge_streaming"]
+
+
+def test_stream_copy_can_be_disabled(tmp_path, calls):
+    _clip(tmp_path / "book_chapter_1.mp4")
+    _clip(tmp_path / "book_chapter_2.mp4")
+    merge_videos(str(tmp_path), "book", str(tmp_path / "merged.mp4"), stream_copy=False, streaming=False)
+    assert calls == ["_merge_reencode"]
+
+
+def test_streaming_merge_composes_clips_of_different_sizes(tmp_path):
+    _clip(tmp_path / "book_chapter_1.mp4", size="128x72")
+    _clip(tmp_path / "book_chapter_2.mp4", size="160x90", rate=30)
+    output = str(tmp_path / "merged.mp4")
+    merge_videos(str(tmp_path), "book", output, streaming=True)
+    duration, signature = _probe_video(output)
+    assert duration == pytest.approx(2, abs=0.15)
+    # Largest size and highest frame rate, as concatenate_videoclips(method="compose")
+    assert signature[2:4] == ("160x90", "30")
+
+
+def test_streaming_merge_keeps_few_clips_open(tmp_path, monkeypatch):
+    for number in range(1, 6):
+        _clip(tmp_path / f"book_chapter_{number}.mp4", size="128x72" if number % 2 else "160x90")
+    open_clips, most_open = set(), []
+    original = merge_vid.VideoFileClip
+
+    class TrackedClip(original):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            open_clips.add(id(self))
+            most_open.append(len(open_clips))
+
+        def close(self):
+            open_clips.discard(id(self))
+            super().close()
+
+    monkeypatch.setattr(merge_vid, "VideoFileClip", TrackedClip)
+    output = str(tmp_path / "merged.mp4")
+    merge_videos(str(tmp_path), "book", output, max_open_clips=2)
+    assert max(most_open) <= 2
+    assert not open_clips
+    assert _probe_video(output)[0] == pytest.approx(5, abs=0.2)
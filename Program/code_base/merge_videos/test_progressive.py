@@ -0,0 +1,46 @@
+import pytest
+
+from .merge_vid import _probe_video
+from .progressive import ProgressiveTrailer
+from .test_merge_vid import _clip
+
+
+@pytest.fixture
+def clips(tmp_path):
+    return [_clip(tmp_path / f"book_chapter_{number}.mp4") for number in range(1, 7)]
+
+
+def test_chapters_are_appended_in_order(tmp_path, clips):
+    updates = []
+    trailer = ProgressiveTrailer("book", str(tmp_path / "merged"), 3,
+                                 on_update=lambda path, chapters: updates.append(chapters), growth=1)
+    trailer.add(2, clips[1])
+    assert updates == [] and trailer.chapters_ready == 0
+    trailer.add(1, clips[0])
+    assert updates == [2]
+    trailer.add(3, None)
+    trailer.finish()
+    assert updates == [2]
+    assert _probe_video(trailer.preview_path)[0] == pytest.approx(2, abs=0.1)
+
+    with open(trailer.playlist_path) as file:
+        playlist = file.read()
+    assert playlist.count("#EXTINF") == 2
+    assert playlist.rstrip().endswith("#EXT-X-ENDLIST")
+
+
+def test_preview_mp4_is_rewritten_as_it_doubles(tmp_path, clips):
+    updates = []
+    trailer = ProgressiveTrailer("book", str(tmp_path / "merged"), 6,
+                                 on_update=lambda path, chapters: updates.append(chapters))
+    for index, clip in enumerate(clips, start=1):
+        trailer.add(index, clip)
+        with open(trailer.playlist_path) as file:
+            # The playlist grows with every chapter
+            assert file.read().count("#EXTINF") == index
+    assert updates == [1, 2, 4]
+    assert trailer.preview_chapters == 4
+
+    trailer.finish()
+    assert updates == [1, 2, 4, 6]
+    assert _probe_video(trailer.preview_path)[0] == pytest.approx(6, abs=0.2)
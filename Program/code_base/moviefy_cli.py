@@ -0,0 +1,210 @@
+"""
+Headless batch rendering: turns a whole library of EPUBs into trailers without the Streamlit app.
+
+Books are submitted to a job queue of their own (not the app's, so that neither requeues or stops the other's jobs)
+and rendered by a shared pool of worker processes, one book per process at a time. The OpenAI and Stability budgets
+given on the command line are global: they are split evenly between the processes. Books already rendered with the
+same settings are not rendered again, so running the same command after an interruption, a failure or a skipped file
+resumes where the previous run stopped. A book counts as failed when its trailer is missing or any of its chapters
+failed, and is rendered again by the next run. A JSON report of the run is written at the end. A book that was
+already rendered with the same settings under another path or by the app is picked up from its stored manifest.
+
+Run from Program/code_base:
+
+    python moviefy_cli.py ~/books --processes 3 --max-in-flight 12 --report overnight.json
+    python moviefy_cli.py a.epub b.epub --list more_books.txt
+    python moviefy_cli.py ~/books --draft
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zipfile
+
+from dotenv import load_dotenv
+
+from job_queue.job_queue import JobQueue, DONE, FAILED
+from job_queue.worker import start_workers
+from merge_videos.merge_vid import ENCODE_PROFILES
+from pipeline import OUTPUT_ROOT, book_digest
+
+
+def find_epubs(paths: list, list_files: list = (), recursive: bool = False) -> list:
+    """
+    Expands files, directories and list files (one path per line) into EPUB paths, without duplicates.
+    """
+    candidates = list(paths)
+    for list_file in list_files:
+        with open(list_file) as file:
+            candidates += [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+    books = []
+    for path in candidates:
+        path = os.path.abspath(os.path.expanduser(path))
+        if os.path.isdir(path):
+            for folder, _, file_names in os.walk(path):
+                books += [os.path.join(folder, name) for name in sorted(file_names) if name.lower().endswith(".epub")]
+                if not recursive:
+                    break
+        else:
+            books.append(path)
+    return list(dict.fromkeys(books))
+
+
+def check_epub(path: str):
+    """
+    :return: Why the file cannot be rendered, or None if it looks like an EPUB
+    """
+    if not os.path.isfile(path):
+        return "file not found"
+    if not zipfile.is_zipfile(path):
+        return "not an EPUB (zip) file"
+    with zipfile.ZipFile(path) as zf:
+        if "META-INF/container.xml" not in zf.namelist():
+            return "not an EPUB (no META-INF/container.xml)"
+    return None
+
+
+def run_batch(books: list, queue: JobQueue, cfg_scale: int, motion_bucket_id: int, max_in_flight: int,
+              poll_interval: float = 5.0, summarizer: str = "openai", trailer_profile: str = None) -> list:
+    """
+    Submits every book and waits until each job is done or failed. Done jobs without a complete trailer are
+    reported as failed.
+
+    :return: One report entry per book, in input order
+    """
+    entries = []
+    for book_path in books:
+        entry = {"book": book_path, "status": "skipped", "job_id": None}
+        reason = check_epub(book_path)
+        if reason is not None:
+            entry["error"] = reason
+            print(f"Skipping {book_path}: {reason}")
+        else:
+            # Same parameters as the app submits, so that both share rendered books through their manifests
+            params = {
+                "book_path": book_path,
+                "book_digest": book_digest(book_path),
+                "cfg_scale": cfg_scale,
+                "motion_bucket_id": motion_bucket_id,
+                "max_in_flight": max_in_flight,
+                "summarizer": summarizer,
+            }
+            if trailer_profile:
+                params["trailer_profile"] = trailer_profile
+            entry["job_id"] = queue.submit(params)
+            if queue.needs_retry(queue.get(entry["job_id"])):
+                # Resuming: a book that failed or came out incomplete in an earlier run is rendered again
+                entry["job_id"] = queue.submit(params, force=True)
+        entries.append(entry)
+
+    waiting = {entry["job_id"]: entry for entry in entries if entry["job_id"] is not None}
+    last_messages = {}
+    while waiting:
+        for job_id, entry in list(waiting.items()):
+            job = queue.get(job_id)
+            if job["message"] and last_messages.get(job_id) != job["message"]:
+                last_messages[job_id] = job["message"]
+                print(f"[{os.path.basename(entry['book'])}] {job['message']}")
+            if job["status"] in (DONE, FAILED):
+                entry["status"] = job["status"]
+                entry["error"] = job["error"]
+                if job["status"] == DONE and not queue.is_complete(job["result"]):
+                    failed_chapters = (job["result"] or {}).get("failed_chapters")
+                    entry["status"] = FAILED
+                    entry["error"] = (f"{len(failed_chapters)} chapters failed" if failed_chapters
+                                      else "no final video")
+                entry["result"] = job["result"]
+                entry["seconds"] = job["updated_at"] - job["created_at"]
+                del waiting[job_id]
+        if waiting:
+            time.sleep(poll_interval)
+    return entries
+
+
+def write_report(path: str, entries: list, settings: dict, started: float):
+    counts = {status: sum(1 for entry in entries if entry["status"] == status) for status in ("done", "failed",
+                                                                                              "skipped")}
+    report = {
+        "started_at": started,
+        "finished_at": time.time(),
+        "seconds": time.time() - started,
+        "settings": settings,
+        "counts": counts,
+        "failed_chapters": sum(len((entry.get("result") or {}).get("failed_chapters", [])) for entry in entries),
+        "books": entries,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(report, file, indent=2, default=str)
+    os.replace(tmp_path, path)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", help="EPUB files or folders holding EPUBs")
+    parser.add_argument("--list", action="append", default=[], help="Text file with one EPUB path per line")
+    parser.add_argument("--recursive", action="store_true", help="Also look for EPUBs in sub-folders")
+    parser.add_argument("--processes", type=int, default=2, help="Books rendered at the same time")
+    parser.add_argument("--max-in-flight", type=int, default=8,
+                        help="Chapters rendered at the same time over all books")
+    parser.add_argument("--openai-rpm", type=int, default=int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500")),
+                        help="OpenAI requests per minute over all books")
+    parser.add_argument("--openai-tpm", type=int, default=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "60000")),
+                        help="OpenAI tokens per minute over all books")
+    parser.add_argument("--cfg-scale", type=int, default=5)
+    parser.add_argument("--motion-bucket-id", type=int, default=50)
+    parser.add_argument("--draft", action="store_true",
+                        help="Summarize chapters locally (extractive, no OpenAI requests) for fast draft trailers")
+    parser.add_argument("--trailer-profile", choices=sorted(ENCODE_PROFILES),
+                        help="Re-encode every trailer with this profile instead of joining the clips by stream copy")
+    parser.add_argument("--db", default=os.path.join(OUTPUT_ROOT, "cli_jobs.sqlite3"),
+                        help="Job queue database (the app's is jobs.sqlite3)")
+    parser.add_argument("--report", default=None, help="Path of the JSON run report")
+    parser.add_argument("--poll-interval", type=float, default=5.0)
+    args = parser.parse_args()
+
+    books = find_epubs(args.paths, args.list, args.recursive)
+    if not books:
+        parser.error("no EPUB files given")
+
+    load_dotenv()
+    started = time.time()
+    processes = max(1, min(args.processes, len(books)))
+    max_in_flight = max(1, args.max_in_flight // processes)
+
+    # Worker processes read their per-process share of the global budgets from the environment
+    os.environ["OPENAI_REQUESTS_PER_MINUTE"] = str(max(1, args.openai_rpm // processes))
+    os.environ["OPENAI_TOKENS_PER_MINUTE"] = str(max(1, args.openai_tpm // processes))
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    queue = JobQueue(args.db)
+    workers = start_workers(args.db, processes=processes)
+    print(f"Rendering {len(books)} books with {processes} workers, {max_in_flight} chapters in flight each")
+
+    try:
+        entries = run_batch(books, queue, args.cfg_scale, args.motion_bucket_id, max_in_flight,
+                            poll_interval=args.poll_interval, summarizer="extractive" if args.draft else "openai",
+                            trailer_profile=args.trailer_profile)
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+    settings = {
+        "processes": processes, "max_in_flight_per_book": max_in_flight, "openai_rpm": args.openai_rpm,
+        "openai_tpm": args.openai_tpm, "cfg_scale": args.cfg_scale, "motion_bucket_id": args.motion_bucket_id,
+        "draft": args.draft, "trailer_profile": args.trailer_profile, "db": os.path.abspath(args.db),
+    }
+    report_path = args.report or os.path.join(OUTPUT_ROOT, "reports",
+                                              time.strftime("run_%Y%m%d_%H%M%S.json", time.localtime(started)))
+    report = write_report(report_path, entries, settings, started)
+    print(f"Done: {report['counts']['done']}, failed: {report['counts']['failed']}, "
+          f"skipped: {report['counts']['skipped']}. Report: {report_path}")
+    sys.exit(0 if report["counts"]["failed"] == 0 and report["counts"]["skipped"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import os
+import time
+from dataclasses import asdict, replace
+from typing import Callable, Optional
+
+from instrumentation import metrics
+from summarise_chapters.chapter_summary import ChaptersSummaryAI
+from summarise_chapters.epub_index import EpubIndex
+from summarise_chapters.extractive import ChaptersSummaryLocal, TextRankSummarizer
+from summarise_chapters.model_router import ModelRouter
+from summarise_chapters.rate_limiter import RateLimiter
+from summarise_chapters.summary_store import SummaryStore
+from generate_video.generation_cache import GenerationCache
+from generate_video.render_chapters import render_chapters
+from merge_videos.merge_vid import EncodeProfile, get_encode_profile, merge_videos
+from merge_videos.progressive import ProgressiveTrailer
+
+OUTPUT_ROOT = "output_image_video"
+MANIFEST_NAME = "manifest.json"
+
+
+def book_digest(book_path: str) -> str:
+    """
+    SHA-256 of an EPUB file, read in chunks; equal to pipeline_state.file_digest of the same uploaded bytes.
+    """
+    digest = hashlib.sha256()
+    with open(book_path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def render_key(book_id: str, cfg_scale: float, motion_bucket_id: float, summarizer: str = "openai",
+               trailer_profile: Optional[str] = None) -> str:
+    """
+    Identifies a trailer: the book content and everything that changes its summaries or videos.
+    """
+    params = {
+        "book": book_id,
+        "cfg_scale": cfg_scale,
+        "motion_bucket_id": motion_bucket_id,
+        "summarizer": summarizer,
+        "trailer_profile": trailer_profile,
+        "prompt_version": ChaptersSummaryAI.prompt_version,
+        # Model routing decides which model writes each summary
+        "routing": {name: os.getenv(name) for name in ("OPENAI_MODELS", "OPENAI_TOKEN_BUDGET", "OPENAI_COST_BUDGET",
+                                                       "OPENAI_LATENCY_BUDGET", "OPENAI_BATCH_TOKENS")},
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def encode_profile(name: str) -> EncodeProfile:
+    """
+    Encode profile `name` with the thread count of MOVIEFY_ENCODE_THREADS, if set.
+    """
+    profile = get_encode_profile(name)
+    threads = os.getenv("MOVIEFY_ENCODE_THREADS")
+    return replace(profile, threads=int(threads)) if threads else profile
+
+
+def book_folders(book_id: str, render_id: str, output_root: str = OUTPUT_ROOT) -> dict:
+    """
+    Creates and returns the artifact folders of a book, keyed by content hash rather than file name, so that two
+    books with the same file name never overwrite each other and a re-upload under another name finds its files.
+
+    Images, chapter videos and the merged trailer depend on the render settings, not only on the book (images are
+    generated from the chapter summaries, which change with the summarizer, prompt and model routing), so they all
+    live in a folder per render.
+
+    :param book_id: Content hash of the EPUB (book_digest)
+    :param render_id: Short render key (render_key)
+    :param output_root: Folder holding the artifacts of every book
+    :return: {"book": ..., "render": ..., "images": ..., "videos": ..., "merged": ...}, each ending with a separator
+    """
+    folders = {
+        "book": f"{output_root}/{book_id}/",
+        "render": f"{output_root}/{book_id}/{render_id}/",
+        "images": f"{output_root}/{book_id}/{render_id}/Images/",
+        "videos": f"{output_root}/{book_id}/{render_id}/Videos/",
+        "merged": f"{output_root}/{book_id}/{render_id}/Merged_videos/",
+    }
+    for folder in folders.values():
+        os.makedirs(folder, exist_ok=True)
+    return folders
+
+
+def load_manifest(render_folder: str) -> Optional[dict]:
+    """
+    :return: The result of a complete earlier render, if its trailer is still on disk
+    """
+    try:
+        with open(os.path.join(render_folder, MANIFEST_NAME)) as file:
+            result = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    return result if result.get("final_video") and os.path.exists(result["final_video"]) else None
+
+
+def save_manifest(render_folder: str, result: dict):
+    path = os.path.join(render_folder, MANIFEST_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(result, file, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def run_book_pipeline(book_path: str, openai_key: str, stability_key: str, cfg_scale: float, motion_bucket_id: float,
+                      max_in_flight: int = 4, output_root: str = OUTPUT_ROOT,
+                      progress: Optional[Callable[[float, str], None]] = None,
+                      on_preview: Optional[Callable[[dict], None]] = None, book_id: Optional[str] = None,
+                      summarizer: str = "openai", trailer_profile: Optional[str] = None) -> dict:
+    """
+    Runs extract -> summarize -> render -> merge for one EPUB. Summarizing and rendering overlap: each chapter is
+    rendered as soon as its summary and all earlier ones are ready.
+
+    Artifacts are stored under the content hash of the EPUB. A complete render is recorded in a manifest next to
+    its trailer, and running the same book (under any file name) with the same settings again returns it at once.
+    Otherwise summaries and Stability outputs go through the persistent summary store and generation cache, so
+    running the same book again only pays for what changed (e.g. only the videos after a slider change).
+
+    :param book_path: Path to the EPUB file
+    :param openai_key: OpenAI API key
+    :param stability_key: Stability AI API key
+    :param cfg_scale: [1, 10] How strongly the video sticks to the original image.
+    :param motion_bucket_id: [1, 255] Amount of motion in the output video.
+    :param max_in_flight: Maximum number of chapters rendered concurrently
+    :param output_root: Folder holding the artifacts of every book
+    :param progress: Called as progress(fraction, message) as the pipeline advances
+    :param on_preview: Called as on_preview({"video", "playlist", "chapters"}) whenever the preview MP4 grows (each
+    time the chapters rendered in order double, and once rendering ends); the HLS playlist grows with every chapter
+    :param book_id: Content hash of the EPUB if the caller already has it (e.g. from the upload buffer)
+    :param summarizer: "openai" summarizes with the OpenAI API, falling back to local extractive summaries for
+    chapters that fail or exceed the budget; "extractive" summarizes on the CPU only, for a fast draft trailer
+    :param trailer_profile: Encode profile of the trailer (preview, standard or high; defaults to
+    MOVIEFY_ENCODE_PROFILE); None joins the chapter clips by stream copy whenever they allow it
+    :return: {"summaries": [...], "skipped_items": [{"position", "path", "heading", "chars", "reason"}, ...],
+    "summary_spend": projected against actual tokens, cost and time (ModelRouter.report, None for extractive
+    summaries), "failed_chapters": [...],
+    "final_video": path or None, "preview": the last preview, "timings": seconds spent in each stage ("summarize"
+    and "render" both count from the start of summarization, as they overlap), and "first_preview" seconds from
+    the start of the run until the first chapter could be watched}, plus
+    "reused": True when an earlier render was returned
+
+    The trailer is joined by stream copy when the chapter clips allow it, or re-encoded with `trailer_profile`.
+    Whenever the full trailer is encoded with a profile other than "preview" (always when `trailer_profile` is set),
+    a quick low-resolution preview of it is published through on_preview first.
+
+    Per-stage and per-chapter spans are appended to {output_root}/metrics/traces.jsonl and the process's counters
+    and latency histograms are written to {output_root}/metrics/moviefy_<pid>.prom when the run ends, also if it fails.
+    """
+    def report(fraction: float, message: str):
+        print(message)
+        if progress is not None:
+            progress(fraction, message)
+
+    # Caches shared across books and runs, keyed by request parameters and chapter content
+    generation_cache_folder = os.path.join(output_root, ".generation_cache")
+    summary_store_path = os.path.join(output_root, "summaries.sqlite3")
+
+    # Checked before any work, so that a misspelled profile fails the job at once
+    trailer_profile = trailer_profile or os.getenv("MOVIEFY_ENCODE_PROFILE") or None
+    final_profile = encode_profile(trailer_profile or "standard")
+
+    book_id = book_id or book_digest(book_path)
+    render_id = render_key(book_id, cfg_scale, motion_bucket_id, summarizer, trailer_profile)[:16]
+    book_name = book_id[:12]  # Prefix of the chapter and trailer files
+    folders = book_folders(book_id, render_id, output_root)
+
+    previous = load_manifest(folders["render"])
+    if previous is not None:
+        report(1.0, "Final video created! (reused from an identical earlier render)")
+        return dict(previous, reused=True)
+
+    try:
+        timings = {}
+        run_start = time.perf_counter()
+
+        # Step 1: Extract chapters
+        stage_start = time.perf_counter()
+        report(0.0, "Extracting chapters...")
+        # Container, OPF and XHTML are parsed once per book; later runs read the chapters from the sidecar index
+        with metrics.stage("index", book=book_name):
+            index = EpubIndex.load_or_build(book_path, folders["book"], digest=book_id)
+        if summarizer == "extractive":
+            summarizer = ChaptersSummaryLocal(book_file_path=book_path, index=index)
+        else:
+            summary_workers = int(os.getenv("OPENAI_MAX_WORKERS", "8"))
+            summarizer = ChaptersSummaryAI(
+                book_file_path=book_path,
+                open_ai_key=openai_key,
+                max_workers=summary_workers,
+                rate_limiter=RateLimiter(
+                    requests_per_minute=int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "500")),
+                    tokens_per_minute=int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "60000"))
+                ),
+                store=SummaryStore(summary_store_path),
+                # Model per chapter under the OPENAI_TOKEN_BUDGET / OPENAI_COST_BUDGET / OPENAI_LATENCY_BUDGET of a book
+                router=ModelRouter.from_env(os.environ, concurrency=summary_workers),
+                index=index,
+                # Short chapters share one request of up to OPENAI_BATCH_TOKENS chapter tokens; 0 sends each on its own
+                batch_tokens=int(os.getenv("OPENAI_BATCH_TOKENS", "2000")) or None,
+                # Failed requests and chapters left out by the token budget still get a summary of their own text
+                fallback=TextRankSummarizer()
+            )
+        chapters = summarizer.extract_chapters()
+        skipped_items = [asdict(item) for item in summarizer.skipped_items]
+        report(0.05, f"Summarizing and rendering {len(chapters)} chapters "
+                     f"({len(skipped_items)} non-story spine items skipped)...")
+
+        # Steps 2 and 3 overlap: every summary goes to image and video generation as soon as it and all earlier ones
+        # are ready, instead of waiting for the whole book to be summarized
+        chapter_summaries = []
+
+        def stream_summaries():
+            for summary in summarizer.iter_summaries(chapters):
+                chapter_summaries.append(summary)
+                yield summary
+            timings["summarize"] = time.perf_counter() - stage_start
+            if isinstance(summarizer, ChaptersSummaryAI):
+                store_stats = summarizer.store.stats()
+                spend = summarizer.router.report()
+                print(f"Summarization projected {spend['projected']['tokens']} tokens, "
+                      f"${spend['projected']['cost']:.4f}, {spend['projected']['seconds']:.0f} s; "
+                      f"actual {spend['actual']['tokens']} tokens, ${spend['actual']['cost']:.4f}, "
+                      f"{spend['actual']['seconds']:.0f} s; models {spend['models']}")
+                print(f"Summaries generated for {len(chapter_summaries)} chapters "
+                      f"({store_stats['hits']} reused, {store_stats['misses']} newly summarized)")
+
+        def report_chapter(result, completed, total):
+            if result.ok:
+                message = f"Generated video for {result.chapter_name}"
+            else:
+                message = f"Error generating video for {result.chapter_name}: {result.error}"
+            report(0.05 + 0.85 * completed / total, message)
+
+        # Chapters are appended to the preview as soon as they and all earlier ones are done
+        preview = {}
+
+        def preview_updated(preview_path, chapters_ready):
+            if not preview:
+                timings["first_preview"] = time.perf_counter() - run_start
+            preview.update(video=preview_path, playlist=trailer.playlist_path, chapters=chapters_ready)
+            if on_preview is not None:
+                on_preview(dict(preview))
+
+        trailer = ProgressiveTrailer(book_name, folders["merged"], len(chapters), on_update=preview_updated)
+
+        def render_progress(result, completed, total):
+            trailer.add(result.index, result.video_path if result.ok else None)
+            report_chapter(result, completed, total)
+
+        render_results = render_chapters(
+            stability_api_key=stability_key,
+            chapter_summaries=stream_summaries(),
+            total=len(chapters),
+            book_name=book_name,
+            output_path_images=folders["images"],
+            output_path_video=folders["videos"],
+            cfg_scale=cfg_scale,
+            motion_bucket_id=motion_bucket_id,
+            max_in_flight=max_in_flight,
+            on_progress=render_progress,
+            cache=GenerationCache(generation_cache_folder)
+        )
+        trailer.finish()
+        timings["render"] = time.perf_counter() - stage_start
+        summary_spend = summarizer.router.report() if isinstance(summarizer, ChaptersSummaryAI) else None
+
+        # Step 4: Merge videos into a single video
+        rendered = sum(1 for result in render_results if result.ok)
+        # A profile always re-encodes the trailer, and so does joining clips that could not all be joined by stream
+        # copy while rendering: publish a quick low-resolution version first, the full-quality encode takes much
+        # longer. Only the preview profile is quick enough to go without.
+        reencode = trailer_profile is not None or trailer.preview_chapters < rendered
+        if rendered and reencode and final_profile.name != "preview":
+            stage_start = time.perf_counter()
+            report(0.9, "Encoding a quick preview of the trailer...")
+            preview_tmp_path = f"{trailer.preview_path}.tmp.mp4"
+            with metrics.stage("merge_preview", book=book_name):
+                merge_videos(
+                    input_dir=folders["videos"],
+                    book_name=book_name,
+                    output_path=preview_tmp_path,
+                    profile=encode_profile("preview")
+                )
+            if os.path.exists(preview_tmp_path):
+                os.replace(preview_tmp_path, trailer.preview_path)
+                preview_updated(trailer.preview_path, rendered)
+            timings["merge_preview"] = time.perf_counter() - stage_start
+
+        stage_start = time.perf_counter()
+        report(0.92, "Merging all chapter videos into a final video..." if trailer_profile is None
+               else f"Encoding the full-quality trailer ({final_profile.name} profile)...")
+        output_merged_video_path = os.path.join(folders["merged"], f"{book_name}_final_video.mp4")
+        if os.path.exists(output_merged_video_path):
+            os.remove(output_merged_video_path)  # Never report a trailer left over from an earlier run
+        with metrics.stage("merge", book=book_name, profile=final_profile.name):
+            merge_videos(
+                input_dir=folders["videos"],
+                book_name=book_name,
+                output_path=output_merged_video_path,
+                stream_copy=trailer_profile is None,
+                profile=final_profile
+            )
+        timings["merge"] = time.perf_counter() - stage_start
+        final_video = output_merged_video_path if os.path.exists(output_merged_video_path) else None
+        report(1.0, "Final video created!" if final_video else "Failed to create the final video.")
+
+        result = {
+            "book_id": book_id,
+            "render_id": render_id,
+            "summaries": chapter_summaries,
+            "skipped_items": skipped_items,
+            "summary_spend": summary_spend,
+            "failed_chapters": [result.chapter_name for result in render_results if not result.ok],
+            "final_video": final_video,
+            "preview": preview or None,
+            "timings": timings,
+            "reused": False,
+        }
+        if final_video and not result["failed_chapters"]:
+            # Incomplete trailers are not recorded, so that the next run retries the failed chapters
+            save_manifest(folders["render"], result)
+        return result
+    finally:
+        # Failed runs are exported too, so that their spans and error counters are not lost
+        metrics.export(os.path.join(output_root, "metrics"))
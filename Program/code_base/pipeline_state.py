@@ -0,0 +1,28 @@
+import hashlib
+
+import streamlit as st
+
+
+def file_digest(buffer) -> str:
+    """
+    SHA-256 of an uploaded file's content (e.g. uploaded_file.getbuffer()).
+    """
+    return hashlib.sha256(buffer).hexdigest()
+
+
+def upload_digest(uploaded_file) -> str:
+    """
+    SHA-256 of an uploaded file, computed once per upload.
+
+    Streamlit re-executes the whole script on every widget interaction, and the app reruns every 2 s while a job is
+    running. The digest is kept in st.session_state under the upload's file_id, so the book is only hashed again
+    when another file is uploaded. Rendering itself is deduplicated by the job queue and the summary and generation
+    caches.
+
+    :param uploaded_file: File returned by st.file_uploader
+    :return: Hex digest, equal to file_digest of the uploaded bytes
+    """
+    digests = st.session_state.setdefault("upload_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = file_digest(uploaded_file.getbuffer())
+    return digests[uploaded_file.file_id]
@@ -1,23 +1,175 @@
+import abc
 import zipfile
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 import openai
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
+import json
 import os
+import re
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import streamlit as st
+from instrumentation import metrics
+from .rate_limiter import RateLimiter, estimate_tokens
+from .summary_store import SummaryStore
+from .chunking import ChapterTokenPlan, sample_windows, split_into_chunks
+from .model_router import ModelRouter
+from .spine_filter import SkippedSpineItem, SpineDocument, SpineFilter
 
 
-def extract_story_content_v2(epub_path: str) -> list[str]:
+# epub:type declared on the body or top-level sections of a document
+_DOCUMENT_TYPE = re.compile(rb"<(?:body|section)\b[^>]*\bepub:type=[\"']([^\"']+)[\"']")
+
+# Elements whose text BeautifulSoup's get_text() leaves out
+_NON_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
+
+# Encoding hints of a document, checked in this order
+_BOMS = ((b"\xef\xbb\xbf", "utf-8"), (b"\xff\xfe", "utf-16-le"), (b"\xfe\xff", "utf-16-be"))
+_XML_ENCODING = re.compile(rb"\s*<\?xml[^>]*encoding=[\"']([\w.-]+)[\"']")
+_META_CHARSET = re.compile(rb"<meta[^>]+charset=[\"']?([\w.-]+)", re.IGNORECASE)
+
+
+def _detect_encoding(content: bytes) -> str:
     """
-    Extracts the story content from an EPUB file, ignoring publishing and metadata files.
+    Encoding of an (X)HTML document from its byte order mark, XML declaration or <meta> charset, in that order,
+    like BeautifulSoup's detection; UTF-8 when none is given.
+    """
+    for bom, encoding in _BOMS:
+        if content.startswith(bom):
+            return encoding
+    declared = _XML_ENCODING.match(content) or _META_CHARSET.search(content[:2048])
+    return declared.group(1).decode("ascii") if declared else "utf-8"
+
+
+def _document_text_lxml(content: bytes) -> str:
+    """
+    Extracts the text of an (X)HTML document with lxml, matching
+    BeautifulSoup(content, "html.parser").get_text(separator="\n", strip=True).
+
+    The tree is walked once with iterwalk instead of being wrapped in BeautifulSoup objects. Documents lxml would
+    read differently (CDATA sections, bytes that do not decode in the detected encoding) go to _document_text_bs4.
+    """
+    from lxml import etree
+
+    if b"<![CDATA[" in content:
+        return _document_text_bs4(content)
+    encoding = _detect_encoding(content)
+    try:
+        decoded = content.decode(encoding)
+    except (LookupError, UnicodeDecodeError):
+        return _document_text_bs4(content)
+
+    # Handed over as UTF-8 so that lxml does not need to know the name of the detected encoding
+    root = etree.fromstring(decoded.lstrip("\ufeff").encode("utf-8"), etree.HTMLParser(encoding="utf-8"))
+    if root is None:
+        return ""
+
+    strings = []
+    walker = etree.iterwalk(root, events=("start", "end", "comment", "pi"))
+    for event, element in walker:
+        if event in ("comment", "pi"):
+            # Only the text following a comment or processing instruction is content
+            if element.tail:
+                strings.append(element.tail)
+        elif event == "start":
+            if element.tag.lower() in _NON_TEXT_TAGS:
+                walker.skip_subtree()
+            elif element.text:
+                strings.append(element.text)
+        elif element.tail and element is not root:
+            strings.append(element.tail)
+
+    text = "\n".join(text for text in (string.strip() for string in strings) if text)
+    if "\ufffd" in text and "\ufffd" not in decoded:
+        # Replacement characters that are not in the document
+        return _document_text_bs4(content)
+    return text
+
+
+def _document_text_bs4(content) -> str:
+    content_soup = BeautifulSoup(content, "html.parser")
+    return content_soup.get_text(separator="\n", strip=True)
+
+
+def _strip_fragment(href: str) -> str:
+    return href.split("#", 1)[0]
+
+
+def _navigation_hints(zf: zipfile.ZipFile, rootfile_path: str, opf_soup, manifest_items: dict,
+                      toc_id: Optional[str]):
+    """
+    Collects the structural type and table of contents label of spine documents from the OPF <guide>, the EPUB 3
+    navigation document (landmarks and toc) and the NCX.
+
+    Returns:
+        tuple: ({content path: set of types}, {content path: label})
+    """
+    types, titles = {}, {}
+
+    guide = opf_soup.find("guide")
+    if guide is not None:
+        for reference in guide.find_all("reference"):
+            if reference.get("type") and reference.get("href"):
+                path = urljoin(rootfile_path, _strip_fragment(reference["href"]))
+                types.setdefault(path, set()).add(reference["type"].lower())
+
+    for item in manifest_items.values():
+        nav_path = urljoin(rootfile_path, item["href"])
+        if "nav" in item.get("properties", "").split():
+            try:
+                nav_soup = BeautifulSoup(zf.read(nav_path), "html.parser")
+            except KeyError:
+                continue
+            for nav in nav_soup.find_all("nav"):
+                nav_types = nav.get("epub:type", "").split()
+                for link in nav.find_all("a", href=True):
+                    path = urljoin(nav_path, _strip_fragment(link["href"]))
+                    if "landmarks" in nav_types:
+                        types.setdefault(path, set()).update(link.get("epub:type", "").lower().split())
+                    elif "toc" in nav_types:
+                        titles.setdefault(path, link.get_text(" ", strip=True))
+        elif item["id"] == toc_id or item.get("media-type") == "application/x-dtbncx+xml":
+            try:
+                ncx_soup = BeautifulSoup(zf.read(nav_path), "xml")
+            except KeyError:
+                continue
+            for nav_point in ncx_soup.find_all("navPoint"):
+                label, content = nav_point.find("text"), nav_point.find("content")
+                if label is not None and content is not None and content.get("src"):
+                    path = urljoin(nav_path, _strip_fragment(content["src"]))
+                    titles.setdefault(path, label.get_text(" ", strip=True))
+
+    return types, titles
+
+
+def iter_spine_documents(epub_path: str, parser: str = "lxml") -> Iterator[SpineDocument]:
+    """
+    Lazily extracts every spine document of an EPUB file, in reading order, together with the structural hints
+    (guide/landmark types, epub:type, linear, properties, table of contents label) used by SpineFilter.
+
+    Only the document currently being parsed is held in memory, so consumers can start working on the first
+    chapter before the rest of the book is read.
 
     Args:
         epub_path (str): Path to the EPUB file.
+        parser (str): "lxml" (fast, default) or "html.parser" (the original BeautifulSoup backend). Falls back to
+            "html.parser" when lxml is not installed.
 
-    Returns:
-        list[str]: List of chapter texts extracted from the EPUB.
+    Yields:
+        SpineDocument: Spine item with its text, lines separated by newlines with surrounding whitespace stripped.
     """
-    chapters = []
+    if parser == "lxml":
+        try:
+            import lxml  # noqa: F401
+            document_text = _document_text_lxml
+        except ImportError:
+            document_text = _document_text_bs4
+    else:
+        document_text = _document_text_bs4
 
     with zipfile.ZipFile(epub_path, "r") as zf:
         # Identify the root .opf file
@@ -28,41 +180,93 @@ def extract_story_content_v2(epub_path: str) -> list[str]:
         # Read the .opf file to locate the spine (reading order of chapters)
         with zf.open(rootfile_path) as opf_file:
             soup = BeautifulSoup(opf_file, "xml")
-            manifest = {item["id"]: item["href"] for item in soup.find_all("item")}
+            manifest_items = {item["id"]: item.attrs for item in soup.find_all("item")}
             spine = soup.find("spine")
-            itemrefs = [itemref["idref"] for itemref in spine.find_all("itemref")]
+            itemrefs = spine.find_all("itemref")
+
+        types, titles = _navigation_hints(zf, rootfile_path, soup, manifest_items, spine.get("toc"))
 
-            # Iterate through spine items (in order) to extract chapter content
-            for item_id in itemrefs:
-                if item_id in manifest:
-                    content_path = urljoin(rootfile_path, manifest[item_id])
+        # Iterate through spine items (in order) to extract chapter content
+        for position, itemref in enumerate(itemrefs):
+            item = manifest_items.get(itemref["idref"])
+            if item is None:
+                continue
+            content_path = urljoin(rootfile_path, item["href"])
 
-                    # Check if the chapter file exists and attempt to read it
-                    try:
-                        with zf.open(content_path) as content_file:
-                            content_soup = BeautifulSoup(content_file, "html.parser")
-                            chapter_text = content_soup.get_text(separator="\n", strip=True)
-                            chapters.append(chapter_text)
-                    except KeyError:
-                        print(f"Error reading {content_path}: file not found in EPUB archive.")
+            # Check if the chapter file exists and attempt to read it
+            try:
+                with zf.open(content_path) as content_file:
+                    content = content_file.read()
+            except KeyError:
+                print(f"Error reading {content_path}: file not found in EPUB archive.")
+                continue
+
+            document_types = set(types.get(content_path, ()))
+            for declared in _DOCUMENT_TYPE.findall(content[:8192]):
+                document_types.update(declared.decode(errors="replace").lower().split())
 
-    return chapters
+            yield SpineDocument(
+                position=position,
+                item_id=itemref["idref"],
+                path=content_path,
+                text=document_text(content),
+                linear=itemref.get("linear", "yes") != "no",
+                properties=frozenset(item.get("properties", "").split() + itemref.get("properties", "").split()),
+                types=frozenset(document_types),
+                title=titles.get(content_path),
+            )
 
 
-class ChaptersSummaryAI:
+def iter_story_content(epub_path: str, parser: str = "lxml") -> Iterator[str]:
     """
-    This class utilizes the ChatGPT API to generate descriptive summaries for chapters within an EPUB book.
+    Lazily extracts the story content from an EPUB file, one spine document at a time, in reading order.
+
+    Every spine document is returned; ChaptersSummaryAI filters out front matter with a SpineFilter.
+
+    Args:
+        epub_path (str): Path to the EPUB file.
+        parser (str): "lxml" (fast, default) or "html.parser" (the original BeautifulSoup backend).
+
+    Yields:
+        str: Chapter text, lines separated by newlines with surrounding whitespace stripped.
+    """
+    for document in iter_spine_documents(epub_path, parser):
+        yield document.text
+
+
+def extract_story_content_v2(epub_path: str) -> list[str]:
+    """
+    Extracts the story content from an EPUB file, ignoring publishing and metadata files.
+
+    Args:
+        epub_path (str): Path to the EPUB file.
+
+    Returns:
+        list[str]: List of chapter texts extracted from the EPUB.
+    """
+    return list(iter_story_content(epub_path))
+
+
+class ChaptersSummary(abc.ABC):
+    """
+    Summarizer interface: extracts the story chapters of an EPUB book and turns each into the visual summary used
+    as its image prompt. Backends implement summarize_chapter; ChaptersSummaryAI asks the OpenAI API, and
+    extractive.ChaptersSummaryLocal ranks the chapter's own sentences on the CPU.
 
     Attributes:
         book_file_path (str): Path to the EPUB book file.
-        key (str): OpenAI API key.
+        max_workers (int): Number of chapters summarized concurrently. 1 keeps the sequential behaviour.
+        spine_filter (SpineFilter | None): Drops front matter and duplicate spine items before summarization;
+            None summarizes every spine item.
+        index (EpubIndex | None): Persisted structure index of the book; chapters are read from it instead of
+            parsing the EPUB again.
     """
 
-    def __init__(self, book_file_path: str, open_ai_key: str):
+    def __init__(self, book_file_path: str, max_workers: int = 1, filter_spine: bool = True, index=None):
         self.book_file_path = book_file_path
-        self.key = open_ai_key
-        # openai.api_key = open_ai_key  # Set the API key
-        self.client = openai.OpenAI(api_key=open_ai_key)
+        self.max_workers = max_workers
+        self.spine_filter = SpineFilter() if filter_spine else None
+        self.index = index
 
     def extract_chapters(self) -> List[str]:
         """
@@ -71,49 +275,546 @@ class ChaptersSummaryAI:
         Returns:
             List[str]: List of extracted chapter texts.
         """
-        chapters = extract_story_content_v2(self.book_file_path)
+        with metrics.stage("extract", book=os.path.basename(self.book_file_path)):
+            chapters = list(self.iter_chapters())
         return chapters
 
+    def iter_chapters(self) -> Iterator[str]:
+        """
+        Lazily extracts the story chapters from the EPUB file, in spine order. Spine items rejected by
+        `spine_filter` are left out and listed in `skipped_items`.
+
+        Yields:
+            str: Chapter text.
+        """
+        if self.index is not None:
+            documents = self.index.documents()
+        else:
+            documents = iter_spine_documents(self.book_file_path)
+        if self.spine_filter is not None:
+            documents = self.spine_filter.filter(documents)
+        return (document.text for document in documents)
+
+    @property
+    def skipped_items(self) -> List[SkippedSpineItem]:
+        """
+        Spine items left out by the last extraction, with the reason.
+        """
+        return list(self.spine_filter.skipped) if self.spine_filter is not None else []
+
+    @abc.abstractmethod
+    def summarize_chapter(self, index: int, chapter: str) -> str:
+        """
+        Summarizes a single chapter.
+
+        Args:
+            index (int): 0-based chapter index in spine order.
+            chapter (str): Chapter text.
+
+        Returns:
+            str: "Chapter n: summary".
+        """
+
+    def _groups(self, chapters: List[str]) -> List[List[int]]:
+        """
+        Splits the chapters into the units of work of iter_summaries, as lists of 0-based indices in spine order.
+        """
+        return [[index] for index in range(len(chapters))]
+
+    def _summarize_group(self, group: List[int], chapters: List[str]) -> List[str]:
+        return [self.summarize_chapter(index, chapters[index]) for index in group]
+
+    def iter_summaries(self, chapters: Optional[List[str]] = None) -> Iterator[str]:
+        """
+        Summarizes every chapter and yields the summaries in spine order, each as soon as it and all earlier ones
+        are done, so that a consumer (e.g. rendering) can start on the first chapter while later ones are still
+        being summarized.
+
+        Up to `max_workers` units of work run concurrently. The next one is only started when the consumer takes
+        a result, so a slow consumer holds back summarization instead of letting finished summaries pile up.
+
+        Args:
+            chapters (List[str] | None): Chapter texts, if the caller already extracted them.
+
+        Yields:
+            str: "Chapter n: summary", in spine order.
+        """
+        if chapters is None:
+            chapters = self.extract_chapters()
+        groups = iter(self._groups(chapters))
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as executor:
+            pending = deque(executor.submit(self._summarize_group, group, chapters)
+                            for group in islice(groups, max(1, self.max_workers)))
+            while pending:
+                summaries = pending.popleft().result()
+                group = next(groups, None)
+                if group is not None:
+                    pending.append(executor.submit(self._summarize_group, group, chapters))
+                yield from summaries
+
     def summarize_chapters(self) -> List[str]:
         """
-        Summarizes each chapter by passing it to the OpenAI API with a descriptive prompt.
+        Summarizes every chapter, concurrently when `max_workers` > 1; the result is in spine order.
 
         Returns:
             List[str]: List of descriptive summaries for each chapter.
         """
-        chapters_summary = []
-        chapters = self.extract_chapters()
+        return list(self.iter_summaries())
 
-        # Streamlit progress bar
-        # progress_bar = st.progress(0)
 
-        for index, chapter in enumerate(chapters):
+class ChaptersSummaryAI(ChaptersSummary):
+    """
+    This class utilizes the ChatGPT API to generate descriptive summaries for chapters within an EPUB book.
+
+    Attributes:
+        book_file_path (str): Path to the EPUB book file.
+        key (str): OpenAI API key.
+        base_url (str | None): Alternative OpenAI-compatible endpoint, e.g. a local fake server for testing.
+        max_workers (int): Number of chapters summarized concurrently. 1 keeps the sequential behaviour.
+        rate_limiter (RateLimiter | None): Shared requests/tokens per minute budget.
+        max_retries (int): Retries on rate limit (429) and server errors before a chapter is reported as failed.
+        store (SummaryStore | None): Persistent summary cache; chapters already summarized are not sent again.
+        chunk_workers (int): Concurrent chunk requests when a long chapter is summarized in chunks.
+        spine_filter (SpineFilter | None): Drops front matter and duplicate spine items before summarization;
+            None summarizes every spine item.
+        router (ModelRouter | None): Picks the model of each chapter under per-book token, cost and latency
+            budgets; None sends every chapter to `model`.
+        index (EpubIndex | None): Persisted structure index of the book; chapters are read from it instead of
+            parsing the EPUB again.
+        batch_tokens (int | None): Packs consecutive short chapters into one request of up to this many chapter
+            tokens, answered with one JSON summary per chapter; None sends one request per chapter.
+        fallback (object | None): Local summarizer with a summarize(chapter) method (e.g.
+            extractive.TextRankSummarizer) used for chapters whose request fails or that the token budget leaves
+            out; None reports failed chapters as errors and uses the opening lines of unsent chapters.
+    """
+
+    model = "gpt-3.5-turbo"  # Use the correct model here gpt-4o gpt-3.5-turbo
+    # Bump whenever build_messages changes so that summaries produced by an older prompt are not reused
+    prompt_version = "1"
+    completion_tokens_estimate = 100
+    # Chapters longer than chunk_tokens are split into windows that are summarized in parallel (map),
+    # then the notes of all windows are summarized into the final visual summary (reduce)
+    chunk_tokens = 3000
+    chunk_notes_tokens = 150
+    # Most chapters packed into one batch request; the JSON answer grows with every chapter
+    batch_max_chapters = 8
+
+    def __init__(self, book_file_path: str, open_ai_key: str, base_url: Optional[str] = None, max_workers: int = 1,
+                 rate_limiter: Optional[RateLimiter] = None, max_retries: int = 5,
+                 store: Optional[SummaryStore] = None, chunk_workers: int = 4, filter_spine: bool = True,
+                 router: Optional[ModelRouter] = None, index=None, batch_tokens: Optional[int] = None,
+                 fallback=None):
+        super().__init__(book_file_path, max_workers=max_workers, filter_spine=filter_spine, index=index)
+        self.key = open_ai_key
+        self.base_url = base_url
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.store = store
+        self.chunk_workers = chunk_workers
+        self.router = router
+        self.batch_tokens = batch_tokens
+        self.fallback = fallback
+        # openai.api_key = open_ai_key  # Set the API key
+        # Retries are handled by _create_completion so that they go through the rate limiter
+        self.client = openai.OpenAI(api_key=open_ai_key, base_url=base_url, max_retries=0)
+
+    @staticmethod
+    def build_messages(index: int, chapter: str) -> List[dict]:
+        """
+        Builds the chat messages asking for the visual summary of one chapter.
+
+        Args:
+            index (int): 0-based chapter index in spine order.
+            chapter (str): Chapter text.
+
+        Returns:
+            List[dict]: Messages for the chat completions API.
+        """
+        return [
+            {"role": "system",
+             "content": "You are an assistant that creates visual and immersive summaries for chapters in novels. These summaries are then used to generate images."},
+            {"role": "user",
+             "content": f"Create a descriptive, visual summary for Chapter {index + 1} of a fictional book, based on the following content:\n\n{chapter}\n\n "
+                        f"Focus on the imagery, key scenes, characters, and setting details, making it as vivid and story-like as possible. Don't make up information, generate decriptions only on what's in the book content you received "
+                        f"Ignore any publishing information, prologues, forewords, or acknowledgments. "
+                        f"Limit to 200 characters for each chapter. Don't add Chapter and number at the begining of every summary as there's a script that already formats it that way"   # , and format as 'Chapter {index + 1}: [summary]'.
+             }
+        ]
+
+    @staticmethod
+    def build_chunk_messages(index: int, part: int, parts: int, chunk: str) -> List[dict]:
+        """
+        Builds the chat messages asking for the visual notes of one window of a long chapter (map step).
+
+        Args:
+            index (int): 0-based chapter index in spine order.
+            part (int): 0-based window index within the chapter.
+            parts (int): Number of windows in the chapter.
+            chunk (str): Window text.
+
+        Returns:
+            List[dict]: Messages for the chat completions API.
+        """
+        return [
+            {"role": "system",
+             "content": "You are an assistant that creates visual and immersive summaries for chapters in novels. These summaries are then used to generate images."},
+            {"role": "user",
+             "content": f"The following is part {part + 1} of {parts} of Chapter {index + 1} of a fictional book:\n\n{chunk}\n\n "
+                        f"List the key visual details of this part: scenes, characters, their appearance and actions, and setting. "
+                        f"Don't make up information. Ignore any publishing information. Limit to 400 characters."
+             }
+        ]
+
+    @staticmethod
+    def build_batch_messages(indices: List[int], chapters: List[str]) -> List[dict]:
+        """
+        Builds the chat messages asking for the visual summaries of several short chapters in one request, answered
+        as a JSON object {"summaries": [{"chapter": n, "summary": "..."}]}.
+
+        Args:
+            indices (List[int]): 0-based chapter indices in spine order.
+            chapters (List[str]): Chapter texts, in the same order.
+
+        Returns:
+            List[dict]: Messages for the chat completions API.
+        """
+        numbers = ", ".join(str(index + 1) for index in indices)
+        content = "".join(f"### Chapter {index + 1}\n\n{chapter}\n\n" for index, chapter in zip(indices, chapters))
+        return [
+            {"role": "system",
+             "content": "You are an assistant that creates visual and immersive summaries for chapters in novels. These summaries are then used to generate images."},
+            {"role": "user",
+             "content": f"Create a descriptive, visual summary for each of Chapters {numbers} of a fictional book, based on the following content:\n\n{content}"
+                        f"Focus on the imagery, key scenes, characters, and setting details, making it as vivid and story-like as possible. Don't make up information, generate decriptions only on what's in the book content you received "
+                        f"Ignore any publishing information, prologues, forewords, or acknowledgments. "
+                        f"Limit to 200 characters for each chapter. Don't add Chapter and number at the begining of every summary as there's a script that already formats it that way. "
+                        f'Answer with a JSON object {{"summaries": [{{"chapter": <chapter number>, "summary": "<summary>"}}]}} holding exactly one entry for each of Chapters {numbers}.'
+             }
+        ]
+
+    @staticmethod
+    def parse_batch_response(content: str, indices: List[int]) -> Dict[int, str]:
+        """
+        Validates the JSON answer to build_batch_messages and splits it into per-chapter summaries.
+
+        Entries that are malformed, name a chapter that was not asked for, have an empty summary or repeat a chapter
+        are left out, so that the caller can summarize those chapters on their own.
+
+        Args:
+            content (str): Message content of the completion.
+            indices (List[int]): 0-based chapter indices sent in the request.
+
+        Returns:
+            Dict[int, str]: Summary per 0-based chapter index, for the chapters answered correctly.
+        """
+        try:
+            data = json.loads(content)
+        except (TypeError, ValueError):
+            return {}
+        entries = data.get("summaries") if isinstance(data, dict) else data
+        if not isinstance(entries, list):
+            return {}
+
+        expected = {index + 1: index for index in indices}
+        summaries, repeated = {}, set()
+        for entry in entries:
+            if not isinstance(entry, dict):
+                continue
+            number, summary = entry.get("chapter"), entry.get("summary")
+            if isinstance(number, str) and number.strip().isdigit():
+                number = int(number)
+            if isinstance(number, bool) or number not in expected or not isinstance(summary, str) \
+                    or not summary.strip():
+                continue
+            index = expected[number]
+            if index in summaries:
+                repeated.add(index)
+            summaries[index] = summary.strip()
+        for index in repeated:
+            del summaries[index]
+        return summaries
+
+    @staticmethod
+    def _count_tokens(messages: List[dict]) -> int:
+        return sum(estimate_tokens(message["content"]) for message in messages)
+
+    def _create_completion(self, messages: List[dict], completion_tokens: Optional[int] = None, **kwargs):
+        """
+        Sends a chat completion request through the rate limiter, retrying with exponential backoff on 429 and 5xx
+        responses. A Retry-After header sent by the server takes precedence over the computed delay.
+        """
+        if completion_tokens is None:
+            completion_tokens = self.completion_tokens_estimate
+        tokens = self._count_tokens(messages) + completion_tokens
+        for attempt in range(self.max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(tokens)
+            start = time.perf_counter()
+            try:
+                completion = self.client.chat.completions.create(messages=messages, **kwargs)
+            except (openai.RateLimitError, openai.InternalServerError) as e:
+                metrics.observe_request("openai", "chat.completions", time.perf_counter() - start, e.status_code)
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = min(60.0, 2 ** attempt) + random.uniform(0, 1)
+                metrics.inc("moviefy_api_retries_total", api="openai", endpoint="chat.completions")
+                time.sleep(delay)
+            else:
+                seconds = time.perf_counter() - start
+                metrics.observe_request("openai", "chat.completions", seconds, 200)
+                if completion.usage is not None:
+                    metrics.inc("moviefy_openai_tokens_total", completion.usage.prompt_tokens, kind="prompt")
+                    metrics.inc("moviefy_openai_tokens_total", completion.usage.completion_tokens, kind="completion")
+                    if self.router is not None:
+                        self.router.record(kwargs["model"], completion.usage.prompt_tokens,
+                                           completion.usage.completion_tokens, seconds)
+                return completion
+
+    def _summarize_text(self, index: int, chapter: str, model: Optional[str] = None) -> str:
+        """
+        Requests the visual summary of a chapter, going through map-reduce when it exceeds `chunk_tokens`.
+        """
+        model = model or self.model
+        chunks = split_into_chunks(chapter, self.chunk_tokens)
+        if len(chunks) > 1:
+            def summarize_chunk(part: int) -> str:
+                messages = self.build_chunk_messages(index, part, len(chunks), chunks[part])
+                completion = self._create_completion(messages, completion_tokens=self.chunk_notes_tokens, model=model)
+                return completion.choices[0].message.content
+
+            with ThreadPoolExecutor(max_workers=self.chunk_workers) as executor:
+                notes = list(executor.map(summarize_chunk, range(len(chunks))))
+            chapter = "\n\n".join(notes)
+
+        completion = self._create_completion(self.build_messages(index, chapter), model=model)
+        return completion.choices[0].message.content
+
+    def plan_chapter(self, index: int, chapter: str) -> ChapterTokenPlan:
+        """
+        Predicts the requests and tokens needed to summarize a chapter, without calling the API.
+
+        Args:
+            index (int): 0-based chapter index in spine order.
+            chapter (str): Chapter text.
+
+        Returns:
+            ChapterTokenPlan: Token accounting of the chapter.
+        """
+        chunks = split_into_chunks(chapter, self.chunk_tokens)
+        if len(chunks) == 1:
+            return ChapterTokenPlan(index=index, chapter_tokens=estimate_tokens(chapter), chunks=1,
+                                    prompt_tokens=self._count_tokens(self.build_messages(index, chapter)),
+                                    completion_tokens=self.completion_tokens_estimate, rounds=1)
+
+        map_prompt_tokens = sum(
+            self._count_tokens(self.build_chunk_messages(index, part, len(chunks), chunk))
+            for part, chunk in enumerate(chunks)
+        )
+        notes_tokens = len(chunks) * self.chunk_notes_tokens
+        reduce_prompt_tokens = self._count_tokens(self.build_messages(index, "")) + notes_tokens
+        return ChapterTokenPlan(index=index, chapter_tokens=estimate_tokens(chapter), chunks=len(chunks),
+                                prompt_tokens=map_prompt_tokens + reduce_prompt_tokens,
+                                completion_tokens=notes_tokens + self.completion_tokens_estimate, rounds=2)
+
+    def plan(self) -> List[ChapterTokenPlan]:
+        """
+        Predicts the token usage of summarize_chapters for the whole book, e.g. to estimate cost and latency
+        before a run with ChapterTokenPlan.cost and the number of rounds.
+
+        Returns:
+            List[ChapterTokenPlan]: One plan per chapter, in spine order.
+        """
+        return [self.plan_chapter(index, chapter) for index, chapter in enumerate(self.iter_chapters())]
+
+    def _route(self, index: int, chapter: str) -> Tuple[str, Optional[str]]:
+        """
+        Picks the model of a chapter and the text to send, shortened if the router's token budget requires it.
+
+        Returns:
+            Tuple[str, str | None]: Model and text; the text is None when the budget leaves nothing to send.
+        """
+        if self.router is None:
+            return self.model, chapter
+        decision = self.router.route(self.router.planned(index) or self.plan_chapter(index, chapter))
+        if decision.max_input_tokens == 0:
+            return decision.model, None
+        if decision.max_input_tokens is not None:
+            return decision.model, sample_windows(chapter, decision.max_input_tokens)
+        return decision.model, chapter
+
+    def summarize_chapter(self, index: int, chapter: str) -> str:
+        """
+        Summarizes a single chapter.
+
+        With a router, the chapter goes to the model it picks, shortened if the token budget requires it; when the
+        budget is exhausted the `fallback` summary (or the opening lines of the chapter) stands in for it, as it
+        does for a failed request when there is a `fallback`.
+
+        Args:
+            index (int): 0-based chapter index in spine order.
+            chapter (str): Chapter text.
+
+        Returns:
+            str: "Chapter n: summary", or "Chapter n: Error in summarization: ..." if the request failed and there
+            is no `fallback`.
+        """
+        model, text = self._route(index, chapter)
+        return self._summarize_routed(index, chapter, model, text)
+
+    def _summarize_routed(self, index: int, chapter: str, model: str, text: Optional[str],
+                          lookup: bool = True) -> str:
+        # lookup=False when the caller already missed the store for this text, so every chapter is counted once
+        try:
+            if text is None:
+                return f"Chapter {index + 1}: {self._fallback(chapter, 'budget')}"
+            if lookup and self.store is not None:
+                summary = self.store.get(text, model, self.prompt_version)
+                if summary is not None:
+                    return f"Chapter {index + 1}: {summary}"
+
             try:
-                completion = self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",  # Use the correct model here gpt-4o gpt-3.5-turbo
-                    messages=[
-                        {"role": "system",
-                         "content": "You are an assistant that creates visual and immersive summaries for chapters in novels. These summaries are then used to generate images."},
-                        {"role": "user",
-                         "content": f"Create a descriptive, visual summary for Chapter {index + 1} of a fictional book, based on the following content:\n\n{chapter}\n\n "
-                                    f"Focus on the imagery, key scenes, characters, and setting details, making it as vivid and story-like as possible. Don't make up information, generate decriptions only on what's in the book content you received "
-                                    f"Ignore any publishing information, prologues, forewords, or acknowledgments. "
-                                    f"Limit to 200 characters for each chapter. Don't add Chapter and number at the begining of every summary as there's a script that already formats it that way"   # , and format as 'Chapter {index + 1}: [summary]'.
-                         }
-                    ]
-                )
-                summary = completion.choices[0].message.content
-                chapters_summary.append(f"Chapter {index + 1}: {summary}")
+                with metrics.stage("summarize", book=os.path.basename(self.book_file_path), chapter=index + 1,
+                                   model=model):
+                    summary = self._summarize_text(index, text, model=model)
+                if self.store is not None:
+                    self.store.put(text, model, self.prompt_version, summary)
+                return f"Chapter {index + 1}: {summary}"
 
             except Exception as e:
                 # st.error(f"Error summarizing Chapter {index + 1}: {e}")
-                chapters_summary.append(f"Chapter {index + 1}: Error in summarization: {e}")
+                if self.fallback is not None:
+                    print(f"Error summarizing Chapter {index + 1}, using the local summary: {e}")
+                    return f"Chapter {index + 1}: {self._fallback(chapter, 'error')}"
+                return f"Chapter {index + 1}: Error in summarization: {e}"
+        finally:
+            if self.router is not None:
+                self.router.finish(index)
+
+    def summarize_batch(self, indices: List[int], chapters: List[str]) -> List[str]:
+        """
+        Summarizes several short chapters with as few requests as possible.
+
+        Chapters answered from the store or not sent at all (token budget) are handled as in summarize_chapter.
+        The others go out in one request per routed model, asking for JSON; every chapter whose entry is missing or
+        does not validate, or all of them if the request fails, is then summarized with its own request.
+
+        Args:
+            indices (List[int]): 0-based chapter indices in spine order.
+            chapters (List[str]): Chapter texts, in the same order.
+
+        Returns:
+            List[str]: "Chapter n: summary" per chapter, in the order given.
+        """
+        results = {}
+        by_model: Dict[str, List[Tuple[int, str, str]]] = {}
+        for index, chapter in zip(indices, chapters):
+            model, text = self._route(index, chapter)
+            summary = self.store.get(text, model, self.prompt_version) if self.store is not None and text else None
+            if text is None:
+                results[index] = self._summarize_routed(index, chapter, model, text)
+            elif summary is not None:
+                if self.router is not None:
+                    self.router.finish(index)
+                results[index] = f"Chapter {index + 1}: {summary}"
+            else:
+                by_model.setdefault(model, []).append((index, chapter, text))
+
+        for model, batch in by_model.items():
+            summaries = {}
+            if len(batch) > 1:
+                batch_indices = [index for index, _, _ in batch]
+                messages = self.build_batch_messages(batch_indices, [text for _, _, text in batch])
+                try:
+                    with metrics.stage("summarize_batch", book=os.path.basename(self.book_file_path),
+                                       chapter=f"{batch_indices[0] + 1}-{batch_indices[-1] + 1}", model=model,
+                                       chapters=len(batch)):
+                        completion = self._create_completion(
+                            messages, completion_tokens=self.completion_tokens_estimate * len(batch), model=model,
+                            response_format={"type": "json_object"}
+                        )
+                    summaries = self.parse_batch_response(completion.choices[0].message.content, batch_indices)
+                except Exception as e:
+                    print(f"Batch of chapters {batch_indices[0] + 1}-{batch_indices[-1] + 1} failed, "
+                          f"summarizing them one by one: {e}")
 
-            # Update progress bar
-            # progress_bar.progress((index + 1) / len(chapters))
+            for index, chapter, text in batch:
+                if index not in summaries:
+                    if len(batch) > 1:
+                        metrics.inc("moviefy_summary_batch_fallbacks_total")
+                    results[index] = self._summarize_routed(index, chapter, model, text, lookup=False)
+                    continue
+                if self.store is not None:
+                    self.store.put(text, model, self.prompt_version, summaries[index])
+                if self.router is not None:
+                    self.router.finish(index)
+                results[index] = f"Chapter {index + 1}: {summaries[index]}"
+        return [results[index] for index in indices]
 
-        return chapters_summary
+    def batch_chapters(self, chapters: List[str]) -> List[List[int]]:
+        """
+        Groups consecutive chapters of at most half of `batch_tokens` into batches of up to `batch_tokens` chapter
+        tokens and `batch_max_chapters` chapters. Longer chapters form a group of their own.
+
+        Returns:
+            List[List[int]]: Groups of 0-based chapter indices, in spine order.
+        """
+        groups, batch, tokens = [], [], 0
+        for index, chapter in enumerate(chapters):
+            chapter_tokens = estimate_tokens(chapter)
+            if not self.batch_tokens or chapter_tokens > self.batch_tokens // 2:
+                if batch:
+                    groups.append(batch)
+                    batch = []
+                groups.append([index])
+                continue
+            if batch and (len(batch) == self.batch_max_chapters or tokens + chapter_tokens > self.batch_tokens):
+                groups.append(batch)
+                batch = []
+            if not batch:
+                tokens = 0
+            batch.append(index)
+            tokens += chapter_tokens
+        if batch:
+            groups.append(batch)
+        return groups
+
+    def _fallback(self, chapter: str, reason: str) -> str:
+        """
+        Summary of a chapter that the API did not summarize; never stored, so a later run asks the API again.
+        """
+        metrics.inc("moviefy_summary_fallbacks_total", reason=reason)
+        if self.fallback is not None:
+            return self.fallback.summarize(chapter)
+        return self.fallback_summary(chapter)
+
+    @staticmethod
+    def fallback_summary(chapter: str, max_chars: int = 200) -> str:
+        """
+        Opening lines of a chapter, cut on a word boundary, used as its image prompt when it cannot be sent.
+        """
+        text = " ".join(chapter.split())
+        if len(text) <= max_chars:
+            return text
+        return text[:text.rfind(" ", 0, max_chars) + 1 or max_chars].strip()
+
+    def _groups(self, chapters: List[str]) -> List[List[int]]:
+        """
+        With a router, plans the whole book first so that it can be routed against the per-book budgets;
+        router.report() then compares projected and actual spend. With `batch_tokens`, consecutive short chapters
+        are grouped for summarize_batch (see batch_chapters).
+        """
+        if self.router is not None:
+            self.router.start([self.plan_chapter(index, chapter) for index, chapter in enumerate(chapters)])
+        return self.batch_chapters(chapters)
 
+    def _summarize_group(self, group: List[int], chapters: List[str]) -> List[str]:
+        if len(group) == 1:
+            return [self.summarize_chapter(group[0], chapters[group[0]])]
+        return self.summarize_batch(group, [chapters[index] for index in group])
 
 #=============================================================================
 #
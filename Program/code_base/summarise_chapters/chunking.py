@@ -0,0 +1,110 @@
+from dataclasses import dataclass
+from typing import List
+
+from .rate_limiter import estimate_tokens
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    Splits a chapter into windows of at most `max_tokens` tokens.
+
+    Windows are cut on line boundaries (the extractor puts one paragraph per line); a single line longer than the
+    window is cut on word boundaries, or anywhere if the window has no space in its second half (a cut at an early
+    space would leave a near-empty window, each of which costs a request). Empty windows are left out.
+
+    Args:
+        text (str): Chapter text.
+        max_tokens (int): Token budget of a window.
+
+    Returns:
+        List[str]: Windows in reading order. A chapter that fits yields a single window.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+
+    def flush():
+        nonlocal current, current_tokens
+        chunk = "\n".join(current)
+        if chunk.strip():
+            chunks.append(chunk)
+        current, current_tokens = [], 0
+
+    for line in text.split("\n"):
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            flush()
+            # Same chars-per-token ratio as the whole line, cut at the last space of the window's second half
+            window = max(1, len(line) * max_tokens // line_tokens)
+            while line:
+                if len(line) <= window:
+                    cut = len(line)
+                else:
+                    cut = line.rfind(" ", 0, window) + 1
+                    if cut <= window // 2:
+                        cut = window
+                if line[:cut].strip():
+                    chunks.append(line[:cut].strip())
+                line = line[cut:]
+            continue
+        if current_tokens + line_tokens > max_tokens:
+            flush()
+        current.append(line)
+        current_tokens += line_tokens
+    flush()
+
+    return chunks or [text]
+
+
+def sample_windows(text: str, max_tokens: int, window_tokens: int = 500) -> str:
+    """
+    Shortens a chapter to about `max_tokens` tokens by keeping evenly spaced windows, so that the beginning, middle
+    and end of the chapter are all represented.
+
+    Args:
+        text (str): Chapter text.
+        max_tokens (int): Token budget of the shortened text.
+        window_tokens (int): Size of the kept windows.
+
+    Returns:
+        str: The kept windows, in reading order, separated by blank lines. `text` itself when it already fits.
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    windows = split_into_chunks(text, min(window_tokens, max(1, max_tokens)))
+    keep = max(1, max_tokens // window_tokens)
+    if keep >= len(windows):
+        return "\n\n".join(windows)
+    step = len(windows) / keep
+    return "\n\n".join(windows[int(position * step)] for position in range(keep))
+
+
+@dataclass
+class ChapterTokenPlan:
+    """
+    Predicted token usage of summarizing one chapter.
+
+    Attributes:
+        index (int): 0-based chapter index.
+        chapter_tokens (int): Tokens in the chapter text.
+        chunks (int): Number of map requests; 1 means the chapter is summarized in a single request.
+        prompt_tokens (int): Prompt tokens over all requests, instructions included.
+        completion_tokens (int): Expected completion tokens over all requests.
+        rounds (int): Requests that must run one after another (map in parallel, then reduce).
+    """
+    index: int
+    chapter_tokens: int
+    chunks: int
+    prompt_tokens: int
+    completion_tokens: int
+    rounds: int
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def requests(self) -> int:
+        return 1 if self.chunks == 1 else self.chunks + 1
+
+    def cost(self, prompt_price_per_1k: float, completion_price_per_1k: float) -> float:
+        return (self.prompt_tokens * prompt_price_per_1k + self.completion_tokens * completion_price_per_1k) / 1000
@@ -0,0 +1,221 @@
+"""
+Persisted structure index of an EPUB, built once per book.
+
+Run from Program/code_base to inspect a book:
+
+    python -m summarise_chapters.epub_index book.epub --index-dir /tmp/book_index
+    python -m summarise_chapters.epub_index book.epub --index-dir /tmp/book_index --chapter 3
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from typing import Iterator, List, Optional
+
+from .chapter_summary import iter_spine_documents
+from .rate_limiter import estimate_tokens
+from .spine_filter import SpineDocument
+
+INDEX_VERSION = 1
+INDEX_NAME = "epub_index.json"
+TEXT_NAME = "epub_text.bin"
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EpubIndex:
+    """
+    Sidecar index of an EPUB: spine order, resolved content paths, structural hints, per-document character and
+    token counts, text hashes, and the offset of every document's text in a single UTF-8 blob.
+
+    Building it parses container.xml, the OPF and every XHTML document once; afterwards a chapter's text is one
+    seek and read, and book statistics are a dictionary lookup. The index records the size, modification time and
+    SHA-256 of the EPUB it was built from and is rebuilt when the file changes.
+
+    Attributes:
+        index_dir (str): Folder holding epub_index.json and epub_text.bin.
+        source (dict): {"path", "sha256", "size", "mtime"} of the indexed EPUB.
+        entries (List[dict]): One entry per readable spine document, in spine order.
+    """
+
+    def __init__(self, index_dir: str, data: dict):
+        self.index_dir = index_dir
+        self.source = data["source"]
+        self.entries: List[dict] = data["entries"]
+        self._stats = data["stats"]
+        self._by_position = {entry["position"]: entry for entry in self.entries}
+
+    @property
+    def text_path(self) -> str:
+        return os.path.join(self.index_dir, TEXT_NAME)
+
+    @classmethod
+    def build(cls, epub_path: str, index_dir: str, digest: Optional[str] = None, parser: str = "lxml") -> "EpubIndex":
+        """
+        Parses the EPUB and writes its index, streaming the extracted text to disk one document at a time.
+
+        Args:
+            epub_path (str): Path to the EPUB file.
+            index_dir (str): Folder to write the index to.
+            digest (str | None): SHA-256 of the EPUB, if the caller already has it.
+            parser (str): Text extraction backend, see iter_spine_documents.
+
+        Returns:
+            EpubIndex: The new index.
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        stat = os.stat(epub_path)
+        entries = []
+        offset = 0
+        text_tmp_path = os.path.join(index_dir, f"{TEXT_NAME}.{os.getpid()}.tmp")
+        with open(text_tmp_path, "wb") as blob:
+            for document in iter_spine_documents(epub_path, parser):
+                data = document.text.encode("utf-8")
+                blob.write(data)
+                entries.append({
+                    "position": document.position,
+                    "item_id": document.item_id,
+                    "path": document.path,
+                    "linear": document.linear,
+                    "properties": sorted(document.properties),
+                    "types": sorted(document.types),
+                    "title": document.title,
+                    "chars": len(document.text),
+                    "tokens": estimate_tokens(document.text) if document.text else 0,
+                    "text_sha256": hashlib.sha256(data).hexdigest(),
+                    "offset": offset,
+                    "length": len(data),
+                })
+                offset += len(data)
+
+        data = {
+            "version": INDEX_VERSION,
+            "built_at": time.time(),
+            "parser": parser,
+            "source": {"path": os.path.abspath(epub_path), "sha256": digest or _file_sha256(epub_path),
+                       "size": stat.st_size, "mtime": stat.st_mtime},
+            "stats": {
+                "documents": len(entries),
+                "chars": sum(entry["chars"] for entry in entries),
+                "tokens": sum(entry["tokens"] for entry in entries),
+                "text_bytes": offset,
+            },
+            "entries": entries,
+        }
+        # The blob goes in place before the index that points into it
+        os.replace(text_tmp_path, os.path.join(index_dir, TEXT_NAME))
+        index_tmp_path = os.path.join(index_dir, f"{INDEX_NAME}.{os.getpid()}.tmp")
+        with open(index_tmp_path, "w") as file:
+            json.dump(data, file)
+        os.replace(index_tmp_path, os.path.join(index_dir, INDEX_NAME))
+        return cls(index_dir, data)
+
+    @classmethod
+    def load(cls, index_dir: str) -> Optional["EpubIndex"]:
+        """
+        Returns:
+            EpubIndex | None: The stored index, or None if there is none or it has an older format.
+        """
+        try:
+            with open(os.path.join(index_dir, INDEX_NAME)) as file:
+                data = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION or not os.path.exists(os.path.join(index_dir, TEXT_NAME)):
+            return None
+        return cls(index_dir, data)
+
+    @classmethod
+    def load_or_build(cls, epub_path: str, index_dir: str, digest: Optional[str] = None) -> "EpubIndex":
+        """
+        Returns the stored index if it was built from this EPUB, else builds it.
+
+        With `digest`, the stored SHA-256 is compared; without, the file size and modification time are, which
+        avoids reading the whole EPUB.
+        """
+        index = cls.load(index_dir)
+        if index is not None:
+            if digest is not None:
+                current = index.source["sha256"] == digest
+            else:
+                stat = os.stat(epub_path)
+                current = (index.source["size"], index.source["mtime"]) == (stat.st_size, stat.st_mtime)
+            if current:
+                return index
+        return cls.build(epub_path, index_dir, digest=digest)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: {"documents", "chars", "tokens", "text_bytes"} of the whole book.
+        """
+        return dict(self._stats)
+
+    def chapter_text(self, position: int) -> str:
+        """
+        Reads the text of one spine document without touching the EPUB.
+
+        Args:
+            position (int): 0-based spine position.
+        """
+        entry = self._by_position[position]
+        with open(self.text_path, "rb") as blob:
+            blob.seek(entry["offset"])
+            return blob.read(entry["length"]).decode("utf-8")
+
+    def document(self, position: int) -> SpineDocument:
+        return self._document(self._by_position[position], self.chapter_text(position))
+
+    def documents(self) -> Iterator[SpineDocument]:
+        """
+        Yields every spine document in order, like iter_spine_documents, reading the text blob sequentially.
+        """
+        with open(self.text_path, "rb") as blob:
+            for entry in self.entries:
+                blob.seek(entry["offset"])
+                yield self._document(entry, blob.read(entry["length"]).decode("utf-8"))
+
+    @staticmethod
+    def _document(entry: dict, text: str) -> SpineDocument:
+        return SpineDocument(
+            position=entry["position"],
+            item_id=entry["item_id"],
+            path=entry["path"],
+            text=text,
+            linear=entry["linear"],
+            properties=frozenset(entry["properties"]),
+            types=frozenset(entry["types"]),
+            title=entry["title"],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("epub")
+    parser.add_argument("--index-dir", required=True, help="Folder of the index (built if missing or stale)")
+    parser.add_argument("--chapter", type=int, help="Print the text of this 0-based spine position")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = EpubIndex.load_or_build(args.epub, args.index_dir)
+    print(f"Index ready in {time.perf_counter() - start:.3f} s: {index.stats()}")
+    if args.chapter is not None:
+        print(index.chapter_text(args.chapter))
+    else:
+        for entry in index.entries:
+            print(f"{entry['position']:>4}  {entry['path']:<40} {entry['chars']:>8} chars {entry['tokens']:>7} tokens"
+                  f"  {entry['title'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import re
+from typing import List, Optional
+
+import numpy as np
+
+from instrumentation import metrics
+from .chapter_summary import ChaptersSummary
+
+# Sentence ends: terminal punctuation, optionally followed by a closing quote or bracket, which stays with the
+# sentence
+_SENTENCE_END = re.compile(r"(?:(?<=[.!?])|(?<=[.!?][\"'”’)\]]))\s+")
+_WORD = re.compile(r"[a-z][a-z'’]*")
+
+_STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers herself
+him himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or
+other our ours ourselves out over own said same she should so some such than that the their theirs them themselves
+then there these they this those through to too under until up upon very was we were what when where which while
+who whom why will with would you your yours yourself yourselves
+""".split())
+
+
+def split_sentences(text: str, min_words: int = 4) -> List[str]:
+    """
+    Splits chapter text into sentences. Lines (paragraphs, as produced by iter_spine_documents) are split on
+    terminal punctuation; fragments shorter than `min_words` words, such as headings, are dropped.
+    """
+    sentences = []
+    for line in text.splitlines():
+        for sentence in _SENTENCE_END.split(line.strip()):
+            if len(sentence.split()) >= min_words:
+                sentences.append(sentence)
+    return sentences
+
+
+def _cut(text: str, max_chars: int) -> str:
+    """Cuts text to max_chars on a word boundary."""
+    if len(text) <= max_chars:
+        return text
+    return text[:text.rfind(" ", 0, max_chars) + 1 or max_chars].strip()
+
+
+class TextRankSummarizer:
+    """
+    Extractive summarizer that runs on the CPU: TextRank over TF-IDF sentence vectors, computed with NumPy.
+
+    Every sentence of a chapter is weighted by TF-IDF (sentences as documents, stop words removed), sentences are
+    linked by the cosine similarity of their vectors, and PageRank over that graph ranks them. The best ranked
+    sentences that fit `max_chars` are returned in reading order. Only terms shared by two or more sentences are
+    kept as columns of the dense matrix, as the others cannot link sentences, so a chapter costs one small matrix
+    product; a full-length novel takes seconds.
+
+    Attributes:
+        max_chars (int): Length limit of a summary, like the limit given to the API.
+        damping (float): PageRank damping factor.
+        max_sentences (int): Longer chapters are ranked on this many evenly spaced sentences.
+        max_iterations (int): Power iterations before giving up on convergence.
+        tolerance (float): L1 change of the ranks below which the iteration stops.
+    """
+
+    name = "textrank"
+
+    def __init__(self, max_chars: int = 200, damping: float = 0.85, max_sentences: int = 1000,
+                 max_iterations: int = 100, tolerance: float = 1e-6):
+        self.max_chars = max_chars
+        self.damping = damping
+        self.max_sentences = max_sentences
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+
+    def rank(self, sentences: List[str]) -> np.ndarray:
+        """
+        Returns:
+            np.ndarray: TextRank score of every sentence, summing to 1.
+        """
+        count = len(sentences)
+        vocabulary = {}
+        rows, columns = [], []
+        for row, sentence in enumerate(sentences):
+            for word in _WORD.findall(sentence.lower()):
+                if word not in _STOP_WORDS:
+                    rows.append(row)
+                    columns.append(vocabulary.setdefault(word, len(vocabulary)))
+        if not rows:
+            return np.full(count, 1.0 / count)
+
+        # Sparse term counts as (sentence, term) pairs
+        pairs, term_counts = np.unique(np.array([rows, columns]).T, axis=0, return_counts=True)
+        sentence_ids, term_ids = pairs[:, 0], pairs[:, 1]
+        sentence_lengths = np.bincount(np.array(rows), minlength=count)
+        document_frequency = np.bincount(term_ids, minlength=len(vocabulary))
+        idf = np.log((1 + count) / (1 + document_frequency)) + 1
+        weights = term_counts / sentence_lengths[sentence_ids] * idf[term_ids]
+        norms = np.sqrt(np.bincount(sentence_ids, weights=weights ** 2, minlength=count))
+        norms[norms == 0] = 1
+
+        shared = np.flatnonzero(document_frequency > 1)
+        column_of = np.full(len(vocabulary), -1)
+        column_of[shared] = np.arange(len(shared))
+        keep = column_of[term_ids] >= 0
+        vectors = np.zeros((count, len(shared)), dtype=np.float32)
+        vectors[sentence_ids[keep], column_of[term_ids[keep]]] = weights[keep]
+        vectors /= norms[:, None]
+
+        similarity = vectors @ vectors.T
+        np.fill_diagonal(similarity, 0)
+        out_weight = similarity.sum(axis=1, keepdims=True)
+        # Sentences sharing no term with any other one link to every sentence evenly
+        transition = np.where(out_weight > 0, similarity / np.where(out_weight > 0, out_weight, 1), 1.0 / count)
+
+        scores = np.full(count, 1.0 / count)
+        for _ in range(self.max_iterations):
+            updated = (1 - self.damping) / count + self.damping * (transition.T @ scores)
+            converged = np.abs(updated - scores).sum() < self.tolerance
+            scores = updated
+            if converged:
+                break
+        return scores / scores.sum()
+
+    def summarize(self, chapter: str) -> str:
+        """
+        Returns:
+            str: The best ranked sentences of the chapter in reading order, at most `max_chars` long.
+        """
+        sentences = split_sentences(chapter)
+        if not sentences:
+            return _cut(" ".join(chapter.split()), self.max_chars)
+        if len(sentences) > self.max_sentences:
+            positions = np.linspace(0, len(sentences) - 1, self.max_sentences).round().astype(int)
+            sentences = [sentences[position] for position in positions]
+
+        order = np.argsort(-self.rank(sentences), kind="stable")
+        chosen, length = [], 0
+        for position in order:
+            sentence_length = len(sentences[position]) + (1 if chosen else 0)
+            if length + sentence_length <= self.max_chars:
+                chosen.append(position)
+                length += sentence_length
+        if not chosen:
+            # Even the best sentence is too long
+            return _cut(sentences[order[0]], self.max_chars)
+        return " ".join(sentences[position] for position in sorted(chosen))
+
+
+class ChaptersSummaryLocal(ChaptersSummary):
+    """
+    Summarizes the chapters of an EPUB book on the CPU, without any network call, e.g. for a fast draft trailer.
+
+    Attributes:
+        summarizer (TextRankSummarizer): Backend producing the summary of one chapter.
+    """
+
+    def __init__(self, book_file_path: str, summarizer: Optional[TextRankSummarizer] = None, max_workers: int = 1,
+                 filter_spine: bool = True, index=None):
+        super().__init__(book_file_path, max_workers=max_workers, filter_spine=filter_spine, index=index)
+        self.summarizer = summarizer or TextRankSummarizer()
+
+    def summarize_chapter(self, index: int, chapter: str) -> str:
+        with metrics.stage("summarize", book=os.path.basename(self.book_file_path), chapter=index + 1,
+                           model=self.summarizer.name):
+            return f"Chapter {index + 1}: {self.summarizer.summarize(chapter)}"
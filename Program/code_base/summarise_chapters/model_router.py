@@ -0,0 +1,242 @@
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+from .chunking import ChapterTokenPlan
+
+
+@dataclass
+class ModelProfile:
+    """
+    Price and expected speed of a chat model.
+
+    Attributes:
+        name (str): Model name sent to the API.
+        prompt_price_per_1k (float): USD per 1000 prompt tokens.
+        completion_price_per_1k (float): USD per 1000 completion tokens.
+        seconds_per_request (float): Expected latency of one request before any has been observed.
+    """
+    name: str
+    prompt_price_per_1k: float
+    completion_price_per_1k: float
+    seconds_per_request: float
+
+    def cost(self, plan: ChapterTokenPlan) -> float:
+        return plan.cost(self.prompt_price_per_1k, self.completion_price_per_1k)
+
+
+# List prices; models missing here can be routed to by passing a ModelProfile
+KNOWN_MODELS = {
+    "gpt-4o": ModelProfile("gpt-4o", 0.0025, 0.01, 4.0),
+    "gpt-4o-mini": ModelProfile("gpt-4o-mini", 0.00015, 0.0006, 2.0),
+    "gpt-4-turbo": ModelProfile("gpt-4-turbo", 0.01, 0.03, 6.0),
+    "gpt-3.5-turbo": ModelProfile("gpt-3.5-turbo", 0.0005, 0.0015, 2.0),
+}
+
+
+@dataclass
+class RouteDecision:
+    """
+    How one chapter is summarized.
+
+    Attributes:
+        index (int): 0-based chapter index.
+        model (str): Model to use.
+        max_input_tokens (int | None): Chapter tokens to send; None sends the whole chapter, 0 sends nothing (the
+            token budget is exhausted and the chapter gets an extractive fallback summary).
+        reason (str): Why this route was picked.
+    """
+    index: int
+    model: str
+    max_input_tokens: Optional[int] = None
+    reason: str = "preferred model"
+
+
+class ModelRouter:
+    """
+    Picks the model of every chapter summary under per-book token, cost and latency budgets.
+
+    Models are listed from most to least preferred. Each chapter goes to the most preferred model for which the
+    projection of the whole remaining book (already spent + in flight + this and all unstarted chapters on that
+    model) stays within the cost and latency budgets; projected latency uses the response times observed so far.
+    When no model fits, the cheapest one is used. The token budget is hard: when the remaining chapters do not
+    fit, each gets an even share of what is left and is shortened to it (sampled windows), and once a share is
+    below `min_chapter_tokens` chapters are no longer sent at all. Nothing fails because of a budget.
+
+    Call start() with the token plans of a book, then route(), record() and finish() for each chapter, and report()
+    at the end for projected against actual spend and time.
+
+    Attributes:
+        models (List[ModelProfile]): Candidate models, most preferred first.
+        token_budget (int | None): Hard cap on prompt + completion tokens per book.
+        cost_budget (float | None): Soft cap on USD per book.
+        latency_budget (float | None): Soft cap on summarization wall time per book, in seconds.
+        concurrency (int): Chapters summarized at once, used to turn request latency into wall time.
+        min_chapter_tokens (int): Smallest chapter share still worth a request.
+        smoothing (float): Weight of the newest observation in the moving average of response times.
+    """
+
+    def __init__(self, models: Sequence, token_budget: Optional[int] = None, cost_budget: Optional[float] = None,
+                 latency_budget: Optional[float] = None, concurrency: int = 1, min_chapter_tokens: int = 200,
+                 smoothing: float = 0.3):
+        self.models = []
+        for model in models:
+            if isinstance(model, str):
+                if model not in KNOWN_MODELS:
+                    raise ValueError(f"No prices known for {model}; pass a ModelProfile instead.")
+                model = KNOWN_MODELS[model]
+            self.models.append(model)
+        if not self.models:
+            raise ValueError("ModelRouter needs at least one model.")
+        self.token_budget = token_budget
+        self.cost_budget = cost_budget
+        self.latency_budget = latency_budget
+        self.concurrency = max(1, concurrency)
+        self.min_chapter_tokens = min_chapter_tokens
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._latency = {model.name: model.seconds_per_request for model in self.models}
+        self.start([])
+
+    def _model(self, name: str) -> ModelProfile:
+        return next(model for model in self.models if model.name == name)
+
+    def start(self, plans: List[ChapterTokenPlan]):
+        """
+        Resets the accounting for a new book and records the projection of routing it with no adjustment.
+        """
+        with self._lock:
+            self._plans = {plan.index: plan for plan in plans}
+            self._pending = set(self._plans)
+            self._reserved = {}  # index -> (tokens, cost) of chapters in flight
+            self._decisions: Dict[int, RouteDecision] = {}
+            self._spent_tokens = 0
+            self._spent_cost = 0.0
+            self._requests = 0
+            self._started = time.monotonic()
+            self._finished = self._started
+
+        preferred = self.models[0]
+        self.projected = {
+            "model": preferred.name,
+            "tokens": sum(plan.total_tokens for plan in plans),
+            "cost": sum(preferred.cost(plan) for plan in plans),
+            "seconds": sum(plan.rounds for plan in plans) * preferred.seconds_per_request / self.concurrency,
+        }
+
+    def planned(self, index: int) -> Optional[ChapterTokenPlan]:
+        """Plan of a chapter passed to start(), if any."""
+        with self._lock:
+            return self._plans.get(index)
+
+    def _remaining_seconds(self, model: ModelProfile, plans: List[ChapterTokenPlan]) -> float:
+        return sum(plan.rounds for plan in plans) * self._latency[model.name] / self.concurrency
+
+    def route(self, plan: ChapterTokenPlan) -> RouteDecision:
+        """
+        Picks the model and input size of a chapter and reserves its projected tokens and cost.
+        """
+        with self._lock:
+            self._pending.discard(plan.index)
+            remaining = [plan] + [self._plans[index] for index in self._pending]
+            committed_tokens = self._spent_tokens + sum(tokens for tokens, _ in self._reserved.values())
+            committed_cost = self._spent_cost + sum(cost for _, cost in self._reserved.values())
+            elapsed = time.monotonic() - self._started
+
+            decision = None
+            for model in self.models:
+                cost = committed_cost + sum(model.cost(chapter) for chapter in remaining)
+                seconds = elapsed + self._remaining_seconds(model, remaining)
+                if self.cost_budget is not None and cost > self.cost_budget:
+                    continue
+                if self.latency_budget is not None and seconds > self.latency_budget:
+                    continue
+                reason = "preferred model" if model is self.models[0] else "within cost/latency budget"
+                decision = RouteDecision(plan.index, model.name, reason=reason)
+                break
+            if decision is None:
+                cheapest = min(self.models, key=lambda model: (model.cost(plan), self._latency[model.name]))
+                decision = RouteDecision(plan.index, cheapest.name, reason="over cost/latency budget, cheapest model")
+
+            tokens = plan.total_tokens
+            if self.token_budget is not None:
+                remaining_tokens = sum(chapter.total_tokens for chapter in remaining)
+                if committed_tokens + remaining_tokens > self.token_budget:
+                    share = max(0, self.token_budget - committed_tokens) // len(remaining)
+                    if share < plan.total_tokens:
+                        # Instructions and completion come out of the share too
+                        input_tokens = plan.chapter_tokens * share // plan.total_tokens
+                        if input_tokens < self.min_chapter_tokens:
+                            decision.max_input_tokens, decision.reason = 0, "token budget exhausted"
+                            tokens = 0
+                        else:
+                            decision.max_input_tokens = input_tokens
+                            decision.reason += f", truncated to {input_tokens} tokens (token budget)"
+                            tokens = share
+
+            model = self._model(decision.model)
+            self._reserved[plan.index] = (tokens, model.cost(plan) * tokens / max(1, plan.total_tokens))
+            self._decisions[plan.index] = decision
+        return decision
+
+    def record(self, model: str, prompt_tokens: int, completion_tokens: int, seconds: float):
+        """
+        Accounts one completed request and updates the observed response time of its model.
+        """
+        with self._lock:
+            profile = self._model(model)
+            self._spent_tokens += prompt_tokens + completion_tokens
+            self._spent_cost += (prompt_tokens * profile.prompt_price_per_1k
+                                 + completion_tokens * profile.completion_price_per_1k) / 1000
+            self._requests += 1
+            self._latency[model] = (1 - self.smoothing) * self._latency[model] + self.smoothing * seconds
+            self._finished = time.monotonic()
+
+    def finish(self, index: int):
+        """
+        Releases the reservation of a chapter once its requests are recorded (or it was served from a cache).
+        """
+        with self._lock:
+            self._reserved.pop(index, None)
+            self._pending.discard(index)
+
+    def report(self) -> dict:
+        """
+        Returns:
+            dict: {"projected": {"model", "tokens", "cost", "seconds"}, "actual": {"tokens", "cost", "seconds",
+            "requests"}, "models": chapters per model, "truncated": [...], "not_sent": [...]} with 0-based
+            chapter indices.
+        """
+        with self._lock:
+            decisions = sorted(self._decisions.values(), key=lambda decision: decision.index)
+            return {
+                "projected": dict(self.projected),
+                "actual": {
+                    "tokens": self._spent_tokens,
+                    "cost": round(self._spent_cost, 6),
+                    "seconds": self._finished - self._started,
+                    "requests": self._requests,
+                },
+                "models": dict(Counter(decision.model for decision in decisions if decision.max_input_tokens != 0)),
+                "truncated": [decision.index for decision in decisions if decision.max_input_tokens],
+                "not_sent": [decision.index for decision in decisions if decision.max_input_tokens == 0],
+            }
+
+    @classmethod
+    def from_env(cls, environ, concurrency: int = 1) -> "ModelRouter":
+        """
+        Builds a router from OPENAI_MODELS (comma-separated, most preferred first; defaults to gpt-3.5-turbo
+        falling back to gpt-4o-mini), OPENAI_TOKEN_BUDGET, OPENAI_COST_BUDGET (USD) and OPENAI_LATENCY_BUDGET
+        (seconds).
+        """
+        def number(name, kind):
+            value = environ.get(name)
+            return kind(value) if value else None
+
+        models = [name.strip() for name in environ.get("OPENAI_MODELS", "gpt-3.5-turbo,gpt-4o-mini").split(",")
+                  if name.strip()]
+        return cls(models, token_budget=number("OPENAI_TOKEN_BUDGET", int),
+                   cost_budget=number("OPENAI_COST_BUDGET", float),
+                   latency_budget=number("OPENAI_LATENCY_BUDGET", float), concurrency=concurrency)
@@ -0,0 +1,77 @@
+import threading
+import time
+from typing import Optional
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens in a piece of text.
+
+    Uses tiktoken when it is installed and falls back to the usual ~4 characters per token rule otherwise.
+
+    Args:
+        text (str): Text to measure.
+
+    Returns:
+        int: Estimated token count.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return max(1, len(text) // 4)
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+
+class RateLimiter:
+    """
+    Token-bucket scheduler enforcing requests-per-minute and tokens-per-minute budgets across threads.
+
+    Both buckets start full and refill continuously. `acquire` blocks until one request and the requested number of
+    tokens fit in both buckets, then consumes them.
+
+    Attributes:
+        requests_per_minute (int | None): Request budget, or None for no limit.
+        tokens_per_minute (int | None): Token budget, or None for no limit.
+    """
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed * self.tokens_per_minute / 60)
+
+    def acquire(self, tokens: int = 0):
+        """
+        Blocks until a request using `tokens` tokens is allowed by both budgets.
+
+        Args:
+            tokens (int): Estimated prompt plus completion tokens of the request. Requests larger than the whole
+                per-minute budget are clamped to it so they can still go through.
+        """
+        if self.tokens_per_minute:
+            tokens = min(tokens, self.tokens_per_minute)
+
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.requests_per_minute)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tokens_per_minute)
+                if wait <= 0:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+            time.sleep(wait)
@@ -0,0 +1,231 @@
+import hashlib
+import heapq
+import re
+from dataclasses import dataclass, field
+from typing import FrozenSet, Iterable, Iterator, List, Optional
+
+# Structural types (OPF 2 <guide> reference types, EPUB 3 landmarks and epub:type values) of non-story documents
+FRONT_MATTER_TYPES = {
+    "cover", "title-page", "titlepage", "halftitlepage", "copyright-page", "copyright", "toc", "loi", "lot",
+    "dedication", "epigraph", "acknowledgements", "acknowledgments", "colophon", "imprint", "imprimatur",
+    "foreword", "preface", "index", "glossary", "bibliography", "notes", "endnotes", "footnotes", "rearnotes",
+    "other-credits", "contributors", "errata", "landmarks", "page-list", "appendix",
+}
+
+# First heading (or first line) of a non-story document
+_FRONT_MATTER_HEADING = re.compile(
+    r"^(table of )?contents$|^copyright\b|^dedication$|^acknowledge?ments?$|^about the (author|authors|publisher)\b"
+    r"|^also (by|available)\b|^(other )?books by\b|^by the same author\b|^title page$|^cover$|^praise for\b"
+    r"|^index$|^colophon$|^imprint$|^foreword$|^preface$|^introduction by\b|^epigraph$|^bibliography$|^notes$"
+    r"|^endnotes$|^glossary$|^list of (illustrations|figures|tables|maps)$|^afterword$|^author'?s note$",
+    re.IGNORECASE
+)
+# First heading (or first line) of a story document
+_STORY_HEADING = re.compile(
+    r"^(chapter|part|book|prologue|epilogue|interlude)\b|^[ivxlcdm]+\.?$|^\d+\.?$"
+    r"|^(one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve)$",
+    re.IGNORECASE
+)
+_ISBN = re.compile(r"\bISBN\b", re.IGNORECASE)
+_RIGHTS = re.compile(r"all rights reserved|©|\(c\)|copyright", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class SpineDocument:
+    """
+    One spine item of an EPUB with the structural hints that help telling story chapters from front matter.
+
+    Attributes:
+        position (int): 0-based position in the spine.
+        item_id (str): Manifest ID of the item.
+        path (str): Path of the document inside the EPUB archive.
+        text (str): Extracted text.
+        linear (bool): False for spine items declared linear="no" (auxiliary content).
+        properties (frozenset): Manifest and itemref properties, e.g. "nav".
+        types (frozenset): OPF guide types, EPUB 3 landmarks and epub:type values of the body/sections.
+        title (str | None): Label of the document in the NCX or EPUB 3 table of contents.
+    """
+    position: int
+    item_id: str
+    path: str
+    text: str
+    linear: bool = True
+    properties: FrozenSet[str] = field(default_factory=frozenset)
+    types: FrozenSet[str] = field(default_factory=frozenset)
+    title: Optional[str] = None
+
+    @property
+    def heading(self) -> str:
+        """Table of contents label, or the first line of the text."""
+        if self.title:
+            return self.title.strip()
+        return self.text.split("\n", 1)[0].strip()[:100]
+
+
+@dataclass
+class SkippedSpineItem:
+    """
+    A spine item dropped before summarization.
+
+    Attributes:
+        position (int): 0-based position in the spine.
+        path (str): Path of the document inside the EPUB archive.
+        heading (str): Table of contents label or first line of the document.
+        chars (int): Length of the extracted text.
+        reason (str): Why the item was not treated as a story chapter.
+    """
+    position: int
+    path: str
+    heading: str
+    chars: int
+    reason: str
+
+
+def minhash_sketch(text: str, size: int = 128, shingle_size: int = 5) -> List[int]:
+    """
+    Bottom-k MinHash sketch of a text: the `size` smallest 64-bit hashes of its word shingles.
+
+    Args:
+        text (str): Document text.
+        size (int): Number of hashes kept.
+        shingle_size (int): Words per shingle.
+
+    Returns:
+        List[int]: Sorted hashes.
+    """
+    words = _WORD.findall(text.lower())
+    shingles = {" ".join(words[start:start + shingle_size])
+                for start in range(max(1, len(words) - shingle_size + 1))}
+    hashes = (int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), "little")
+              for shingle in shingles)
+    return heapq.nsmallest(size, hashes)
+
+
+def estimate_similarity(sketch_a: List[int], sketch_b: List[int], size: int = 128) -> float:
+    """
+    Estimates the Jaccard similarity of the shingle sets of two texts from their bottom-k sketches.
+    """
+    if not sketch_a or not sketch_b:
+        return 0.0
+    union = heapq.nsmallest(size, set(sketch_a) | set(sketch_b))
+    shared = set(sketch_a) & set(sketch_b)
+    return sum(1 for value in union if value in shared) / len(union)
+
+
+class SpineFilter:
+    """
+    Drops spine items that are not story chapters (covers, copyright pages, tables of contents, dedications,
+    separator pages, duplicates) before any of them is summarized or rendered.
+
+    An item is skipped, in this order, when it is declared non-linear or is the navigation document, when the OPF
+    guide, EPUB 3 landmarks or its epub:type mark it as front/back matter, when its table of contents label or
+    first line is a front matter heading, when it is a copyright page, when it is too short, or when its text is a
+    near-duplicate (MinHash over word shingles) of an item already kept.
+
+    Items with a table of contents label or a story heading ("Chapter 3", "IV", ...) only need `min_labelled_chars`
+    characters, so books of short chapters keep them; other items need `min_chars`. If the length rule would leave
+    no chapter at all, the short items are kept after all.
+
+    Attributes:
+        min_chars (int): Shortest text treated as a chapter.
+        min_labelled_chars (int): Shortest text treated as a chapter when the item has a table of contents label or a
+            story heading; lower, but still above separator pages such as "Part One".
+        duplicate_threshold (float): Estimated Jaccard similarity from which an item is a duplicate.
+        sketch_size (int): Hashes per MinHash sketch.
+        shingle_size (int): Words per shingle.
+        skipped (List[SkippedSpineItem]): Items skipped by the last filter() run, with the reason.
+    """
+
+    def __init__(self, min_chars: int = 1000, min_labelled_chars: int = 200, duplicate_threshold: float = 0.9,
+                 sketch_size: int = 128, shingle_size: int = 5):
+        self.min_chars = min_chars
+        self.min_labelled_chars = min_labelled_chars
+        self.duplicate_threshold = duplicate_threshold
+        self.sketch_size = sketch_size
+        self.shingle_size = shingle_size
+        self.skipped: List[SkippedSpineItem] = []
+
+    def classify(self, document: SpineDocument) -> Optional[str]:
+        """
+        Checks a document on its own (everything but duplicates).
+
+        Returns:
+            str | None: Why the document is not a story chapter, or None if it looks like one.
+        """
+        if not document.linear:
+            return 'non-linear spine item (linear="no")'
+        if "nav" in document.properties:
+            return "navigation document"
+        front_matter_types = sorted(document.types & FRONT_MATTER_TYPES)
+        if front_matter_types:
+            return f"marked as {', '.join(front_matter_types)}"
+        text = document.text.strip()
+        if not text:
+            return "no text"
+        heading = document.heading
+        if _FRONT_MATTER_HEADING.search(heading.rstrip(".:")):
+            return f'front matter heading "{heading}"'
+        if len(text) < 4 * self.min_chars and _ISBN.search(text) and _RIGHTS.search(text):
+            return "copyright page"
+        min_chars = self.min_chars_of(document)
+        if len(text) < min_chars:
+            return f"only {len(text)} characters (< {min_chars})"
+        return None
+
+    def min_chars_of(self, document: SpineDocument) -> int:
+        """Length a document needs to be a chapter: lower for items labelled in the table of contents or headed
+        like a story chapter."""
+        if document.title or _STORY_HEADING.search(document.heading.rstrip(".:")):
+            return self.min_labelled_chars
+        return self.min_chars
+
+    def filter(self, documents: Iterable[SpineDocument]) -> Iterator[SpineDocument]:
+        """
+        Yields the story chapters among `documents`, lazily and in order; the others are recorded in `skipped`.
+        The first of several near-identical documents is kept. When no document passes, the ones skipped only for
+        their length are yielded at the end instead, as the book is then made of short chapters.
+        """
+        self.skipped = []
+        kept_sketches = []  # (position, sketch)
+        short_documents = []
+        yielded = False
+        for document in documents:
+            reason = self.classify(document)
+            if reason is None:
+                reason = self._duplicate_of(document, kept_sketches)
+            elif reason.startswith("only "):
+                short_documents.append(document)
+
+            if reason is None:
+                yielded = True
+                yield document
+            else:
+                self._skip(document, reason)
+
+        if not yielded and short_documents:
+            print("No spine item is long enough to be a chapter; keeping the short ones")
+            self.skipped = [item for item in self.skipped
+                            if item.position not in {document.position for document in short_documents}]
+            for document in short_documents:
+                reason = self._duplicate_of(document, kept_sketches)
+                if reason is None:
+                    yield document
+                else:
+                    self._skip(document, reason)
+
+    def _duplicate_of(self, document: SpineDocument, kept_sketches: list) -> Optional[str]:
+        """
+        Returns why `document` is a near-duplicate of a kept one, or None after adding its sketch to `kept_sketches`.
+        """
+        sketch = minhash_sketch(document.text, self.sketch_size, self.shingle_size)
+        for position, kept_sketch in kept_sketches:
+            similarity = estimate_similarity(sketch, kept_sketch, self.sketch_size)
+            if similarity >= self.duplicate_threshold:
+                return f"near-duplicate of spine item {position} ({similarity:.0%} similar)"
+        kept_sketches.append((document.position, sketch))
+        return None
+
+    def _skip(self, document: SpineDocument, reason: str):
+        self.skipped.append(SkippedSpineItem(document.position, document.path, document.heading,
+                                             len(document.text), reason))
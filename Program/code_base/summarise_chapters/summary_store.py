@@ -0,0 +1,82 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from instrumentation import metrics
+
+
+class SummaryStore:
+    """
+    Persistent SQLite store of chapter summaries.
+
+    Summaries are keyed by (hash of the chapter text, model name, prompt template version), so re-uploading the same
+    EPUB, or another edition sharing most chapters, only pays for the chapters whose text changed. Bumping the
+    prompt template version invalidates every stored summary for that prompt.
+
+    Attributes:
+        db_path (str): Path to the SQLite database file.
+        hits (int): Number of lookups answered from the store.
+        misses (int): Number of lookups that found nothing.
+    """
+
+    def __init__(self, db_path: str = "summary_store.sqlite3"):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                " text_hash TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " prompt_version TEXT NOT NULL,"
+                " summary TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (text_hash, model, prompt_version))"
+            )
+
+    @staticmethod
+    def text_hash(chapter_text: str) -> str:
+        return hashlib.sha256(chapter_text.encode("utf-8")).hexdigest()
+
+    def get(self, chapter_text: str, model: str, prompt_version: str) -> Optional[str]:
+        """
+        Looks up the stored summary of a chapter.
+
+        Returns:
+            str | None: The summary, or None if this chapter was never summarized with this model and prompt.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT summary FROM summaries WHERE text_hash = ? AND model = ? AND prompt_version = ?",
+                (self.text_hash(chapter_text), model, str(prompt_version))
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                metrics.cache_lookup("summary", hit=False)
+                return None
+            self.hits += 1
+            metrics.cache_lookup("summary", hit=True)
+            return row[0]
+
+    def put(self, chapter_text: str, model: str, prompt_version: str, summary: str):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                (self.text_hash(chapter_text), model, str(prompt_version), summary, time.time())
+            )
+
+    def stats(self) -> dict:
+        """
+        Returns:
+            dict: Hit/miss counters of this store instance and the number of stored summaries.
+        """
+        with self._lock:
+            (stored,) = self._connection.execute("SELECT COUNT(*) FROM summaries").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "stored": stored}
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,72 @@
+import json
+
+from .chapter_summary import ChaptersSummaryAI
+from .rate_limiter import estimate_tokens
+
+
+def _summarizer(batch_tokens):
+    return ChaptersSummaryAI("book.epub", "key", base_url="http://127.0.0.1:9", batch_tokens=batch_tokens)
+
+
+def test_parse_batch_response_keeps_valid_entries():
+    content = json.dumps({"summaries": [{"chapter": 3, "summary": " A storm. "}, {"chapter": "4", "summary": "Dawn."}]})
+    assert ChaptersSummaryAI.parse_batch_response(content, [2, 3]) == {2: "A storm.", 3: "Dawn."}
+
+
+def test_parse_batch_response_accepts_a_bare_list():
+    content = json.dumps([{"chapter": 1, "summary": "A ship."}])
+    assert ChaptersSummaryAI.parse_batch_response(content, [0]) == {0: "A ship."}
+
+
+def test_parse_batch_response_drops_repeated_chapters():
+    content = json.dumps({"summaries": [{"chapter": 1, "summary": "One."}, {"chapter": 2, "summary": "Two."},
+                                        {"chapter": 1, "summary": "One again."}]})
+    assert ChaptersSummaryAI.parse_batch_response(content, [0, 1]) == {1: "Two."}
+
+
+def test_parse_batch_response_leaves_out_missing_chapters():
+    content = json.dumps({"summaries": [{"chapter": 1, "summary": "One."}]})
+    assert ChaptersSummaryAI.parse_batch_response(content, [0, 1, 2]) == {0: "One."}
+
+
+def test_parse_batch_response_skips_malformed_entries():
+    content = json.dumps({"summaries": [
+        {"chapter": "three", "summary": "Not a number."},
+        {"chapter": True, "summary": "A boolean."},
+        {"chapter": 2.5, "summary": "Not an integer."},
+        {"chapter": 9, "summary": "Not asked for."},
+        {"chapter": 1, "summary": "   "},
+        {"chapter": 2},
+        "Chapter 3: not an object",
+        {"chapter": 3, "summary": "Three."},
+    ]})
+    assert ChaptersSummaryAI.parse_batch_response(content, [0, 1, 2]) == {2: "Three."}
+
+
+def test_parse_batch_response_rejects_invalid_json():
+    assert ChaptersSummaryAI.parse_batch_response("Chapter 1: a ship.", [0]) == {}
+    assert ChaptersSummaryAI.parse_batch_response(json.dumps({"summaries": "a ship"}), [0]) == {}
+    assert ChaptersSummaryAI.parse_batch_response(None, [0]) == {}
+
+
+def test_batch_chapters_groups_short_chapters():
+    chapter = "The ship sailed on. " * 20
+    summarizer = _summarizer(batch_tokens=3 * estimate_tokens(chapter))
+    assert summarizer.batch_chapters([chapter] * 7) == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_batch_chapters_caps_chapters_per_batch():
+    chapter = "The ship sailed on. " * 2
+    summarizer = _summarizer(batch_tokens=100 * estimate_tokens(chapter))
+    groups = summarizer.batch_chapters([chapter] * 10)
+    assert groups == [list(range(summarizer.batch_max_chapters)), list(range(summarizer.batch_max_chapters, 10))]
+
+
+def test_batch_chapters_keeps_long_chapters_alone():
+    short, long = "The ship sailed on. " * 20, "The ship sailed on. " * 200
+    summarizer = _summarizer(batch_tokens=4 * estimate_tokens(short))
+    assert summarizer.batch_chapters([short, short, long, short]) == [[0, 1], [2], [3]]
+
+
+def test_batch_chapters_without_batching():
+    assert _summarizer(batch_tokens=None).batch_chapters(["a", "b", "c"]) == [[0], [1], [2]]
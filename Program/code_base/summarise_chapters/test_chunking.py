@@ -0,0 +1,45 @@
+from .chunking import split_into_chunks
+from .rate_limiter import estimate_tokens
+
+
+def test_split_into_chunks_keeps_a_chapter_that_fits():
+    text = "The ship sailed on.\nThe storm came."
+    assert split_into_chunks(text, 1000) == [text]
+
+
+def test_split_into_chunks_cuts_on_line_boundaries():
+    lines = [f"Paragraph {number} of the chapter, where the ship sails on through the storm." for number in range(40)]
+    chunks = split_into_chunks("\n".join(lines), 100)
+    assert len(chunks) > 1
+    # Whole lines, in order, none lost
+    assert "\n".join(chunks).split("\n") == lines
+    for chunk in chunks:
+        assert sum(estimate_tokens(line) for line in chunk.split("\n")) <= 100
+
+
+def test_split_into_chunks_cuts_long_lines_on_words():
+    line = " ".join(f"word{number}" for number in range(2000))
+    chunks = split_into_chunks(line, 100)
+    assert len(chunks) > 1
+    assert " ".join(chunks).split() == line.split()
+
+
+def test_split_into_chunks_cuts_long_lines_without_spaces():
+    line = "x" * 5000
+    chunks = split_into_chunks(line, 100)
+    assert len(chunks) > 1
+    assert "".join(chunks) == line
+
+
+def test_split_into_chunks_does_not_cut_at_an_early_space():
+    line = "a " + "x" * 5000
+    chunks = split_into_chunks(line, 100)
+    assert len(chunks[0]) > 100
+    assert "".join(chunks).replace(" ", "") == line.replace(" ", "")
+
+
+def test_split_into_chunks_leaves_out_empty_windows():
+    text = "\n".join(["word " * 100] + [" "] * 50 + ["word " * 100])
+    chunks = split_into_chunks(text, 100)
+    assert all(chunk.strip() for chunk in chunks)
+    assert split_into_chunks("", 100) == [""]
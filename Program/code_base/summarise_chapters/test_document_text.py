@@ -0,0 +1,33 @@
+import pytest
+
+from .chapter_summary import _document_text_bs4, _document_text_lxml
+
+TEXT = "Café “quoted” — naïve"
+
+DOCUMENTS = {
+    "utf-8 without declaration": f"<html><body><h1>One</h1><p>{TEXT}</p></body></html>".encode("utf-8"),
+    "utf-8 with BOM": f"<html><body><p>{TEXT} 中文</p></body></html>".encode("utf-8-sig"),
+    "xml declaration": (f'<?xml version="1.0" encoding="windows-1252"?><html xmlns="http://www.w3.org/1999/xhtml">'
+                        f"<body><p>{TEXT}</p></body></html>").encode("cp1252"),
+    "meta charset": (f'<html><head><meta charset="windows-1252"/><title>T</title></head>'
+                     f"<body><p>{TEXT}</p></body></html>").encode("cp1252"),
+    "meta http-equiv": ('<html><head><meta http-equiv="Content-Type" content="text/html; charset=windows-1252"/>'
+                        f"</head><body><p>{TEXT}</p></body></html>").encode("cp1252"),
+    "utf-16 little endian": f"<html><body><p>{TEXT} 中文</p></body></html>".encode("utf-16"),
+    "utf-16 big endian": b"\xfe\xff" + f"<html><body><p>{TEXT} 中文</p></body></html>".encode("utf-16-be"),
+    "latin-1 without declaration": f"<html><body><p>{TEXT[:4]}</p></body></html>".encode("latin-1"),
+    "cdata": b"<html><body><p>Before</p><![CDATA[Inside]]><p>After</p></body></html>",
+    "comments and scripts": (b"<html><body><p>Kept<!-- note -->tail</p><script>var x;</script>"
+                             b"<style>p {}</style><p>Last</p></body></html>"),
+}
+
+
+@pytest.mark.parametrize("name", sorted(DOCUMENTS))
+def test_lxml_text_matches_html_parser(name):
+    assert _document_text_lxml(DOCUMENTS[name]) == _document_text_bs4(DOCUMENTS[name])
+
+
+def test_declared_encodings_are_decoded():
+    assert TEXT in _document_text_lxml(DOCUMENTS["meta charset"])
+    assert TEXT in _document_text_lxml(DOCUMENTS["utf-16 big endian"])
+    assert "\ufffd" not in _document_text_lxml(DOCUMENTS["latin-1 without declaration"])
@@ -0,0 +1,70 @@
+import json
+import os
+
+import pytest
+
+from benchmarks.synthetic_epub import write_synthetic_epub
+
+from .chapter_summary import iter_spine_documents
+from .epub_index import INDEX_NAME, EpubIndex
+
+
+@pytest.fixture
+def book(tmp_path):
+    return write_synthetic_epub(str(tmp_path / "book.epub"), chapters=4, paragraphs_per_chapter=5,
+                                words_per_paragraph=20, front_matter=True)
+
+
+def test_build_matches_the_epub(book, tmp_path):
+    index = EpubIndex.build(book, str(tmp_path / "index"))
+    expected = list(iter_spine_documents(book))
+    assert list(index.documents()) == expected
+    assert len(index) == len(expected)
+    assert index.chapter_text(expected[-1].position) == expected[-1].text
+    assert index.document(expected[0].position) == expected[0]
+    assert index.stats()["chars"] == sum(len(document.text) for document in expected)
+    assert index.stats()["documents"] == len(expected)
+
+
+def test_load_returns_the_stored_index(book, tmp_path):
+    index_dir = str(tmp_path / "index")
+    assert EpubIndex.load(index_dir) is None
+    built = EpubIndex.build(book, index_dir)
+    loaded = EpubIndex.load(index_dir)
+    assert (loaded.source, loaded.entries, loaded.stats()) == (built.source, built.entries, built.stats())
+    assert list(loaded.documents()) == list(built.documents())
+
+
+def test_load_ignores_older_formats_and_missing_text(book, tmp_path):
+    index_dir = str(tmp_path / "index")
+    index = EpubIndex.build(book, index_dir)
+    os.remove(index.text_path)
+    assert EpubIndex.load(index_dir) is None
+
+    EpubIndex.build(book, index_dir)
+    index_path = os.path.join(index_dir, INDEX_NAME)
+    with open(index_path) as file:
+        data = json.load(file)
+    with open(index_path, "w") as file:
+        json.dump(dict(data, version=0), file)
+    assert EpubIndex.load(index_dir) is None
+
+
+def test_load_or_build_reuses_a_current_index(book, tmp_path, monkeypatch):
+    index_dir = str(tmp_path / "index")
+    digest = EpubIndex.build(book, index_dir).source["sha256"]
+    monkeypatch.setattr(EpubIndex, "build", classmethod(lambda *args, **kwargs: pytest.fail("index rebuilt")))
+    assert EpubIndex.load_or_build(book, index_dir).source["sha256"] == digest
+    assert EpubIndex.load_or_build(book, index_dir, digest=digest).source["sha256"] == digest
+
+
+def test_load_or_build_rebuilds_when_the_epub_changes(book, tmp_path):
+    index_dir = str(tmp_path / "index")
+    old = EpubIndex.build(book, index_dir)
+    write_synthetic_epub(book, chapters=2, paragraphs_per_chapter=5, words_per_paragraph=20)
+    new = EpubIndex.load_or_build(book, index_dir)
+    assert new.source["sha256"] != old.source["sha256"]
+    assert list(new.documents()) == list(iter_spine_documents(book))
+
+    # With a digest, a different one is a different book even if size and modification time match
+    assert EpubIndex.load_or_build(book, index_dir, digest="0" * 64).source["sha256"] == "0" * 64
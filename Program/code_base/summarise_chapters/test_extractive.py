@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from .extractive import TextRankSummarizer, _cut, split_sentences
+
+CHAPTER = """Chapter One
+The storm broke over the harbour at dawn.
+The captain ordered the ship out of the harbour before the storm grew worse. A gull circled the mast twice.
+The storm drove the ship and the captain far from the harbour. Nobody in the village slept that night.
+"""
+
+
+def test_split_sentences():
+    assert split_sentences(CHAPTER) == [
+        "The storm broke over the harbour at dawn.",
+        "The captain ordered the ship out of the harbour before the storm grew worse.",
+        "A gull circled the mast twice.",
+        "The storm drove the ship and the captain far from the harbour.",
+        "Nobody in the village slept that night.",
+    ]
+
+
+def test_split_sentences_keeps_closing_quotes_and_drops_short_fragments():
+    assert split_sentences("He shouted “Get down now!” The wall fell on the cart.") == [
+        "He shouted “Get down now!”", "The wall fell on the cart."]
+    assert split_sentences("(The cart was already gone.) They ran to the gate.") == [
+        "(The cart was already gone.)", "They ran to the gate."]
+    assert split_sentences("Part One\nIV\nThe end. Yes.") == []
+
+
+def test_cut_stops_on_a_word_boundary():
+    assert _cut("a short text", 50) == "a short text"
+    assert _cut("the storm broke over the harbour", 20) == "the storm broke"
+    assert _cut("unbreakablewordwithoutspaces", 10) == "unbreakabl"
+
+
+def test_rank_favours_connected_sentences():
+    sentences = split_sentences(CHAPTER)
+    scores = TextRankSummarizer().rank(sentences)
+    assert scores.sum() == pytest.approx(1)
+    # The sentences about the storm, ship and harbour outrank the gull and the village
+    assert set(np.argsort(-scores)[:3]) == {0, 1, 3}
+
+
+def test_rank_without_content_words_is_uniform():
+    assert TextRankSummarizer().rank(["It was what it was.", "And so it is."]) == pytest.approx([0.5, 0.5])
+
+
+def test_summary_fits_max_chars_in_reading_order():
+    sentences = split_sentences(CHAPTER)
+    for max_chars in (40, 80, 150, 400):
+        summary = TextRankSummarizer(max_chars=max_chars).summarize(CHAPTER)
+        assert len(summary) <= max_chars
+        positions = [sentences.index(sentence) for sentence in split_sentences(summary)]
+        assert positions == sorted(positions)
+    assert TextRankSummarizer(max_chars=1000).summarize(CHAPTER) == " ".join(sentences)
+
+
+def test_summary_without_sentences_falls_back_to_the_text():
+    assert TextRankSummarizer(max_chars=20).summarize("Part One\n\nThe   Storm") == "Part One The Storm"
+    assert TextRankSummarizer(max_chars=10).summarize("Part One\n\nThe   Storm") == "Part One"
+
+
+def test_long_chapters_are_sampled():
+    chapter = "\n".join(f"Sentence number {number} tells of the storm." for number in range(50))
+    summary = TextRankSummarizer(max_chars=100, max_sentences=10).summarize(chapter)
+    assert 0 < len(summary) <= 100
@@ -0,0 +1,59 @@
+from .chunking import ChapterTokenPlan
+from .model_router import ModelRouter
+
+
+def _plans(count, chapter_tokens=1000):
+    return [ChapterTokenPlan(index=index, chapter_tokens=chapter_tokens, chunks=1, prompt_tokens=chapter_tokens + 100,
+                             completion_tokens=100, rounds=1) for index in range(count)]
+
+
+def _route_all(router, plans):
+    router.start(plans)
+    decisions = []
+    for plan in plans:
+        decisions.append(router.route(plan))
+        router.finish(plan.index)
+    return decisions
+
+
+def test_route_within_token_budget_sends_whole_chapters():
+    plans = _plans(4)
+    decisions = _route_all(ModelRouter(["gpt-4o-mini"], token_budget=4 * 1200), plans)
+    assert [decision.max_input_tokens for decision in decisions] == [None] * 4
+    assert {decision.model for decision in decisions} == {"gpt-4o-mini"}
+
+
+def test_route_over_token_budget_truncates_chapters_evenly():
+    plans = _plans(4)
+    router = ModelRouter(["gpt-4o-mini"], token_budget=2 * 1200)
+    router.start(plans)
+    decision = router.route(plans[0])
+    # Share of 600 tokens, of which the chapter text gets 1000 / 1200
+    assert decision.max_input_tokens == 500
+    assert "token budget" in decision.reason
+
+
+def test_route_stops_sending_once_the_budget_is_exhausted():
+    plans = _plans(4)
+    router = ModelRouter(["gpt-4o-mini"], token_budget=200, min_chapter_tokens=200)
+    decisions = _route_all(router, plans)
+    assert [decision.max_input_tokens for decision in decisions] == [0] * 4
+    assert router.report()["not_sent"] == [0, 1, 2, 3]
+
+
+def test_route_accounts_spent_tokens():
+    plans = _plans(2)
+    router = ModelRouter(["gpt-4o-mini"], token_budget=1800)
+    router.start(plans)
+    first = router.route(plans[0])
+    router.record(first.model, prompt_tokens=1100, completion_tokens=100, seconds=0.1)
+    router.finish(plans[0].index)
+    # 600 tokens left for the last chapter: its text is cut to 1000 * 600 // 1200
+    assert router.route(plans[1]).max_input_tokens == 500
+
+
+def test_route_falls_back_to_a_cheaper_model_over_cost_budget():
+    plans = _plans(4)
+    router = ModelRouter(["gpt-4o", "gpt-4o-mini"], cost_budget=0.005)
+    router.start(plans)
+    assert router.route(plans[0]).model == "gpt-4o-mini"
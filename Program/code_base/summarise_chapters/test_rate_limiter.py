@@ -0,0 +1,44 @@
+import time
+
+from .rate_limiter import RateLimiter
+
+
+def test_acquire_within_budget_does_not_wait():
+    limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=6000)
+    start = time.monotonic()
+    for _ in range(60):
+        limiter.acquire(100)
+    assert time.monotonic() - start < 0.5
+
+
+def test_acquire_waits_for_tokens_to_refill():
+    limiter = RateLimiter(tokens_per_minute=6000)  # 100 tokens per second
+    limiter.acquire(6000)
+    start = time.monotonic()
+    limiter.acquire(50)
+    assert 0.4 <= time.monotonic() - start < 2
+
+
+def test_acquire_waits_for_requests_to_refill():
+    limiter = RateLimiter(requests_per_minute=600)  # One request every 0.1 second
+    for _ in range(600):
+        limiter.acquire()
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+    assert 0.25 <= time.monotonic() - start < 2
+
+
+def test_acquire_clamps_requests_larger_than_the_budget():
+    limiter = RateLimiter(tokens_per_minute=1000)
+    start = time.monotonic()
+    limiter.acquire(10 ** 6)
+    assert time.monotonic() - start < 0.5
+
+
+def test_acquire_without_limits():
+    limiter = RateLimiter()
+    start = time.monotonic()
+    for _ in range(1000):
+        limiter.acquire(10 ** 6)
+    assert time.monotonic() - start < 0.5
@@ -0,0 +1,72 @@
+from .spine_filter import SpineDocument, SpineFilter
+
+
+def _story(position, words=300, title=None, heading=None):
+    text = " ".join(f"word{position}x{number}" for number in range(words))
+    if heading:
+        text = f"{heading}\n{text}"
+    return SpineDocument(position, f"item{position}", f"chapter{position}.xhtml", text, title=title)
+
+
+def test_classify_story_chapter():
+    assert SpineFilter().classify(_story(0)) is None
+
+
+def test_classify_structural_hints():
+    spine_filter = SpineFilter()
+    assert "non-linear" in spine_filter.classify(SpineDocument(0, "a", "a.xhtml", "x" * 2000, linear=False))
+    assert spine_filter.classify(SpineDocument(0, "a", "nav.xhtml", "x" * 2000,
+                                               properties=frozenset({"nav"}))) == "navigation document"
+    assert spine_filter.classify(SpineDocument(0, "a", "a.xhtml", "x" * 2000,
+                                               types=frozenset({"bodymatter", "dedication"}))) == "marked as dedication"
+    assert spine_filter.classify(SpineDocument(0, "a", "a.xhtml", "  \n ")) == "no text"
+
+
+def test_classify_front_matter_heading():
+    assert SpineFilter().classify(_story(0, heading="Acknowledgements")).startswith("front matter heading")
+    assert SpineFilter().classify(_story(0, title="Table of Contents")).startswith("front matter heading")
+
+
+def test_classify_copyright_page():
+    text = ("First published in 2020 by Example Press.\n© The author. All rights reserved.\n"
+            "ISBN 978-0-00-000000-0\n" + "x " * 400)
+    assert SpineFilter().classify(SpineDocument(0, "a", "a.xhtml", text)) == "copyright page"
+
+
+def test_classify_short_items():
+    spine_filter = SpineFilter(min_chars=1000, min_labelled_chars=200)
+    assert spine_filter.classify(_story(0, words=60)).startswith("only ")
+    assert spine_filter.classify(_story(0, words=60, title="The Storm")) is None
+    assert spine_filter.classify(_story(0, words=60, heading="Chapter 4")) is None
+    assert spine_filter.classify(SpineDocument(0, "a", "a.xhtml", "Part One")).startswith("only ")
+
+
+def test_filter_drops_front_matter_and_duplicates(capsys):
+    documents = [SpineDocument(0, "cover", "cover.xhtml", "Cover"), _story(1), _story(2),
+                 SpineDocument(3, "copy", "copy.xhtml", _story(1).text)]
+    spine_filter = SpineFilter()
+    assert [document.position for document in spine_filter.filter(documents)] == [1, 2]
+    assert [item.position for item in spine_filter.skipped] == [0, 3]
+    assert spine_filter.skipped[1].reason.startswith("near-duplicate of spine item 1")
+    # Skipped items are reported through `skipped`, not one log line each
+    assert capsys.readouterr().out == ""
+
+
+def test_filter_keeps_short_labelled_chapters():
+    documents = [_story(position, words=60, title=f"Chapter {position + 1}") for position in range(12)]
+    assert len(list(SpineFilter().filter(documents))) == 12
+
+
+def test_filter_keeps_short_items_when_nothing_else_passes():
+    documents = [SpineDocument(0, "cover", "cover.xhtml", "Cover")] + [_story(position, words=60)
+                                                                       for position in range(1, 5)]
+    spine_filter = SpineFilter()
+    assert [document.position for document in spine_filter.filter(documents)] == [1, 2, 3, 4]
+    assert [item.position for item in spine_filter.skipped] == [0]
+
+
+def test_filter_applies_the_length_rule_when_other_items_pass():
+    documents = [_story(0, words=60), _story(1)]
+    spine_filter = SpineFilter()
+    assert [document.position for document in spine_filter.filter(documents)] == [1]
+    assert [item.position for item in spine_filter.skipped] == [0]
@@ -0,0 +1,24 @@
+import os
+
+from instrumentation import PipelineMetrics
+
+
+def test_export_labels_series_by_worker(tmp_path):
+    metrics = PipelineMetrics()
+    metrics.inc("moviefy_api_requests_total", api="openai", status=200)
+    metrics.observe("moviefy_stage_seconds", 0.2, stage="merge")
+    metrics.export(str(tmp_path))
+
+    text = (tmp_path / f"moviefy_{os.getpid()}.prom").read_text()
+    series = [line for line in text.splitlines() if not line.startswith("#")]
+    assert series and all(f'worker="{os.getpid()}"' in line for line in series)
+    assert f'moviefy_api_requests_total{{worker="{os.getpid()}",api="openai",status="200"}} 1' in series
+
+
+def test_export_removes_files_of_exited_processes(tmp_path):
+    # No process has the first pid; the parent of the test process is alive
+    (tmp_path / f"moviefy_{2 ** 22 + 1}.prom").write_text("")
+    (tmp_path / f"moviefy_{os.getppid()}.prom").write_text("")
+    PipelineMetrics().export(str(tmp_path))
+    assert sorted(path.name for path in tmp_path.glob("*.prom")) == sorted(
+        [f"moviefy_{os.getpid()}.prom", f"moviefy_{os.getppid()}.prom"])
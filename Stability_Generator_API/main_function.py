@@ -1,10 +1,17 @@
+import os
+import sys
+
+# Share the pooled Stability client of the Moviefy app in Program/code_base
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Program", "code_base"))
+from generate_video.stability_client import StabilityClient
+
+#%%
 def generate_image_from_text(api_key, text_prompts, output_directory, book_name):
-    import requests
     import os
     import base64
     import time
     
-    url = "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
+    url = "/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
 
     body = {
         "steps": 40,
@@ -20,10 +27,9 @@ def generate_image_from_text(api_key, text_prompts, output_directory, book_name)
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}",
     }
 
-    response = requests.post(url, headers=headers, json=body)
+    response = StabilityClient.for_key(api_key).post(url, headers=headers, json=body)
 
     if response.status_code != 200:
         raise Exception("Non-200 response: " + str(response.text))
@@ -54,13 +60,7 @@ def resize_image(input_path, width = 768 , height = 768):
     return resized_path
 #%%
 def get_generation_id(api_key, image_path):
-    import requests
-
-    url = "https://api.stability.ai/v2alpha/generation/image-to-video"
-
-    headers = {"authorization": f"Bearer {api_key}"}
-
-    files = {"image": open(image_path, "rb")}
+    url = "/v2alpha/generation/image-to-video"
 
     data = {
         "seed": 0,
@@ -68,7 +68,8 @@ def get_generation_id(api_key, image_path):
         "motion_bucket_id": 127
     }
 
-    response = requests.post(url, headers=headers, files=files, data=data)
+    with open(image_path, "rb") as image_file:
+        response = StabilityClient.for_key(api_key).post(url, files={"image": image_file}, data=data)
 
     if response.status_code == 200:
         generation_id = response.json().get('id')
@@ -80,22 +81,21 @@ def get_generation_id(api_key, image_path):
 #%%
 def download_generated_video(api_key, generation_id, output_path):
 
-    import requests
     from time import sleep
-    url = f"https://api.stability.ai/v2alpha/generation/image-to-video/result/{generation_id}"
+    client = StabilityClient.for_key(api_key)
+    url = f"/v2alpha/generation/image-to-video/result/{generation_id}"
 
     headers = {
         'Accept': "video/*",  # Use 'application/json' to receive base64 encoded JSON
-        'authorization': f"Bearer {api_key}"
     }
 
-    response = requests.get(url, headers=headers)
+    response = client.get(url, headers=headers)
     print("Response status:", response.status_code)
     while response.status_code !=200:
         if response.status_code == 202:
             print("Generation in-progress, try again in 10 seconds.")
             sleep(5)
-            response = requests.get(url, headers=headers)
+            response = client.get(url, headers=headers)
 
     print("Generation complete!")
     with open(output_path, 'wb') as file: